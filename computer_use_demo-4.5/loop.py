@@ -31,6 +31,7 @@ from anthropic.types.beta import (
 
 from .tools import (
     TOOL_GROUPS_BY_VERSION,
+    BaseComputerTool,
     ToolCollection,
     ToolResult,
     ToolVersion,
@@ -84,107 +85,140 @@ async def sampling_loop(
     tool_version: ToolVersion,
     thinking_budget: int | None = None,
     token_efficient_tools_beta: bool = False,
+    display_num: int | None = None,
 ):
     """
     Agentic sampling loop for the assistant/tool interaction of computer use.
+
+    Pass `display_num` to drive a specific X display, such as one leased from a
+    DisplayPool, instead of the one named by DISPLAY_NUM.
     """
     tool_group = TOOL_GROUPS_BY_VERSION[tool_version]
-    tool_collection = ToolCollection(*(ToolCls() for ToolCls in tool_group.tools))
+    tool_collection = ToolCollection(
+        *(
+            ToolCls(display_num=display_num)
+            if issubclass(ToolCls, BaseComputerTool)
+            else ToolCls()
+            for ToolCls in tool_group.tools
+        )
+    )
+    system_prompt = SYSTEM_PROMPT
+    if display_num is not None:
+        system_prompt = system_prompt.replace("DISPLAY=:1", f"DISPLAY=:{display_num}")
     system = BetaTextBlockParam(
         type="text",
-        text=f"{SYSTEM_PROMPT}{' ' + system_prompt_suffix if system_prompt_suffix else ''}",
+        text=f"{system_prompt}{' ' + system_prompt_suffix if system_prompt_suffix else ''}",
     )
 
-    while True:
-        enable_prompt_caching = False
-        betas = [tool_group.beta_flag] if tool_group.beta_flag else []
-        if token_efficient_tools_beta:
-            betas.append("token-efficient-tools-2025-02-19")
-        image_truncation_threshold = only_n_most_recent_images or 0
-        if provider == APIProvider.ANTHROPIC:
-            client = Anthropic(api_key=api_key, max_retries=4)
-            enable_prompt_caching = True
-        elif provider == APIProvider.VERTEX:
-            client = AnthropicVertex()
-        elif provider == APIProvider.BEDROCK:
-            client = AnthropicBedrock()
-
-        if enable_prompt_caching:
-            betas.append(PROMPT_CACHING_BETA_FLAG)
-            _inject_prompt_caching(messages)
-            # Because cached reads are 10% of the price, we don't think it's
-            # ever sensible to break the cache by truncating images
-            only_n_most_recent_images = 0
-            # Use type ignore to bypass TypedDict check until SDK types are updated
-            system["cache_control"] = {"type": "ephemeral"}  # type: ignore
-
-        if only_n_most_recent_images:
-            _maybe_filter_to_n_most_recent_images(
-                messages,
-                only_n_most_recent_images,
-                min_removal_threshold=image_truncation_threshold,
-            )
-        extra_body = {}
-        if thinking_budget:
-            # Ensure we only send the required fields for thinking
-            extra_body = {
-                "thinking": {"type": "enabled", "budget_tokens": thinking_budget}
-            }
-
-        # Call the API
-        # we use raw_response to provide debug information to streamlit. Your
-        # implementation may be able call the SDK directly with:
-        # `response = client.messages.create(...)` instead.
-        try:
-            raw_response = client.beta.messages.with_raw_response.create(
-                max_tokens=max_tokens,
-                messages=messages,
-                model=model,
-                system=[system],
-                tools=tool_collection.to_params(),
-                betas=betas,
-                extra_body=extra_body,
-            )
-        except (APIStatusError, APIResponseValidationError) as e:
-            api_response_callback(e.request, e.response, e)
-            return messages
-        except APIError as e:
-            api_response_callback(e.request, e.body, e)
-            return messages
-
-        api_response_callback(
-            raw_response.http_response.request, raw_response.http_response, None
-        )
-
-        response = raw_response.parse()
-
-        response_params = _response_to_params(response)
-        messages.append(
-            {
-                "role": "assistant",
-                "content": response_params,
-            }
-        )
+    try:
+        while True:
+            enable_prompt_caching = False
+            betas = [tool_group.beta_flag] if tool_group.beta_flag else []
+            if token_efficient_tools_beta:
+                betas.append("token-efficient-tools-2025-02-19")
+            image_truncation_threshold = only_n_most_recent_images or 0
+            if provider == APIProvider.ANTHROPIC:
+                client = Anthropic(api_key=api_key, max_retries=4)
+                enable_prompt_caching = True
+            elif provider == APIProvider.VERTEX:
+                client = AnthropicVertex()
+            elif provider == APIProvider.BEDROCK:
+                client = AnthropicBedrock()
+
+            if enable_prompt_caching:
+                betas.append(PROMPT_CACHING_BETA_FLAG)
+                _inject_prompt_caching(messages)
+                # Because cached reads are 10% of the price, we don't think it's
+                # ever sensible to break the cache by truncating images
+                only_n_most_recent_images = 0
+                # Use type ignore to bypass TypedDict check until SDK types are updated
+                system["cache_control"] = {"type": "ephemeral"}  # type: ignore
 
-        tool_result_content: list[BetaToolResultBlockParam] = []
-        for content_block in response_params:
-            output_callback(content_block)
-            if isinstance(content_block, dict) and content_block.get("type") == "tool_use":
-                # Type narrowing for tool use blocks
-                tool_use_block = cast(BetaToolUseBlockParam, content_block)
-                result = await tool_collection.run(
-                    name=tool_use_block["name"],
-                    tool_input=cast(dict[str, Any], tool_use_block.get("input", {})),
+            if only_n_most_recent_images:
+                _maybe_filter_to_n_most_recent_images(
+                    messages,
+                    only_n_most_recent_images,
+                    min_removal_threshold=image_truncation_threshold,
                 )
-                tool_result_content.append(
-                    _make_api_tool_result(result, tool_use_block["id"])
+            extra_body = {}
+            if thinking_budget:
+                # Ensure we only send the required fields for thinking
+                extra_body = {
+                    "thinking": {"type": "enabled", "budget_tokens": thinking_budget}
+                }
+
+            # Call the API
+            # we use raw_response to provide debug information to streamlit. Your
+            # implementation may be able call the SDK directly with:
+            # `response = client.messages.create(...)` instead.
+            try:
+                raw_response = client.beta.messages.with_raw_response.create(
+                    max_tokens=max_tokens,
+                    messages=messages,
+                    model=model,
+                    system=[system],
+                    tools=tool_collection.to_params(),
+                    betas=betas,
+                    extra_body=extra_body,
                 )
-                tool_output_callback(result, tool_use_block["id"])
+            except (APIStatusError, APIResponseValidationError) as e:
+                api_response_callback(e.request, e.response, e)
+                return messages
+            except APIError as e:
+                api_response_callback(e.request, e.body, e)
+                return messages
+
+            api_response_callback(
+                raw_response.http_response.request, raw_response.http_response, None
+            )
 
-        if not tool_result_content:
-            return messages
+            response = raw_response.parse()
 
-        messages.append({"content": tool_result_content, "role": "user"})
+            response_params = _response_to_params(response)
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": response_params,
+                }
+            )
+
+            tool_use_blocks = [
+                cast(BetaToolUseBlockParam, content_block)
+                for content_block in response_params
+                if isinstance(content_block, dict)
+                and content_block.get("type") == "tool_use"
+            ]
+            tool_result_content: list[BetaToolResultBlockParam] = []
+            for content_block in response_params:
+                output_callback(content_block)
+                if (
+                    isinstance(content_block, dict)
+                    and content_block.get("type") == "tool_use"
+                ):
+                    # Type narrowing for tool use blocks
+                    tool_use_block = cast(BetaToolUseBlockParam, content_block)
+                    next_blocks = tool_use_blocks[len(tool_result_content) + 1 :]
+                    result = await tool_collection.run(
+                        name=tool_use_block["name"],
+                        tool_input=cast(
+                            dict[str, Any], tool_use_block.get("input", {})
+                        ),
+                        # in a run of computer actions, only the last one needs to show
+                        # the screen
+                        defer_screenshot=tool_use_block["name"] == "computer"
+                        and _shows_screen(next_blocks[0] if next_blocks else None),
+                    )
+                    tool_result_content.append(
+                        _make_api_tool_result(result, tool_use_block["id"])
+                    )
+                    tool_output_callback(result, tool_use_block["id"])
+
+            if not tool_result_content:
+                return messages
+
+            messages.append({"content": tool_result_content, "role": "user"})
+    finally:
+        tool_collection.close()
 
 
 def _maybe_filter_to_n_most_recent_images(
@@ -285,6 +319,14 @@ def _inject_prompt_caching(
                 break
 
 
+def _shows_screen(tool_use_block: BetaToolUseBlockParam | None) -> bool:
+    """Whether a tool use is a computer action that ends with a screenshot."""
+    if tool_use_block is None or tool_use_block["name"] != "computer":
+        return False
+    tool_input = cast(dict[str, Any], tool_use_block.get("input", {}))
+    return tool_input.get("action") != "cursor_position"
+
+
 def _make_api_tool_result(
     result: ToolResult, tool_use_id: str
 ) -> BetaToolResultBlockParam:
@@ -19,6 +19,9 @@ class BaseAnthropicTool(metaclass=ABCMeta):
     ) -> BetaToolUnionParam:
         raise NotImplementedError
 
+    def close(self):
+        """Release what the tool holds open, such as connections and threads."""
+
 
 @dataclass(kw_only=True, frozen=True)
 class ToolResult:
@@ -0,0 +1,96 @@
+"""In-process screen capture for X11 displays."""
+
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from typing import Any
+
+
+class X11Capture:
+    """
+    Grabs the framebuffer of an X display over one persistent connection, using
+    MIT-SHM when the server supports it (via `mss`), then resizes and PNG-encodes
+    the frame in memory. The connection lives on a dedicated worker thread, since
+    Xlib/XCB handles must not be shared between threads.
+    """
+
+    def __init__(self, display_num: int | None = None):
+        self._display = f":{display_num}" if display_num is not None else None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"x11-capture{self._display or ''}"
+        )
+        self._sct: Any = None
+
+    @staticmethod
+    def available() -> bool:
+        """Whether the optional `mss` and `Pillow` dependencies are installed."""
+        return find_spec("mss") is not None and find_spec("PIL") is not None
+
+    @property
+    def capture_errors(self) -> tuple[type[Exception], ...]:
+        """What `grab()` raises when the display cannot be captured right now."""
+        from mss.exception import ScreenShotError
+
+        # RuntimeError: the worker thread has been shut down by `close()`
+        return (OSError, RuntimeError, ScreenShotError)
+
+    async def screenshot_png(self, size: tuple[int, int] | None = None) -> bytes:
+        """Capture the whole display, optionally resized to `size`, as PNG bytes."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._screenshot_png, size
+        )
+
+    async def thumbnail(self, width: int = 160) -> bytes:
+        """A `thumbnail()` of a new capture."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, lambda: thumbnail(self._grab(), width)
+        )
+
+    def grab(self) -> Any:
+        """Capture the whole display as a PIL image, blocking the calling thread."""
+        return self._executor.submit(self._grab).result()
+
+    def close(self):
+        def close_connection():
+            if self._sct is not None:
+                self._sct.close()
+                self._sct = None
+
+        self._executor.submit(close_connection)
+        self._executor.shutdown(wait=False)
+
+    def _grab(self):
+        import mss
+        from PIL import Image
+
+        if self._sct is None:
+            self._sct = mss.mss(display=self._display)
+        shot = self._sct.grab(self._sct.monitors[0])
+        return Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+
+    def _screenshot_png(self, size: tuple[int, int] | None) -> bytes:
+        return encode_png(self._grab(), size)
+
+
+def encode_png(image: Any, size: tuple[int, int] | None = None) -> bytes:
+    """PNG-encode a PIL image, resized to `size` if given."""
+    if size is not None and image.size != size:
+        image = image.resize(size)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def thumbnail(image: Any, width: int = 160) -> bytes:
+    """
+    A small greyscale version of a PIL image, quantized to 16 levels, for cheaply
+    telling whether the screen changed between two frames.
+    """
+    from PIL import Image
+
+    image = image.convert("L")
+    height = max(1, width * image.height // image.width)
+    image = image.resize((width, height), Image.Resampling.BOX)
+    # drop the low bits so antialiasing noise does not count as a change
+    return image.point(lambda value: value & 0xF0).tobytes()
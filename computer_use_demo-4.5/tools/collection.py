@@ -24,10 +24,27 @@ class ToolCollection:
     ) -> list[BetaToolUnionParam]:
         return [tool.to_params() for tool in self.tools]
 
-    async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
+    def close(self):
+        """Close every tool, at the end of the session."""
+        for tool in self.tools:
+            tool.close()
+
+    async def run(
+        self,
+        *,
+        name: str,
+        tool_input: dict[str, Any],
+        defer_screenshot: bool = False,
+    ) -> ToolResult:
+        """
+        `defer_screenshot` asks the tool to skip its post-action screenshot, because
+        another action follows; tools that never take one ignore it.
+        """
         tool = self.tool_map.get(name)
         if not tool:
             return ToolFailure(error=f"Tool {name} is invalid")
+        if defer_screenshot:
+            tool_input = {**tool_input, "defer_screenshot": True}
         try:
             return await tool(**tool_input)
         except ToolError as e:
@@ -3,6 +3,8 @@ import base64
 import os
 import shlex
 import shutil
+from collections.abc import Awaitable
+from contextlib import suppress
 from enum import StrEnum
 from pathlib import Path
 from typing import Literal, TypedDict, cast, get_args
@@ -11,10 +13,22 @@ from uuid import uuid4
 from anthropic.types.beta import BetaToolComputerUse20241022Param, BetaToolUnionParam
 
 from .base import BaseAnthropicTool, ToolError, ToolResult
+from .capture import X11Capture, encode_png, thumbnail
+from .clipboard import Clipboard
+from .frame_grabber import Frame, FrameGrabber
 from .run import run
+from .settle import SettlePolicy, wait_for_settle
+from .xtest import XTestInput
 
 OUTPUT_DIR = "/tmp/outputs"
 
+# only used when in-process capture is unavailable; resolved once at import
+SCREENSHOT_COMMAND = "gnome-screenshot" if shutil.which("gnome-screenshot") else "scrot"
+
+DEFERRED_SCREENSHOT_TEXT = (
+    "Action performed. No screenshot was taken because more actions follow."
+)
+
 TYPING_DELAY_MS = 12
 TYPING_GROUP_SIZE = 50
 
@@ -66,6 +80,14 @@ CLICK_BUTTONS = {
     "double_click": "--repeat 2 --delay 10 1",
     "triple_click": "--repeat 3 --delay 10 1",
 }
+# (button, repeat) of the same clicks for XTestInput
+XTEST_CLICKS = {
+    "left_click": (1, 1),
+    "right_click": (3, 1),
+    "middle_click": (2, 1),
+    "double_click": (1, 2),
+    "triple_click": (1, 3),
+}
 
 
 class ScalingSource(StrEnum):
@@ -94,8 +116,24 @@ class BaseComputerTool:
     height: int
     display_num: int | None
 
+    # fixed delay before the post-action screenshot when the screen cannot be probed
     _screenshot_delay = 2.0
+    # wait for the screen to stop changing instead, capped at the same delay
+    _settle: SettlePolicy | None = SettlePolicy(timeout=_screenshot_delay)
+    # the same between chained actions, whose screenshot is deferred to the last one
+    _chained_delay = 0.1
+    _chained_settle: SettlePolicy | None = SettlePolicy(stable_for=0.05, timeout=0.25)
     _scaling_enabled = True
+    # set to capture in the background at this rate; screenshots and settle probes
+    # then reuse recent frames instead of capturing their own
+    _frame_grabber_fps: float | None = None
+    # type text at least this long by pasting it through the clipboard (None = never);
+    # off by default since terminals ignore ctrl+v
+    _paste_min_length: int | None = None
+    # how long the application gets to read the clipboard before it is restored
+    _paste_restore_delay = 0.2
+    # e.g. "ctrl+shift+v" for terminal emulators
+    _paste_keys = "ctrl+v"
 
     @property
     def options(self) -> ComputerToolOptions:
@@ -108,20 +146,51 @@ class BaseComputerTool:
             "display_number": self.display_num,
         }
 
-    def __init__(self):
+    def __init__(self, display_num: int | None = None):
+        """`display_num` overrides DISPLAY_NUM, e.g. for a leased DisplayPool display."""
         super().__init__()
 
         self.width = int(os.getenv("WIDTH") or 0)
         self.height = int(os.getenv("HEIGHT") or 0)
         assert self.width and self.height, "WIDTH, HEIGHT must be set"
-        if (display_num := os.getenv("DISPLAY_NUM")) is not None:
-            self.display_num = int(display_num)
+        if (
+            display_num is None
+            and (env_display_num := os.getenv("DISPLAY_NUM")) is not None
+        ):
+            display_num = int(env_display_num)
+        if display_num is not None:
+            self.display_num = display_num
             self._display_prefix = f"DISPLAY=:{self.display_num} "
         else:
             self.display_num = None
             self._display_prefix = ""
 
         self.xdotool = f"{self._display_prefix}xdotool"
+        # inject input over a persistent X connection; xdotool is the fallback
+        self._xinput = XTestInput(self.display_num) if XTestInput.available() else None
+        self._clipboard = Clipboard(self.display_num)
+        self._capture = X11Capture(self.display_num) if X11Capture.available() else None
+        self._grabber = (
+            FrameGrabber(
+                self._capture.grab,
+                fps=self._frame_grabber_fps,
+                capture_errors=self._capture.capture_errors,
+            )
+            if self._capture and self._frame_grabber_fps
+            else None
+        )
+        # digest of the last grabbed frame sent as a screenshot, and its base64 PNG
+        self._last_grabbed: tuple[bytes, str] | None = None
+        self._last_probed: Frame | None = None
+
+    def close(self):
+        """Stop the frame grabber and close the X connections."""
+        if self._grabber is not None:
+            self._grabber.close()
+        if self._capture is not None:
+            self._capture.close()
+        if self._xinput is not None:
+            self._xinput.close()
 
     async def __call__(
         self,
@@ -129,8 +198,14 @@ class BaseComputerTool:
         action: Action_20241022,
         text: str | None = None,
         coordinate: tuple[int, int] | None = None,
+        defer_screenshot: bool = False,
         **kwargs,
     ):
+        """
+        With `defer_screenshot`, input actions skip the post-action screenshot and
+        only briefly wait for the screen to settle, e.g. because the caller runs
+        another action right after.
+        """
         if action in ("mouse_move", "left_click_drag"):
             if coordinate is None:
                 raise ToolError(f"coordinate is required for {action}")
@@ -139,15 +214,28 @@ class BaseComputerTool:
 
             x, y = self.validate_and_get_coordinates(coordinate)
 
+            if self._xinput:
+                if action == "mouse_move":
+                    return await self.input(
+                        self._xinput.move(x, y), defer_screenshot=defer_screenshot
+                    )
+                return await self.input(
+                    self._xinput.drag(x, y), defer_screenshot=defer_screenshot
+                )
+
             if action == "mouse_move":
                 command_parts = [self.xdotool, f"mousemove --sync {x} {y}"]
-                return await self.shell(" ".join(command_parts))
+                return await self.shell(
+                    " ".join(command_parts), defer_screenshot=defer_screenshot
+                )
             elif action == "left_click_drag":
                 command_parts = [
                     self.xdotool,
                     f"mousedown 1 mousemove --sync {x} {y} mouseup 1",
                 ]
-                return await self.shell(" ".join(command_parts))
+                return await self.shell(
+                    " ".join(command_parts), defer_screenshot=defer_screenshot
+                )
 
         if action in ("key", "type"):
             if text is None:
@@ -157,9 +245,34 @@ class BaseComputerTool:
             if not isinstance(text, str):
                 raise ToolError(output=f"{text} must be a string")
 
+            if (
+                action == "type"
+                and self._paste_min_length is not None
+                and len(text) >= self._paste_min_length
+                # control characters are typed as keys, e.g. \n as Return, which
+                # pasting them would not do
+                and text.isprintable()
+                and (result := await self._paste(text)) is not None
+            ):
+                return await self._after_input(
+                    result, take_screenshot=True, defer_screenshot=defer_screenshot
+                )
+
+            if self._xinput:
+                if action == "key":
+                    return await self.input(
+                        self._xinput.key(text), defer_screenshot=defer_screenshot
+                    )
+                return await self.input(
+                    self._xinput.type(text, TYPING_DELAY_MS),
+                    defer_screenshot=defer_screenshot,
+                )
+
             if action == "key":
                 command_parts = [self.xdotool, f"key -- {text}"]
-                return await self.shell(" ".join(command_parts))
+                return await self.shell(
+                    " ".join(command_parts), defer_screenshot=defer_screenshot
+                )
             elif action == "type":
                 results: list[ToolResult] = []
                 for chunk in chunks(text, TYPING_GROUP_SIZE):
@@ -170,11 +283,13 @@ class BaseComputerTool:
                     results.append(
                         await self.shell(" ".join(command_parts), take_screenshot=False)
                     )
-                screenshot_base64 = (await self.screenshot()).base64_image
-                return ToolResult(
-                    output="".join(result.output or "" for result in results),
-                    error="".join(result.error or "" for result in results),
-                    base64_image=screenshot_base64,
+                return await self._after_input(
+                    ToolResult(
+                        output="".join(result.output or "" for result in results),
+                        error="".join(result.error or "" for result in results),
+                    ),
+                    take_screenshot=True,
+                    defer_screenshot=defer_screenshot,
                 )
 
         if action in (
@@ -192,6 +307,11 @@ class BaseComputerTool:
 
             if action == "screenshot":
                 return await self.screenshot()
+            elif action == "cursor_position" and self._xinput:
+                x, y = self.scale_coordinates(
+                    ScalingSource.COMPUTER, *await self._xinput.position()
+                )
+                return ToolResult(output=f"X={x},Y={y}")
             elif action == "cursor_position":
                 command_parts = [self.xdotool, "getmouselocation --shell"]
                 result = await self.shell(
@@ -205,9 +325,17 @@ class BaseComputerTool:
                     int(output.split("Y=")[1].split("\n")[0]),
                 )
                 return result.replace(output=f"X={x},Y={y}")
+            elif self._xinput:
+                button, repeat = XTEST_CLICKS[action]
+                return await self.input(
+                    self._xinput.click(button, repeat=repeat),
+                    defer_screenshot=defer_screenshot,
+                )
             else:
                 command_parts = [self.xdotool, f"click {CLICK_BUTTONS[action]}"]
-                return await self.shell(" ".join(command_parts))
+                return await self.shell(
+                    " ".join(command_parts), defer_screenshot=defer_screenshot
+                )
 
         raise ToolError(f"Invalid action: {action}")
 
@@ -221,43 +349,143 @@ class BaseComputerTool:
 
     async def screenshot(self):
         """Take a screenshot of the current screen and return the base64 encoded image."""
+        size = None
+        if self._scaling_enabled:
+            size = self.scale_coordinates(
+                ScalingSource.COMPUTER, self.width, self.height
+            )
+        if self._capture:
+            grabbed = await self._grabber.fresh_frame() if self._grabber else None
+            if grabbed is None:
+                return ToolResult(
+                    base64_image=base64.b64encode(
+                        await self._capture.screenshot_png(size)
+                    ).decode()
+                )
+            # only encode when the screen changed since the last screenshot
+            if self._last_grabbed is None or self._last_grabbed[0] != grabbed.digest:
+                png = await asyncio.to_thread(encode_png, grabbed.image, size)
+                self._last_grabbed = (grabbed.digest, base64.b64encode(png).decode())
+            return ToolResult(base64_image=self._last_grabbed[1])
+
         output_dir = Path(OUTPUT_DIR)
         output_dir.mkdir(parents=True, exist_ok=True)
         path = output_dir / f"screenshot_{uuid4().hex}.png"
 
-        # Try gnome-screenshot first
-        if shutil.which("gnome-screenshot"):
+        if SCREENSHOT_COMMAND == "gnome-screenshot":
             screenshot_cmd = f"{self._display_prefix}gnome-screenshot -f {path} -p"
         else:
             # Fall back to scrot if gnome-screenshot isn't available
             screenshot_cmd = f"{self._display_prefix}scrot -p {path}"
 
         result = await self.shell(screenshot_cmd, take_screenshot=False)
-        if self._scaling_enabled:
-            x, y = self.scale_coordinates(
-                ScalingSource.COMPUTER, self.width, self.height
-            )
+        if size is not None:
+            x, y = size
             await self.shell(
                 f"convert {path} -resize {x}x{y}! {path}", take_screenshot=False
             )
 
         if path.exists():
-            return result.replace(
-                base64_image=base64.b64encode(path.read_bytes()).decode()
-            )
+            image_bytes = path.read_bytes()
+            path.unlink()
+            return result.replace(base64_image=base64.b64encode(image_bytes).decode())
         raise ToolError(f"Failed to take screenshot: {result.error}")
 
-    async def shell(self, command: str, take_screenshot=True) -> ToolResult:
+    async def shell(
+        self, command: str, take_screenshot=True, defer_screenshot=False
+    ) -> ToolResult:
         """Run a shell command and return the output, error, and optionally a screenshot."""
         _, stdout, stderr = await run(command)
-        base64_image = None
+        return await self._after_input(
+            ToolResult(output=stdout, error=stderr), take_screenshot, defer_screenshot
+        )
 
-        if take_screenshot:
-            # delay to let things settle before taking a screenshot
-            await asyncio.sleep(self._screenshot_delay)
-            base64_image = (await self.screenshot()).base64_image
+    async def input(
+        self, action: Awaitable, take_screenshot=True, defer_screenshot=False
+    ) -> ToolResult:
+        """Await an XTestInput action and return an optional screenshot."""
+        try:
+            await action
+        except (ValueError, RuntimeError) as e:
+            raise ToolError(str(e)) from None
+        finally:
+            # part of the input may have been sent before a failure
+            if self._grabber:
+                self._grabber.mark_stale()
+        return await self._after_input(ToolResult(), take_screenshot, defer_screenshot)
+
+    async def _after_input(
+        self, result: ToolResult, take_screenshot: bool, defer_screenshot=False
+    ):
+        if self._grabber:
+            self._grabber.mark_stale()
+        if not take_screenshot:
+            return result
+        # let things settle before taking a screenshot, or at least take effect
+        # before the next of a run of chained actions
+        settle = self._chained_settle if defer_screenshot else self._settle
+        if self._capture and settle:
+            await wait_for_settle(self._settle_probe, settle)
+        else:
+            await asyncio.sleep(
+                self._chained_delay if defer_screenshot else self._screenshot_delay
+            )
+        return await self._screenshot_after(result, defer_screenshot)
+
+    async def _screenshot_after(
+        self, result: ToolResult, defer_screenshot=False
+    ) -> ToolResult:
+        """Attach a screenshot to the result of an action, unless it is deferred."""
+        if defer_screenshot:
+            return result.replace(output=result.output or DEFERRED_SCREENSHOT_TEXT)
+        return result.replace(base64_image=(await self.screenshot()).base64_image)
+
+    async def _paste(self, text: str) -> ToolResult | None:
+        """
+        Type `text` in constant time by pasting it, then restore the previous
+        clipboard. Returns None, having done nothing, if the clipboard is unusable
+        or holds something other than text, which restoring it would lose.
+        """
+        if not self._clipboard.available():
+            return None
+        try:
+            if not await self._clipboard.holds_only_text():
+                return None
+            previous = await self._clipboard.read()
+            await self._clipboard.write(text.encode())
+        except RuntimeError:
+            return None
+        # applications may ignore the paste keys, so check that something happened
+        before = await self._settle_probe() if self._capture else None
+        try:
+            if self._xinput:
+                await self.input(
+                    self._xinput.key(self._paste_keys), take_screenshot=False
+                )
+            else:
+                await self.shell(
+                    f"{self.xdotool} key -- {self._paste_keys}", take_screenshot=False
+                )
+            # the application reads the clipboard asynchronously
+            await asyncio.sleep(self._paste_restore_delay)
+        finally:
+            if previous is not None:
+                with suppress(RuntimeError):
+                    await self._clipboard.write(previous)
+        if before is not None and await self._settle_probe() == before:
+            return ToolResult(
+                error=f"Pasted the text with {self._paste_keys}, but the screen did "
+                "not change, so it may not have been typed."
+            )
+        return ToolResult()
 
-        return ToolResult(output=stdout, error=stderr, base64_image=base64_image)
+    async def _settle_probe(self) -> bytes:
+        if self._grabber and (
+            frame := await self._grabber.fresh_frame(newer_than=self._last_probed)
+        ):
+            self._last_probed = frame
+            return await asyncio.to_thread(thumbnail, frame.image)
+        return await self._capture.thumbnail()
 
     def scale_coordinates(self, source: ScalingSource, x: int, y: int):
         """Scale coordinates to a target maximum resolution."""
@@ -311,16 +539,24 @@ class ComputerTool20250124(BaseComputerTool, BaseAnthropicTool):
         scroll_amount: int | None = None,
         duration: int | float | None = None,
         key: str | None = None,
+        defer_screenshot: bool = False,
         **kwargs,
     ):
         if action in ("left_mouse_down", "left_mouse_up"):
             if coordinate is not None:
                 raise ToolError(f"coordinate is not accepted for {action=}.")
+            if self._xinput:
+                return await self.input(
+                    self._xinput.button(1, pressed=action == "left_mouse_down"),
+                    defer_screenshot=defer_screenshot,
+                )
             command_parts = [
                 self.xdotool,
                 f"{'mousedown' if action == 'left_mouse_down' else 'mouseup'} 1",
             ]
-            return await self.shell(" ".join(command_parts))
+            return await self.shell(
+                " ".join(command_parts), defer_screenshot=defer_screenshot
+            )
         if action == "scroll":
             if scroll_direction is None or scroll_direction not in get_args(
                 ScrollDirection
@@ -331,8 +567,9 @@ class ComputerTool20250124(BaseComputerTool, BaseAnthropicTool):
             if not isinstance(scroll_amount, int) or scroll_amount < 0:
                 raise ToolError(f"{scroll_amount=} must be a non-negative int")
             mouse_move_part = ""
+            at = None
             if coordinate is not None:
-                x, y = self.validate_and_get_coordinates(coordinate)
+                at = x, y = self.validate_and_get_coordinates(coordinate)
                 mouse_move_part = f"mousemove --sync {x} {y}"
             scroll_button = {
                 "up": 4,
@@ -340,6 +577,13 @@ class ComputerTool20250124(BaseComputerTool, BaseAnthropicTool):
                 "left": 6,
                 "right": 7,
             }[scroll_direction]
+            if self._xinput:
+                return await self.input(
+                    self._xinput.click(
+                        scroll_button, at=at, modifiers=text, repeat=scroll_amount
+                    ),
+                    defer_screenshot=defer_screenshot,
+                )
 
             command_parts = [self.xdotool, mouse_move_part]
             if text:
@@ -348,7 +592,9 @@ class ComputerTool20250124(BaseComputerTool, BaseAnthropicTool):
             if text:
                 command_parts.append(f"keyup {text}")
 
-            return await self.shell(" ".join(command_parts))
+            return await self.shell(
+                " ".join(command_parts), defer_screenshot=defer_screenshot
+            )
 
         if action in ("hold_key", "wait"):
             if duration is None or not isinstance(duration, (int, float)):
@@ -361,6 +607,11 @@ class ComputerTool20250124(BaseComputerTool, BaseAnthropicTool):
             if action == "hold_key":
                 if text is None:
                     raise ToolError(f"text is required for {action}")
+                if self._xinput:
+                    return await self.input(
+                        self._hold_key(text, duration),
+                        defer_screenshot=defer_screenshot,
+                    )
                 escaped_keys = shlex.quote(text)
                 command_parts = [
                     self.xdotool,
@@ -368,11 +619,15 @@ class ComputerTool20250124(BaseComputerTool, BaseAnthropicTool):
                     f"sleep {duration}",
                     f"keyup {escaped_keys}",
                 ]
-                return await self.shell(" ".join(command_parts))
+                return await self.shell(
+                    " ".join(command_parts), defer_screenshot=defer_screenshot
+                )
 
             if action == "wait":
                 await asyncio.sleep(duration)
-                return await self.screenshot()
+                return await self._screenshot_after(
+                    ToolResult(), defer_screenshot=defer_screenshot
+                )
 
         if action in (
             "left_click",
@@ -384,9 +639,16 @@ class ComputerTool20250124(BaseComputerTool, BaseAnthropicTool):
             if text is not None:
                 raise ToolError(f"text is not accepted for {action}")
             mouse_move_part = ""
+            at = None
             if coordinate is not None:
-                x, y = self.validate_and_get_coordinates(coordinate)
+                at = x, y = self.validate_and_get_coordinates(coordinate)
                 mouse_move_part = f"mousemove --sync {x} {y}"
+            if self._xinput:
+                button, repeat = XTEST_CLICKS[action]
+                return await self.input(
+                    self._xinput.click(button, at=at, modifiers=key, repeat=repeat),
+                    defer_screenshot=defer_screenshot,
+                )
 
             command_parts = [self.xdotool, mouse_move_part]
             if key:
@@ -395,8 +657,23 @@ class ComputerTool20250124(BaseComputerTool, BaseAnthropicTool):
             if key:
                 command_parts.append(f"keyup {key}")
 
-            return await self.shell(" ".join(command_parts))
+            return await self.shell(
+                " ".join(command_parts), defer_screenshot=defer_screenshot
+            )
 
         return await super().__call__(
-            action=action, text=text, coordinate=coordinate, key=key, **kwargs
+            action=action,
+            text=text,
+            coordinate=coordinate,
+            key=key,
+            defer_screenshot=defer_screenshot,
+            **kwargs,
         )
+
+    async def _hold_key(self, keys: str, duration: float):
+        assert self._xinput
+        await self._xinput.key_down(keys)
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            await self._xinput.key_up(keys)
@@ -0,0 +1,139 @@
+"""A pool of pre-launched Xvfb displays that can be leased to concurrent sessions."""
+
+import asyncio
+import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+X11_SOCKET_DIR = Path("/tmp/.X11-unix")
+X11_LOCK_DIR = Path("/tmp")
+
+
+class DisplayPool:
+    """
+    Launches `size` Xvfb servers on consecutive display numbers and hands them out
+    one session at a time. Returning a display restarts its X server, which closes
+    every client the previous session left behind, so each lease starts clean. A
+    display whose X server fails to restart is dropped from the pool and replaced
+    by a fresh one on the next free display number.
+    """
+
+    _startup_timeout: float = 10.0  # seconds
+    _poll_interval: float = 0.05  # seconds
+
+    def __init__(
+        self,
+        size: int,
+        *,
+        first_display: int = 1,
+        width: int | None = None,
+        height: int | None = None,
+        session_command: str | None = None,
+    ):
+        """
+        `session_command` (e.g. a window manager) is started on every display after
+        its X server comes up, with DISPLAY set accordingly.
+        """
+        self.displays = list(range(first_display, first_display + size))
+        self._next_display = first_display + size
+        self.width = width or int(os.getenv("WIDTH") or 0)
+        self.height = height or int(os.getenv("HEIGHT") or 0)
+        assert self.width and self.height, "WIDTH, HEIGHT must be set"
+        self.session_command = session_command
+        self._processes: dict[int, list[asyncio.subprocess.Process]] = {}
+        self._available: asyncio.Queue[int] = asyncio.Queue()
+
+    async def start(self):
+        await asyncio.gather(*(self._launch(display) for display in self.displays))
+        for display in self.displays:
+            self._available.put_nowait(display)
+
+    async def close(self):
+        await asyncio.gather(*(self._terminate(display) for display in self.displays))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[int]:
+        """Wait for a free display and yield its number for the duration of a task."""
+        display = await self._available.get()
+        try:
+            yield display
+        finally:
+            try:
+                await self.reset(display)
+            except RuntimeError:
+                display = await self._replace(display)
+            self._available.put_nowait(display)
+
+    async def reset(self, display: int):
+        await self._terminate(display)
+        await self._launch(display)
+
+    async def _replace(self, display: int) -> int:
+        """Drop a broken display and launch a fresh X server in its place."""
+        await self._terminate(display)
+        self.displays.remove(display)
+        replacement = self._next_display
+        self._next_display += 1
+        try:
+            await self._launch(replacement)
+        except RuntimeError:
+            await self._terminate(replacement)
+            raise
+        self.displays.append(replacement)
+        return replacement
+
+    async def _launch(self, display: int):
+        xvfb = await asyncio.create_subprocess_exec(
+            "Xvfb",
+            f":{display}",
+            "-screen",
+            "0",
+            f"{self.width}x{self.height}x24",
+            "-nolisten",
+            "tcp",
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._processes[display] = [xvfb]
+        socket = X11_SOCKET_DIR / f"X{display}"
+        try:
+            async with asyncio.timeout(self._startup_timeout):
+                while not socket.exists():
+                    if xvfb.returncode is not None:
+                        raise RuntimeError(
+                            f"Xvfb :{display} exited with returncode {xvfb.returncode}"
+                        )
+                    await asyncio.sleep(self._poll_interval)
+        except TimeoutError:
+            raise RuntimeError(
+                f"Xvfb :{display} did not start in {self._startup_timeout} seconds"
+            ) from None
+
+        if self.session_command:
+            self._processes[display].append(
+                await asyncio.create_subprocess_shell(
+                    f"DISPLAY=:{display} {self.session_command}",
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                    start_new_session=True,
+                )
+            )
+
+    async def _terminate(self, display: int):
+        # stop the session command first so it does not race the X server shutdown
+        for process in reversed(self._processes.pop(display, [])):
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+        # Xvfb removes its socket and lock file on a clean exit; clear stale ones
+        # just in case, since either stops the next server on this display
+        (X11_SOCKET_DIR / f"X{display}").unlink(missing_ok=True)
+        (X11_LOCK_DIR / f".X{display}-lock").unlink(missing_ok=True)
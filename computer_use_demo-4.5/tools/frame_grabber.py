@@ -0,0 +1,163 @@
+"""Background screen capture into a small ring buffer of recent frames."""
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from PIL import Image
+
+
+@dataclass(frozen=True)
+class Frame:
+    image: Image.Image
+    # time.monotonic() when the capture started
+    captured_at: float
+    # the grabber's input generation when the capture started
+    generation: int
+    # content hash, so that callers can tell identical frames apart cheaply
+    digest: bytes
+
+
+class FrameGrabber:
+    """
+    Captures the screen on a background thread `fps` times a second and keeps the
+    last `size` frames. Tools call `mark_stale()` after dispatching input, so that
+    frames whose capture started before the input no longer count as fresh.
+
+    The thread starts on first use and stops by itself after `idle_timeout` seconds
+    without use, so tools that are simply dropped do not keep capturing, or as soon
+    as `close()` is called. Captures that raise one of `capture_errors` are
+    skipped; callers fall back to a direct capture.
+    """
+
+    def __init__(
+        self,
+        capture: Callable[[], Image.Image],
+        *,
+        fps: float = 2.0,
+        size: int = 4,
+        idle_timeout: float = 30.0,
+        capture_errors: tuple[type[Exception], ...] = (OSError,),
+    ):
+        self._capture = capture
+        self._capture_errors = capture_errors
+        self._period = 1 / fps
+        self._idle_timeout = idle_timeout
+        self._frames: deque[Frame] = deque(maxlen=size)
+        self._generation = 0
+        self._last_used = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        # fresh_frame() calls waiting for the next capture, woken from the thread
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def mark_stale(self):
+        """Record that input was dispatched; only later captures are fresh."""
+        with self._lock:
+            self._generation += 1
+            self._touch()
+
+    def latest(self) -> Frame | None:
+        """The most recent frame, if its capture started after the last input."""
+        with self._lock:
+            self._touch()
+            if self._frames and self._frames[-1].generation == self._generation:
+                return self._frames[-1]
+        return None
+
+    def close(self):
+        """Stop capturing for good; later frames are never fresh."""
+        with self._lock:
+            self._closed = True
+            self._frames.clear()
+        self._wake_waiters()
+
+    async def fresh_frame(
+        self, newer_than: Frame | None = None, timeout: float | None = None
+    ) -> Frame | None:
+        """
+        Wait for a fresh frame captured after `newer_than`, if given. Returns None
+        if there is none within `timeout` seconds (by default, two capture periods
+        plus one second), e.g. because capturing fails.
+        """
+        if timeout is None:
+            timeout = 2 * self._period + 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # registered before looking, so that a capture in between wakes it
+            waiter = (loop, loop.create_future())
+            with self._lock:
+                self._waiters.append(waiter)
+            try:
+                frame = self.latest()
+                if frame is not None and (
+                    newer_than is None or frame.captured_at > newer_than.captured_at
+                ):
+                    return frame
+                remaining = deadline - loop.time()
+                if remaining <= 0 or self._closed:
+                    return None
+                await asyncio.wait_for(waiter[1], remaining)
+            except TimeoutError:
+                return None
+            finally:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+
+    def _touch(self):
+        # called with the lock held
+        self._last_used = time.monotonic()
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(
+                target=self._run, name="frame-grabber", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if (
+                    self._closed
+                    or time.monotonic() - self._last_used > self._idle_timeout
+                ):
+                    self._thread = None
+                    self._frames.clear()
+                    return
+                generation = self._generation
+            started_at = time.monotonic()
+            try:
+                image = self._capture()
+            except self._capture_errors:
+                # e.g. the display is going away
+                image = None
+            if image is not None:
+                digest = hashlib.blake2b(image.tobytes(), digest_size=16).digest()
+                with self._lock:
+                    if not self._closed:
+                        self._frames.append(
+                            Frame(image, started_at, generation, digest)
+                        )
+                self._wake_waiters()
+            time.sleep(max(0.0, started_at + self._period - time.monotonic()))
+
+    def _wake_waiters(self):
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # the waiter's event loop has been closed
+                pass
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,40 @@
+"""Wait for the screen to stop changing after an action, instead of a fixed delay."""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, kw_only=True)
+class SettlePolicy:
+    # seconds between probe frames
+    interval: float = 0.05
+    # the screen counts as settled once no probe frame changed for this long
+    stable_for: float = 0.3
+    # give up waiting and capture anyway after this long
+    timeout: float = 2.0
+
+
+async def wait_for_settle(
+    probe: Callable[[], Awaitable[bytes]], policy: SettlePolicy
+) -> float:
+    """
+    Poll `probe` for low-resolution frames until consecutive frames have been equal
+    for `policy.stable_for` seconds, or `policy.timeout` seconds have passed.
+    Returns the number of seconds waited.
+    """
+    start = time.monotonic()
+    previous = await probe()
+    stable_since = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if now - stable_since >= policy.stable_for or now - start >= policy.timeout:
+            return now - start
+        await asyncio.sleep(
+            min(policy.interval, max(0.0, start + policy.timeout - now))
+        )
+        frame = await probe()
+        if frame != previous:
+            previous = frame
+            stable_since = time.monotonic()
@@ -0,0 +1,192 @@
+"""In-process keyboard and mouse input for X11 displays through the XTEST extension."""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from typing import Any
+
+from .x11_keymap import SHIFT_KEYSYM, X11Keymap, wait_for_pointer
+
+
+class XTestInput:
+    """
+    Injects key and mouse events into an X display over one persistent connection,
+    instead of spawning `xdotool` per action. Like `X11Capture`, the connection
+    lives on a dedicated worker thread, which also keeps the events in order.
+
+    The keyboard map (`X11Keymap`) is read once when connecting.
+    """
+
+    def __init__(self, display_num: int | None = None):
+        self._display_name = f":{display_num}" if display_num is not None else None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=f"xtest-input{self._display_name or ''}",
+        )
+        self._display: Any = None
+        self._keymap: X11Keymap | None = None
+
+    @staticmethod
+    def available() -> bool:
+        """Whether the optional `python-xlib` dependency is installed."""
+        return find_spec("Xlib") is not None
+
+    async def move(self, x: int, y: int):
+        """Move the pointer and wait until the server reports it there."""
+        await self._submit(self._move, x, y)
+
+    async def click(
+        self,
+        button: int,
+        *,
+        at: tuple[int, int] | None = None,
+        modifiers: str | None = None,
+        repeat: int = 1,
+        delay: float = 0.01,
+    ):
+        """Optionally move to `at`, then click `repeat` times holding `modifiers`."""
+
+        def click():
+            if at is not None:
+                self._move(*at)
+            keycodes = self._press_combination(modifiers) if modifiers else []
+            for i in range(repeat):
+                if i:
+                    time.sleep(delay)
+                self._fake("ButtonPress", button)
+                self._fake("ButtonRelease", button)
+                self._display.sync()
+            self._release(keycodes)
+
+        await self._submit(click)
+
+    async def button(self, button: int, *, pressed: bool):
+        def press_or_release():
+            self._fake("ButtonPress" if pressed else "ButtonRelease", button)
+            self._display.sync()
+
+        await self._submit(press_or_release)
+
+    async def drag(self, x: int, y: int, button: int = 1):
+        """Press `button`, move to (`x`, `y`) and release it there."""
+
+        def drag():
+            self._fake("ButtonPress", button)
+            self._display.sync()
+            self._move(x, y)
+            self._fake("ButtonRelease", button)
+            self._display.sync()
+
+        await self._submit(drag)
+
+    async def key(self, keys: str):
+        """Press and release each space-separated combination, e.g. `ctrl+a Delete`."""
+
+        def key():
+            for combination in keys.split():
+                self._release(self._press_combination(combination))
+
+        await self._submit(key)
+
+    async def key_down(self, combination: str):
+        await self._submit(self._press_combination, combination)
+
+    async def key_up(self, combination: str):
+        def key_up():
+            keycodes = [
+                self._keymap.keycode(keysym)[0]
+                for keysym in self._combination_keysyms(combination)
+            ]
+            self._release(keycodes)
+
+        await self._submit(key_up)
+
+    async def type(self, text: str, delay_ms: int = 12):
+        """Type `text` character by character, `delay_ms` apart."""
+
+        def type_text():
+            for character in text:
+                keysym = X11Keymap.keysym(character)
+                self._release(self._press(*self._keymap.keycode(keysym)))
+                if delay_ms:
+                    time.sleep(delay_ms / 1000)
+
+        await self._submit(type_text)
+
+    async def position(self) -> tuple[int, int]:
+        def position():
+            pointer = self._display.screen().root.query_pointer()
+            return pointer.root_x, pointer.root_y
+
+        return await self._submit(position)
+
+    def close(self):
+        def close_connection():
+            if self._display is not None:
+                self._display.close()
+                self._display = None
+
+        self._executor.submit(close_connection)
+        self._executor.shutdown(wait=False)
+
+    async def _submit(self, function, *args):
+        def run():
+            self._connect()
+            return function(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, run)
+
+    def _connect(self):
+        if self._display is not None:
+            return
+        from Xlib import display, error
+
+        try:
+            self._display = display.Display(self._display_name)
+        except (error.DisplayError, OSError) as e:
+            raise RuntimeError(
+                f"Cannot open X display {self._display_name}: {e}"
+            ) from e
+        if not self._display.query_extension("XTEST"):
+            raise RuntimeError(f"X display {self._display_name} has no XTEST extension")
+        self._keymap = X11Keymap(self._display)
+
+    def _fake(self, event: str, detail: int, **kwargs):
+        from Xlib import X
+        from Xlib.ext import xtest
+
+        xtest.fake_input(self._display, getattr(X, event), detail, **kwargs)
+
+    def _move(self, x: int, y: int):
+        from Xlib import X
+
+        self._fake("MotionNotify", X.NONE, x=x, y=y)
+        self._display.sync()
+        wait_for_pointer(self._display.screen().root, x, y)
+
+    def _press_combination(self, combination: str) -> list[int]:
+        """Press the keys of e.g. `ctrl+shift+t` in order; returns their keycodes."""
+        keycodes = []
+        for keysym in self._combination_keysyms(combination):
+            keycodes += self._press(*self._keymap.keycode(keysym))
+        return keycodes
+
+    def _press(self, keycode: int, shift: bool) -> list[int]:
+        keycodes = [self._keymap.keycode(SHIFT_KEYSYM)[0]] if shift else []
+        keycodes.append(keycode)
+        for pressed in keycodes:
+            self._fake("KeyPress", pressed)
+        self._display.sync()
+        return keycodes
+
+    def _release(self, keycodes: list[int]):
+        for keycode in reversed(keycodes):
+            self._fake("KeyRelease", keycode)
+        self._display.sync()
+        if self._keymap.spare_keycode in keycodes:
+            # unbind it again so the keyboard map is left as it was
+            self._keymap.unbind_spare()
+
+    def _combination_keysyms(self, combination: str) -> list[int]:
+        return [X11Keymap.keysym(name) for name in combination.split("+") if name]
@@ -0,0 +1,221 @@
+"""
+Local estimates of request size, used to keep requests under a token and byte budget.
+"""
+
+import base64
+import binascii
+import io
+import json
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from anthropic.types.beta import BetaMessageParam, BetaTextBlockParam
+from PIL import Image
+
+if TYPE_CHECKING:
+    from .history import ImageIndex
+
+# rough average for English text and code
+CHARS_PER_TOKEN = 4
+# vision models bill about one token per 750 pixels
+PIXELS_PER_IMAGE_TOKEN = 750
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# base64 characters decoded to find the dimensions of a non-PNG image; JPEG and
+# WebP encoders put them well within the first few kilobytes
+HEADER_BASE64_CHARS = 16_384
+# JSON punctuation around each message or block in a request body
+SEPARATOR_BYTES = 2
+
+
+@dataclass(frozen=True, kw_only=True)
+class RequestBudget:
+    """Ceilings on the projected size of each request. `None` disables a limit."""
+
+    max_input_tokens: int | None = 180_000
+    max_request_bytes: int | None = 30_000_000
+    # before evicting images, shrink the oldest ones by this factor (once each,
+    # never below `min_image_width`); None to only evict
+    downscale_factor: float | None = 0.5
+    min_image_width: int = 640
+
+
+@dataclass(frozen=True, kw_only=True)
+class RequestSize:
+    input_tokens: int
+    request_bytes: int
+
+    def exceeds(self, budget: RequestBudget) -> bool:
+        return (
+            budget.max_input_tokens is not None
+            and self.input_tokens > budget.max_input_tokens
+        ) or (
+            budget.max_request_bytes is not None
+            and self.request_bytes > budget.max_request_bytes
+        )
+
+
+def image_dimensions(base64_data: str) -> tuple[int, int]:
+    """
+    Read the pixel dimensions of a base64 encoded image from its header, without
+    decoding the rest of the image.
+    """
+    try:
+        # the PNG IHDR chunk always sits in the first 24 bytes
+        head = base64.b64decode(base64_data[:32])
+        if head.startswith(PNG_SIGNATURE):
+            return (
+                int.from_bytes(head[16:20], "big"),
+                int.from_bytes(head[20:24], "big"),
+            )
+        # opening an image only parses its header
+        head = base64.b64decode(base64_data[:HEADER_BASE64_CHARS])
+        with Image.open(io.BytesIO(head)) as image:
+            return image.size
+    except (binascii.Error, OSError, SyntaxError):
+        return 0, 0
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    return math.ceil(width * height / PIXELS_PER_IMAGE_TOKEN)
+
+
+def estimate_text_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def image_block_size(block: dict[str, Any]) -> RequestSize:
+    """The share of a request taken up by a single image block."""
+    data = block.get("source", {}).get("data", "")
+    return RequestSize(
+        input_tokens=estimate_image_tokens(*image_dimensions(data)),
+        request_bytes=len(data),
+    )
+
+
+def estimate_request_size(
+    messages: list[BetaMessageParam],
+    *,
+    system: list[BetaTextBlockParam],
+    tools: list[Any],
+) -> RequestSize:
+    """Project the input tokens and body size of a request before it is sent."""
+    request_bytes = len(
+        json.dumps({"messages": messages, "system": system, "tools": tools})
+    )
+    input_tokens = estimate_text_tokens(json.dumps(tools)) + sum(
+        estimate_text_tokens(block["text"]) for block in system
+    )
+    for message in messages:
+        input_tokens += _estimate_content_tokens(message["content"])
+    return RequestSize(input_tokens=input_tokens, request_bytes=request_bytes)
+
+
+class RunningRequestSize:
+    """
+    The projected size of the next request, kept up to date as messages are
+    appended and blocks removed from them, so that only new content is measured
+    each turn instead of the whole history.
+    """
+
+    def __init__(
+        self,
+        messages: list[BetaMessageParam],
+        *,
+        system: list[BetaTextBlockParam],
+        tools: list[Any],
+    ):
+        base = estimate_request_size([], system=system, tools=tools)
+        self._input_tokens = base.input_tokens
+        self._request_bytes = base.request_bytes
+        for message in messages:
+            self.add(message)
+
+    @property
+    def size(self) -> RequestSize:
+        return RequestSize(
+            input_tokens=self._input_tokens, request_bytes=self._request_bytes
+        )
+
+    def add(self, message: BetaMessageParam):
+        """Count a message that has just been appended to the history."""
+        self._input_tokens += _estimate_content_tokens(message["content"])
+        self._request_bytes += len(json.dumps(message)) + SEPARATOR_BYTES
+
+    def add_block(self, block: dict[str, Any]):
+        """Count a content block that has just been added to a message."""
+        self._input_tokens += _estimate_content_tokens([block])
+        self._request_bytes += len(json.dumps(block)) + SEPARATOR_BYTES
+
+    def remove_block(self, block: dict[str, Any]):
+        """Discount a content block that has just been removed from a message."""
+        self._input_tokens -= _estimate_content_tokens([block])
+        self._request_bytes -= len(json.dumps(block)) + SEPARATOR_BYTES
+
+
+def enforce_budget(
+    request_size: RunningRequestSize, image_index: "ImageIndex", budget: RequestBudget
+) -> RequestSize:
+    """
+    Shrink and then evict the oldest images until the request fits the budget,
+    always keeping the most recent one intact. `image_index` must report evictions
+    to `request_size`. Returns the projected size afterwards.
+    """
+    if budget.downscale_factor:
+        for image in list(image_index.oldest(len(image_index) - 1)):
+            if not request_size.size.exceeds(budget):
+                break
+            request_size.remove_block(image)
+            downscale_image_block(
+                image, budget.downscale_factor, budget.min_image_width
+            )
+            request_size.add_block(image)
+    while request_size.size.exceeds(budget) and len(image_index) > 1:
+        image_index.pop_oldest()
+    return request_size.size
+
+
+def downscale_image_block(
+    block: dict[str, Any], factor: float, min_width: int = 0
+) -> bool:
+    """
+    Re-encode an image block in place at `factor` times its size, in the same
+    format, unless that would make it narrower than `min_width`. Returns whether
+    the image was shrunk.
+    """
+    source = block.get("source", {})
+    width, height = image_dimensions(source.get("data", ""))
+    size = (round(width * factor), round(height * factor))
+    if size[0] < max(min_width, 1) or size[1] < 1:
+        return False
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(source["data"]))) as image:
+            image_format = image.format or "PNG"
+            resized = image.resize(size, Image.Resampling.LANCZOS)
+    except (binascii.Error, OSError, SyntaxError):
+        return False
+    buffer = io.BytesIO()
+    resized.save(buffer, format=image_format)
+    source["data"] = base64.b64encode(buffer.getvalue()).decode()
+    return True
+
+
+def _estimate_content_tokens(content: Any) -> int:
+    if isinstance(content, str):
+        return estimate_text_tokens(content)
+    tokens = 0
+    for block in content:
+        if not isinstance(block, dict):
+            continue
+        block_type = block.get("type")
+        if block_type == "text":
+            tokens += estimate_text_tokens(block.get("text", ""))
+        elif block_type == "thinking":
+            tokens += estimate_text_tokens(block.get("thinking") or "")
+        elif block_type == "tool_use":
+            tokens += estimate_text_tokens(json.dumps(block.get("input", {})))
+        elif block_type == "tool_result":
+            tokens += _estimate_content_tokens(block.get("content", []))
+        elif block_type == "image":
+            tokens += image_block_size(block).input_tokens
+    return tokens
@@ -0,0 +1,276 @@
+"""
+Bookkeeping for the message history sent by the sampling loop.
+"""
+
+import itertools
+import json
+from collections import deque
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from typing import Any, cast
+
+from anthropic.types.beta import BetaMessageParam, BetaUsage
+
+from .budget import image_block_size
+
+
+class ImageIndex:
+    """
+    Tracks the position of every tool_result image in a message history, oldest
+    first. Messages are indexed once as they are appended, so deciding which
+    screenshots to drop costs O(evicted) rather than a walk over the whole history.
+
+    `stand_ins` maps tool_use ids to a block that takes the place of that tool
+    result's images once they are evicted, e.g. the text recognized in them. Used
+    entries are removed from it, so the same dict can outlive the index.
+    """
+
+    def __init__(
+        self,
+        messages: list[BetaMessageParam] | None = None,
+        *,
+        on_evict: Callable[[dict[str, Any]], None] | None = None,
+        on_insert: Callable[[dict[str, Any]], None] | None = None,
+        stand_ins: dict[str, dict[str, Any]] | None = None,
+    ):
+        # (message number, tool_use id, tool_result content list, image block) in
+        # chronological order
+        self._images: deque[tuple[int, str | None, list[Any], dict[str, Any]]] = deque()
+        self._message_numbers = itertools.count()
+        # called with every block removed from the history
+        self._on_evict = on_evict
+        # called with every stand-in put into the history
+        self._on_insert = on_insert
+        self._stand_ins = stand_ins if stand_ins is not None else {}
+        for message in messages or []:
+            self.add(message)
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def add(self, message: BetaMessageParam):
+        """Index the images in a message that has just been appended to the history."""
+        if not isinstance(content := message["content"], list):
+            return
+        message_number = next(self._message_numbers)
+        for item in content:
+            if not (isinstance(item, dict) and item.get("type") == "tool_result"):
+                continue
+            tool_result_content = item.get("content")
+            if not isinstance(tool_result_content, list):
+                continue
+            for block in tool_result_content:
+                if isinstance(block, dict) and block.get("type") == "image":
+                    self._images.append(
+                        (
+                            message_number,
+                            item.get("tool_use_id"),
+                            tool_result_content,
+                            cast(dict[str, Any], block),
+                        )
+                    )
+
+    def oldest(self, count: int) -> Iterator[dict[str, Any]]:
+        """The `count` oldest images, oldest first."""
+        for _, _, _, image in itertools.islice(self._images, max(count, 0)):
+            yield image
+
+    def message_boundary(self, count: int, *, round_up: bool = False) -> int:
+        """
+        Round an eviction of the `count` oldest images down (or up) to whole
+        messages, so that no message is left with only some of its images evicted.
+        """
+        count = min(max(count, 0), len(self._images))
+        if count in (0, len(self._images)):
+            return count
+        if round_up:
+            # the rest of the message of the last image evicted
+            message = self._images[count - 1][0]
+            while count < len(self._images) and self._images[count][0] == message:
+                count += 1
+        else:
+            # the start of the message of the first image kept
+            message = self._images[count][0]
+            while count and self._images[count - 1][0] == message:
+                count -= 1
+        return count
+
+    def pop_oldest(self) -> dict[str, Any] | None:
+        """
+        Remove the oldest image from the history in place, or replace it with its
+        stand-in, and return it.
+        """
+        if not self._images:
+            return None
+        _, tool_use_id, tool_result_content, image = self._images.popleft()
+        stand_in = self._stand_ins.pop(tool_use_id, None) if tool_use_id else None
+        for i, block in enumerate(tool_result_content):
+            if block is image:
+                if stand_in is None:
+                    del tool_result_content[i]
+                else:
+                    tool_result_content[i] = stand_in
+                break
+        if self._on_evict:
+            self._on_evict(image)
+        if stand_in is not None and self._on_insert:
+            self._on_insert(stand_in)
+        return image
+
+    def evict_oldest(self, count: int) -> int:
+        """Remove the `count` oldest images from the history in place."""
+        evicted = 0
+        while evicted < count and self.pop_oldest() is not None:
+            evicted += 1
+        return evicted
+
+
+@dataclass(kw_only=True)
+class CacheAwareEviction:
+    """
+    Decides when to drop old screenshots while prompt caching is enabled.
+
+    Removing an image invalidates the cached prefix from that point on, so the next
+    request pays the cache-write premium again on everything that was being read
+    from the cache. Carrying the images instead costs their tokens on every turn,
+    at the cache-read price as often as the cache is actually hit. Both are scaled
+    by the hit rate measured from the usage of recent responses: a cache that is
+    rarely hit costs little to break.
+
+    Images are evicted down to `min_images` in one chunk once carrying them until
+    `max_images` would force an eviction anyway costs more than the rebuild, and
+    always once more than `max_images` are held. Evictions cover whole messages,
+    since cache breakpoints sit on message boundaries.
+    """
+
+    min_images: int
+    max_images: int
+    cache_read_multiplier: float = 0.1
+    cache_write_multiplier: float = 1.25
+    # weight of the latest response in the moving average of the cache hit rate
+    hit_rate_smoothing: float = 0.5
+
+    _cached_tokens: int = field(default=0, init=False)
+    _hit_rate: float = field(default=1.0, init=False)
+
+    def observe(self, usage: BetaUsage):
+        """Record the cache usage reported for the latest response."""
+        cache_read = usage.cache_read_input_tokens or 0
+        cache_write = usage.cache_creation_input_tokens or 0
+        total = cache_read + cache_write + usage.input_tokens
+        self._cached_tokens = cache_read + cache_write
+        if total:
+            self._hit_rate += self.hit_rate_smoothing * (
+                cache_read / total - self._hit_rate
+            )
+
+    @property
+    def hit_rate(self) -> float:
+        return self._hit_rate
+
+    def images_to_evict(self, image_index: ImageIndex) -> int:
+        image_count = len(image_index)
+        excess = image_count - self.min_images
+        if excess <= 0:
+            return 0
+        if image_count > self.max_images:
+            return image_index.message_boundary(excess, round_up=True)
+        excess = image_index.message_boundary(excess)
+        if not excess:
+            return 0
+        excess_tokens = sum(
+            image_block_size(image).input_tokens for image in image_index.oldest(excess)
+        )
+        carry_cost_per_turn = excess_tokens * (
+            self._hit_rate * self.cache_read_multiplier
+            + (1 - self._hit_rate) * self.cache_write_multiplier
+        )
+        # about one screenshot is added per turn until max_images is reached
+        carry_cost = carry_cost_per_turn * (self.max_images - image_count + 1)
+        rebuild_cost = (
+            self._cached_tokens
+            * self._hit_rate
+            * (self.cache_write_multiplier - self.cache_read_multiplier)
+        )
+        return excess if carry_cost >= rebuild_cost else 0
+
+
+COMPACTED_TEXT_LIMIT = 300
+
+
+def compact_history(messages: list[BetaMessageParam], keep_turns: int) -> int:
+    """
+    Collapse all but the `keep_turns` most recent assistant turns into a text
+    summary appended to the first user message, in place. The retained tail starts
+    with an assistant message, so every tool_use is still answered by the
+    tool_result that follows it. Returns the number of messages removed.
+    """
+    assistant_indices = [
+        i for i, message in enumerate(messages) if message["role"] == "assistant"
+    ]
+    if len(assistant_indices) <= keep_turns or messages[0]["role"] != "user":
+        return 0
+    cut = assistant_indices[-keep_turns] if keep_turns else len(messages)
+    compacted = messages[1:cut]
+
+    lines = [f"{len(compacted)} earlier messages were compacted to save context:"]
+    for message in compacted:
+        lines.extend(_summarize_message(message))
+    summary = "<compacted_history>\n" + "\n".join(lines) + "\n</compacted_history>"
+
+    first_content = messages[0]["content"]
+    if isinstance(first_content, str):
+        first_content = [{"type": "text", "text": first_content}]
+    first_content = [
+        # cache breakpoints are re-applied to the recent turns by the sampling loop
+        {key: value for key, value in block.items() if key != "cache_control"}
+        if isinstance(block, dict)
+        else block
+        for block in first_content
+    ]
+    first_content.append({"type": "text", "text": summary})
+    messages[:] = [
+        {"role": "user", "content": cast(Any, first_content)},
+        *messages[cut:],
+    ]
+    return len(compacted)
+
+
+def _summarize_message(message: BetaMessageParam) -> list[str]:
+    content = message["content"]
+    if isinstance(content, str):
+        return [f"{message['role'].title()}: {_clip(content)}"]
+    lines = []
+    for block in content:
+        if not isinstance(block, dict):
+            continue
+        block_type = block.get("type")
+        if block_type == "text":
+            lines.append(f"{message['role'].title()}: {_clip(block['text'])}")
+        elif block_type == "tool_use":
+            tool_input = json.dumps(block.get("input", {}))
+            lines.append(f"Tool call {block['name']}: {_clip(tool_input)}")
+        elif block_type == "tool_result":
+            lines.append(f"Tool result: {_summarize_tool_result(block)}")
+    return lines
+
+
+def _summarize_tool_result(block: dict[str, Any]) -> str:
+    content = block.get("content", [])
+    if isinstance(content, str):
+        parts = [content]
+    else:
+        parts = [
+            item.get("text", "") if item.get("type") == "text" else "[screenshot]"
+            for item in content
+            if isinstance(item, dict)
+        ]
+    summary = _clip(" ".join(part for part in parts if part)) or "(empty)"
+    return f"error: {summary}" if block.get("is_error") else summary
+
+
+def _clip(text: str) -> str:
+    text = " ".join(text.split())
+    if len(text) <= COMPACTED_TEXT_LIMIT:
+        return text
+    return text[:COMPACTED_TEXT_LIMIT] + "..."
@@ -2,23 +2,29 @@
 Agentic sampling loop that calls the Claude API and local implementation of anthropic-defined computer use tools.
 """
 
+import asyncio
 import platform
 from collections.abc import Callable
+from contextlib import AsyncExitStack
 from datetime import datetime
 from enum import StrEnum
+from functools import partial
+from importlib.util import find_spec
 from typing import Any, cast
 
 import httpx
 from anthropic import (
-    Anthropic,
-    AnthropicBedrock,
-    AnthropicVertex,
     APIError,
     APIResponseValidationError,
     APIStatusError,
+    AsyncAnthropic,
+    AsyncAnthropicBedrock,
+    AsyncAnthropicVertex,
+    DefaultAsyncHttpxClient,
 )
 from anthropic.types.beta import (
     BetaCacheControlEphemeralParam,
+    BetaContentBlock,
     BetaContentBlockParam,
     BetaImageBlockParam,
     BetaMessage,
@@ -29,6 +35,14 @@ from anthropic.types.beta import (
     BetaToolUseBlockParam,
 )
 
+from .budget import (
+    RequestBudget,
+    RequestSize,
+    RunningRequestSize,
+    enforce_budget,
+)
+from .history import CacheAwareEviction, ImageIndex, compact_history
+from .ratelimit import Priority, RequestScheduler, shared_scheduler
 from .tools import (
     TOOL_GROUPS_BY_VERSION,
     ToolCollection,
@@ -45,6 +59,9 @@ class APIProvider(StrEnum):
     VERTEX = "vertex"
 
 
+AsyncClient = AsyncAnthropic | AsyncAnthropicBedrock | AsyncAnthropicVertex
+
+
 PROVIDER_TO_DEFAULT_MODEL_NAME: dict[APIProvider, str] = {
     APIProvider.ANTHROPIC: "claude-sonnet-4-5-20250929",
     APIProvider.BEDROCK: "anthropic.claude-sonnet-4-5-20250929-v1:0",
@@ -84,116 +101,372 @@ async def sampling_loop(
         [httpx.Request, httpx.Response | object | None, Exception | None], None
     ],
     api_key: str,
+    text_delta_callback: Callable[[str], None] | None = None,
     only_n_most_recent_images: int | None = None,
     max_tokens: int = 4096,
     tool_version: ToolVersion = "computer_use_20250124",
     thinking_budget: int | None = None,
     token_efficient_tools_beta: bool = False,
+    client: AsyncClient | None = None,
+    stream: bool = False,
+    request_budget: RequestBudget | None = None,
+    request_size_callback: Callable[[RequestSize], None] | None = None,
+    compact_after_turns: int | None = None,
+    compact_keep_turns: int = 20,
+    scheduler: RequestScheduler | None = None,
+    priority: Priority = Priority.INTERACTIVE,
 ):
     """
     Agentic sampling loop for the assistant/tool interaction of computer use.
+
+    The API client is created once per call and reused for every turn, so its
+    connection pool stays warm, then closed. Pass `client` to share one across
+    sessions; it is left open.
+
+    When prompt caching is in use, `only_n_most_recent_images` is enforced by a
+    CacheAwareEviction policy so that screenshots are dropped in large chunks,
+    only when that is cheaper than carrying them in the cached prefix.
+
+    With `stream` enabled, text deltas are sent to `text_delta_callback` as they
+    arrive, each content block is sent to `output_callback` once it is complete,
+    and each tool_use block is executed as soon as it is complete, while the rest
+    of the response is still being generated.
+
+    Before every call the projected request size is passed to
+    `request_size_callback`. It is estimated locally and kept up to date as
+    messages are appended and screenshots evicted. If it exceeds `request_budget`
+    (by default a `RequestBudget()`), the oldest screenshots are first downscaled,
+    then evicted, until it fits.
+
+    Once the history holds more than `compact_after_turns` assistant turns, all but
+    the `compact_keep_turns` most recent ones are collapsed into a text summary.
+    Compaction happens in one chunk, so the cached prefix then stays stable for
+    the next `compact_after_turns - compact_keep_turns` turns.
+
+    API calls go through `scheduler` (by default one shared by the whole process),
+    which paces them against the rate limits and retries 429s with backoff; calls
+    with a higher `priority` are admitted first. Retries are left to the scheduler,
+    also for a `client` passed in.
     """
+    if compact_after_turns and compact_after_turns <= compact_keep_turns:
+        raise ValueError(
+            f"compact_after_turns ({compact_after_turns}) must be greater than "
+            f"compact_keep_turns ({compact_keep_turns})"
+        )
     tool_group = TOOL_GROUPS_BY_VERSION[tool_version]
     tool_collection = ToolCollection(*(ToolCls() for ToolCls in tool_group.tools))
-    system = BetaTextBlockParam(
-        type="text",
-        text=f"{SYSTEM_PROMPT}{' ' + system_prompt_suffix if system_prompt_suffix else ''}",
-    )
-
-    while True:
-        enable_prompt_caching = False
-        betas = [tool_group.beta_flag] if tool_group.beta_flag else []
-        if token_efficient_tools_beta:
-            betas.append("token-efficient-tools-2025-02-19")
-        image_truncation_threshold = only_n_most_recent_images or 0
-        if provider == APIProvider.ANTHROPIC:
-            client = Anthropic(api_key=api_key, max_retries=4)
-            enable_prompt_caching = True
-        elif provider == APIProvider.VERTEX:
-            client = AnthropicVertex()
-        elif provider == APIProvider.BEDROCK:
-            client = AnthropicBedrock()
-
-        if enable_prompt_caching:
-            betas.append(PROMPT_CACHING_BETA_FLAG)
-            _inject_prompt_caching(messages)
-            # Because cached reads are 10% of the price, we don't think it's
-            # ever sensible to break the cache by truncating images
-            only_n_most_recent_images = 0
-            # Use type ignore to bypass TypedDict check until SDK types are updated
-            system["cache_control"] = {"type": "ephemeral"}  # type: ignore
-
-        if only_n_most_recent_images:
-            _maybe_filter_to_n_most_recent_images(
-                messages,
-                only_n_most_recent_images,
-                min_removal_threshold=image_truncation_threshold,
-            )
-        extra_body = {}
-        if thinking_budget:
-            # Ensure we only send the required fields for thinking
-            extra_body = {
-                "thinking": {"type": "enabled", "budget_tokens": thinking_budget}
-            }
-
-        # Call the API
-        # we use raw_response to provide debug information to streamlit. Your
-        # implementation may be able call the SDK directly with:
-        # `response = client.messages.create(...)` instead.
-        try:
-            raw_response = client.beta.messages.with_raw_response.create(
-                max_tokens=max_tokens,
-                messages=messages,
-                model=model,
-                system=[system],
-                tools=tool_collection.to_params(),
-                betas=betas,
-                extra_body=extra_body,
+    owns_client = client is None
+    if client is None:
+        client = make_client(provider, api_key)
+    else:
+        # the scheduler retries; the copy still shares the client's connection pool
+        client = client.with_options(max_retries=0)
+    try:
+        if scheduler is None:
+            scheduler = shared_scheduler()
+        if request_budget is None:
+            request_budget = RequestBudget()
+        image_eviction = (
+            CacheAwareEviction(
+                min_images=only_n_most_recent_images,
+                max_images=3 * only_n_most_recent_images,
             )
-        except (APIStatusError, APIResponseValidationError) as e:
-            api_response_callback(e.request, e.response, e)
-            return messages
-        except APIError as e:
-            api_response_callback(e.request, e.body, e)
-            return messages
-
-        api_response_callback(
-            raw_response.http_response.request, raw_response.http_response, None
+            if provider == APIProvider.ANTHROPIC and only_n_most_recent_images
+            else None
+        )
+        system = BetaTextBlockParam(
+            type="text",
+            text=f"{SYSTEM_PROMPT}{' ' + system_prompt_suffix if system_prompt_suffix else ''}",
+        )
+        request_size = RunningRequestSize(
+            messages, system=[system], tools=tool_collection.to_params()
         )
+        # tool_use id -> the OCR text sent in place of its screenshot once evicted
+        text_layers: dict[str, dict[str, Any]] = {}
+        image_index = ImageIndex(
+            messages,
+            on_evict=request_size.remove_block,
+            on_insert=request_size.add_block,
+            stand_ins=text_layers,
+        )
+
+        assistant_turns = sum(message["role"] == "assistant" for message in messages)
+
+        while True:
+            if compact_after_turns and assistant_turns > compact_after_turns:
+                compact_history(messages, compact_keep_turns)
+                assistant_turns = sum(
+                    message["role"] == "assistant" for message in messages
+                )
+                request_size = RunningRequestSize(
+                    messages, system=[system], tools=tool_collection.to_params()
+                )
+                image_index = ImageIndex(
+                    messages,
+                    on_evict=request_size.remove_block,
+                    on_insert=request_size.add_block,
+                    stand_ins=text_layers,
+                )
 
-        response = raw_response.parse()
+            enable_prompt_caching = False
+            betas = [tool_group.beta_flag] if tool_group.beta_flag else []
+            if token_efficient_tools_beta:
+                betas.append("token-efficient-tools-2025-02-19")
+            image_truncation_threshold = only_n_most_recent_images or 0
+            if provider == APIProvider.ANTHROPIC:
+                enable_prompt_caching = True
+
+            if enable_prompt_caching:
+                betas.append(PROMPT_CACHING_BETA_FLAG)
+                _inject_prompt_caching(messages)
+                # Use type ignore to bypass TypedDict check until SDK types are updated
+                system["cache_control"] = {"type": "ephemeral"}  # type: ignore
+                # Because cached reads are 10% of the price, only break the cache by
+                # truncating images when the policy finds it cheaper than carrying them
+                if image_eviction:
+                    image_index.evict_oldest(
+                        image_eviction.images_to_evict(image_index)
+                    )
+            elif only_n_most_recent_images:
+                _maybe_filter_to_n_most_recent_images(
+                    image_index,
+                    only_n_most_recent_images,
+                    min_removal_threshold=image_truncation_threshold,
+                )
+            extra_body = {}
+            if thinking_budget:
+                # Ensure we only send the required fields for thinking
+                extra_body = {
+                    "thinking": {"type": "enabled", "budget_tokens": thinking_budget}
+                }
 
-        response_params = _response_to_params(response)
-        messages.append(
-            {
-                "role": "assistant",
-                "content": response_params,
+            tools = tool_collection.to_params()
+            projected_size = enforce_budget(request_size, image_index, request_budget)
+            if request_size_callback:
+                request_size_callback(projected_size)
+
+            request_params: dict[str, Any] = {
+                "max_tokens": max_tokens,
+                "messages": messages,
+                "model": model,
+                "system": [system],
+                "tools": tools,
+                "betas": betas,
+                "extra_body": extra_body,
             }
-        )
 
-        tool_result_content: list[BetaToolResultBlockParam] = []
-        for content_block in response_params:
-            output_callback(content_block)
-            if isinstance(content_block, dict) and content_block.get("type") == "tool_use":
-                # Type narrowing for tool use blocks
-                tool_use_block = cast(BetaToolUseBlockParam, content_block)
-                result = await tool_collection.run(
-                    name=tool_use_block["name"],
-                    tool_input=cast(dict[str, Any], tool_use_block.get("input", {})),
+            # Call the API
+            # we use raw_response to provide debug information to streamlit. Your
+            # implementation may be able call the SDK directly with:
+            # `response = client.messages.create(...)` instead.
+            try:
+                if stream:
+                    response, tool_result_content = await _stream_response(
+                        client,
+                        request_params,
+                        tool_collection,
+                        scheduler=scheduler,
+                        priority=priority,
+                        input_tokens=projected_size.input_tokens,
+                        output_callback=output_callback,
+                        text_delta_callback=text_delta_callback,
+                        tool_output_callback=tool_output_callback,
+                        api_response_callback=api_response_callback,
+                        text_layers=text_layers,
+                    )
+                else:
+                    raw_response = await scheduler.submit(
+                        partial(
+                            client.beta.messages.with_raw_response.create,
+                            **request_params,
+                        ),
+                        input_tokens=projected_size.input_tokens,
+                        priority=priority,
+                    )
+            except (APIStatusError, APIResponseValidationError) as e:
+                api_response_callback(e.request, e.response, e)
+                return messages
+            except APIError as e:
+                api_response_callback(e.request, e.body, e)
+                return messages
+
+            if not stream:
+                api_response_callback(
+                    raw_response.http_response.request, raw_response.http_response, None
                 )
-                tool_result_content.append(
-                    _make_api_tool_result(result, tool_use_block["id"])
+                response = raw_response.parse()
+                scheduler.observe(
+                    raw_response.http_response.headers, response.usage.output_tokens
                 )
-                tool_output_callback(result, tool_use_block["id"])
 
-        if not tool_result_content:
-            return messages
+            if image_eviction:
+                image_eviction.observe(response.usage)
 
-        messages.append({"content": tool_result_content, "role": "user"})
+            response_params = _response_to_params(response)
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": response_params,
+                }
+            )
+            request_size.add(messages[-1])
+            assistant_turns += 1
+
+            if not stream:
+                scheduled_tools: list[
+                    tuple[BetaToolUseBlockParam, asyncio.Task[ToolResult]]
+                ] = []
+                for content_block in response_params:
+                    output_callback(content_block)
+                    if (
+                        isinstance(content_block, dict)
+                        and content_block.get("type") == "tool_use"
+                    ):
+                        # Type narrowing for tool use blocks
+                        tool_use_block = cast(BetaToolUseBlockParam, content_block)
+                        scheduled_tools.append(
+                            (
+                                tool_use_block,
+                                _schedule_tool_use(tool_collection, tool_use_block),
+                            )
+                        )
+                tool_result_content = await _collect_tool_results(
+                    scheduled_tools, tool_output_callback, text_layers
+                )
+
+            if not tool_result_content:
+                return messages
+
+            messages.append({"content": tool_result_content, "role": "user"})
+            request_size.add(messages[-1])
+            image_index.add(messages[-1])
+    finally:
+        tool_collection.close()
+        # a client passed in is shared; close only the one created here
+        if owns_client:
+            await client.close()
+
+
+async def _stream_response(
+    client: AsyncClient,
+    request_params: dict[str, Any],
+    tool_collection: ToolCollection,
+    *,
+    scheduler: RequestScheduler,
+    priority: Priority,
+    input_tokens: int,
+    output_callback: Callable[[BetaContentBlockParam], None],
+    text_delta_callback: Callable[[str], None] | None,
+    tool_output_callback: Callable[[ToolResult, str], None],
+    api_response_callback: Callable[
+        [httpx.Request, httpx.Response | object | None, Exception | None], None
+    ],
+    text_layers: dict[str, dict[str, Any]],
+) -> tuple[BetaMessage, list[BetaToolResultBlockParam]]:
+    """
+    Stream a response from the API, scheduling each tool_use block on the tool
+    collection as soon as its content_block_stop event arrives, so that tool
+    execution overlaps with the remainder of the stream.
+
+    If the stream fails, tool calls that were already scheduled still run to
+    completion before the error propagates; stopping them partway could leave
+    an action half done.
+    """
+    scheduled_tools: list[tuple[BetaToolUseBlockParam, asyncio.Task[ToolResult]]] = []
+    try:
+        async with AsyncExitStack() as stack:
+            # only opening the stream goes through the scheduler; retrying after
+            # tools have been dispatched would run them twice
+            message_stream = await scheduler.submit(
+                lambda: stack.enter_async_context(
+                    client.beta.messages.stream(**request_params)
+                ),
+                input_tokens=input_tokens,
+                priority=priority,
+            )
+            async for event in message_stream:
+                if event.type == "text" and text_delta_callback:
+                    text_delta_callback(event.text)
+                elif event.type == "content_block_stop":
+                    content_block = _block_to_param(event.content_block)
+                    if content_block is None:
+                        continue
+                    output_callback(content_block)
+                    if content_block["type"] == "tool_use":
+                        tool_use_block = cast(BetaToolUseBlockParam, content_block)
+                        scheduled_tools.append(
+                            (
+                                tool_use_block,
+                                _schedule_tool_use(tool_collection, tool_use_block),
+                            )
+                        )
+            response = await message_stream.get_final_message()
+            scheduler.observe(
+                message_stream.response.headers, response.usage.output_tokens
+            )
+            # the streamed body has already been consumed, so hand the parsed
+            # message to the callback rather than the raw http response
+            api_response_callback(message_stream.response.request, response, None)
+    except Exception:
+        if scheduled_tools:
+            await asyncio.wait([task for _, task in scheduled_tools])
+        raise
+    tool_result_content = await _collect_tool_results(
+        scheduled_tools, tool_output_callback, text_layers
+    )
+    return response, tool_result_content
+
+
+def _schedule_tool_use(
+    tool_collection: ToolCollection, tool_use_block: BetaToolUseBlockParam
+) -> asyncio.Task[ToolResult]:
+    return tool_collection.schedule(
+        name=tool_use_block["name"],
+        tool_input=cast(dict[str, Any], tool_use_block.get("input", {})),
+    )
+
+
+async def _collect_tool_results(
+    scheduled_tools: list[tuple[BetaToolUseBlockParam, asyncio.Task[ToolResult]]],
+    tool_output_callback: Callable[[ToolResult, str], None],
+    text_layers: dict[str, dict[str, Any]],
+) -> list[BetaToolResultBlockParam]:
+    """
+    Await scheduled tool calls and build their tool_result blocks in request order.
+    The text layers of screenshots are kept aside in `text_layers`, to be sent only
+    once the screenshot itself is evicted.
+    """
+    tool_result_content: list[BetaToolResultBlockParam] = []
+    for tool_use_block, task in scheduled_tools:
+        result = await task
+        tool_result_content.append(_make_api_tool_result(result, tool_use_block["id"]))
+        if result.text_layer and result.base64_image:
+            text_layers[tool_use_block["id"]] = {
+                "type": "text",
+                "text": result.text_layer,
+            }
+        tool_output_callback(result, tool_use_block["id"])
+    return tool_result_content
+
+
+def make_client(provider: APIProvider, api_key: str) -> AsyncClient:
+    """
+    Create an async API client for the given provider. The underlying httpx pool
+    negotiates HTTP/2 when the optional `h2` package is installed. Retries are
+    disabled because the request scheduler handles them across sessions.
+    """
+    http_client = DefaultAsyncHttpxClient(http2=find_spec("h2") is not None)
+    if provider == APIProvider.ANTHROPIC:
+        return AsyncAnthropic(api_key=api_key, max_retries=0, http_client=http_client)
+    elif provider == APIProvider.VERTEX:
+        return AsyncAnthropicVertex(max_retries=0, http_client=http_client)
+    elif provider == APIProvider.BEDROCK:
+        return AsyncAnthropicBedrock(max_retries=0, http_client=http_client)
+    raise ValueError(f"Unknown API provider: {provider}")
 
 
 def _maybe_filter_to_n_most_recent_images(
-    messages: list[BetaMessageParam],
+    image_index: ImageIndex,
     images_to_keep: int,
     min_removal_threshold: int,
 ):
@@ -204,41 +477,14 @@ def _maybe_filter_to_n_most_recent_images(
     break the implicit prompt cache.
     """
     if images_to_keep is None:
-        return messages
-
-    tool_result_blocks = cast(
-        list[BetaToolResultBlockParam],
-        [
-            item
-            for message in messages
-            for item in (
-                message["content"] if isinstance(message["content"], list) else []
-            )
-            if isinstance(item, dict) and item.get("type") == "tool_result"
-        ],
-    )
-
-    total_images = sum(
-        1
-        for tool_result in tool_result_blocks
-        for content in tool_result.get("content", [])
-        if isinstance(content, dict) and content.get("type") == "image"
-    )
+        return
 
-    images_to_remove = total_images - images_to_keep
+    images_to_remove = len(image_index) - images_to_keep
     # for better cache behavior, we want to remove in chunks
     images_to_remove -= images_to_remove % min_removal_threshold
 
-    for tool_result in tool_result_blocks:
-        if isinstance(tool_result.get("content"), list):
-            new_content = []
-            for content in tool_result.get("content", []):
-                if isinstance(content, dict) and content.get("type") == "image":
-                    if images_to_remove > 0:
-                        images_to_remove -= 1
-                        continue
-                new_content.append(content)
-            tool_result["content"] = new_content
+    if images_to_remove > 0:
+        image_index.evict_oldest(images_to_remove)
 
 
 def _make_api_tool_result(
@@ -264,7 +510,7 @@ def _make_api_tool_result(
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": "image/png",
+                        "media_type": result.image_media_type or "image/png",
                         "data": result.base64_image,
                     },
                 }
@@ -288,24 +534,30 @@ def _response_to_params(
 ) -> list[BetaContentBlockParam]:
     res: list[BetaContentBlockParam] = []
     for block in response.content:
-        if isinstance(block, BetaTextBlock):
-            if block.text:
-                res.append(BetaTextBlockParam(type="text", text=block.text))
-            elif getattr(block, "type", None) == "thinking":
-                # Handle thinking blocks - include signature field
-                thinking_block = {
-                    "type": "thinking",
-                    "thinking": getattr(block, "thinking", None),
-                }
-                if hasattr(block, "signature"):
-                    thinking_block["signature"] = getattr(block, "signature", None)
-                res.append(cast(BetaContentBlockParam, thinking_block))
-        else:
-            # Handle tool use blocks normally
-            res.append(cast(BetaToolUseBlockParam, block.model_dump()))
+        param = _block_to_param(block)
+        if param is not None:
+            res.append(param)
     return res
 
 
+def _block_to_param(block: BetaContentBlock) -> BetaContentBlockParam | None:
+    if isinstance(block, BetaTextBlock):
+        if block.text:
+            return BetaTextBlockParam(type="text", text=block.text)
+        elif getattr(block, "type", None) == "thinking":
+            # Handle thinking blocks - include signature field
+            thinking_block = {
+                "type": "thinking",
+                "thinking": getattr(block, "thinking", None),
+            }
+            if hasattr(block, "signature"):
+                thinking_block["signature"] = getattr(block, "signature", None)
+            return cast(BetaContentBlockParam, thinking_block)
+        return None
+    # Handle tool use blocks normally
+    return cast(BetaToolUseBlockParam, block.model_dump())
+
+
 def _inject_prompt_caching(
     messages: list[BetaMessageParam],
 ):
@@ -0,0 +1,212 @@
+"""
+Process-wide scheduler for API calls, shared by every sampling loop so that
+concurrent sessions stay under the organization's rate limits together.
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections.abc import Awaitable, Callable, Mapping
+from contextlib import suppress
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import TypeVar
+
+from anthropic import APIConnectionError, APIStatusError
+
+T = TypeVar("T")
+
+MAX_BACKOFF = 60.0  # seconds
+RATE_LIMIT_HEADER_PREFIX = "anthropic-ratelimit-"
+
+
+class Priority(IntEnum):
+    """Lower values are admitted first."""
+
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+@dataclass(kw_only=True)
+class TokenBucket:
+    """A bucket holding up to `capacity` units that refills over one minute."""
+
+    capacity: float
+    tokens: float
+    updated_at: float
+
+    def refill(self, now: float):
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated_at) * self.capacity / 60,
+        )
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available, assuming a fresh refill."""
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60 / self.capacity
+
+
+class RequestScheduler:
+    """
+    Admits API calls against token buckets for requests, input tokens and output
+    tokens, highest priority first. Limits start unknown and are learned from the
+    `anthropic-ratelimit-*` response headers; 429/529, 5xx and connection errors
+    pause the scheduler for `retry-after` (or a jittered exponential backoff) and
+    are retried up to `max_retries` times.
+
+    Only the head of the queue waits for the limits, sleeping until its tokens
+    have refilled; the others sleep until they become the head. Each queued call
+    is woken through its own event loop, so one scheduler can be shared by
+    sessions running on different event loops and threads.
+    """
+
+    def __init__(self, *, max_retries: int = 4):
+        self.max_retries = max_retries
+        self._buckets: dict[str, TokenBucket] = {}
+        self._waiters: list[tuple[int, int]] = []
+        self._wakeups: dict[
+            tuple[int, int], tuple[asyncio.AbstractEventLoop, asyncio.Event]
+        ] = {}
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    async def submit(
+        self,
+        call: Callable[[], Awaitable[T]],
+        *,
+        input_tokens: int = 0,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> T:
+        """Run `call` once the rate limits allow it, retrying transient failures."""
+        for attempt in itertools.count():
+            await self._acquire(priority, input_tokens)
+            try:
+                return await call()
+            except (APIStatusError, APIConnectionError) as e:
+                response = getattr(e, "response", None)
+                status = response.status_code if response is not None else None
+                if attempt >= self.max_retries or (
+                    status is not None and status != 429 and status < 500
+                ):
+                    raise
+                headers = response.headers if response is not None else {}
+                self.observe(headers)
+                self._pause(self._retry_delay(attempt, headers))
+        raise AssertionError("unreachable")
+
+    def observe(self, headers: Mapping[str, str], output_tokens: int = 0):
+        """Sync the buckets with the rate-limit headers of a response."""
+        now = time.monotonic()
+        with self._lock:
+            for name in ("requests", "input-tokens", "output-tokens"):
+                limit = headers.get(f"{RATE_LIMIT_HEADER_PREFIX}{name}-limit")
+                remaining = headers.get(f"{RATE_LIMIT_HEADER_PREFIX}{name}-remaining")
+                if limit is None or remaining is None:
+                    continue
+                bucket = self._buckets.get(name)
+                if bucket is None:
+                    bucket = self._buckets[name] = TokenBucket(
+                        capacity=float(limit), tokens=float(remaining), updated_at=now
+                    )
+                bucket.refill(now)
+                bucket.capacity = float(limit)
+                # the server also sees other processes using the same key
+                bucket.tokens = min(bucket.tokens, float(remaining))
+            if output_tokens and (bucket := self._buckets.get("output-tokens")):
+                bucket.tokens -= output_tokens
+            # the head may now have a different wait ahead of it
+            self._wake_head()
+
+    async def _acquire(self, priority: Priority, input_tokens: int):
+        ticket = (int(priority), next(self._sequence))
+        wakeup = asyncio.Event()
+        with self._lock:
+            heapq.heappush(self._waiters, ticket)
+            self._wakeups[ticket] = (asyncio.get_running_loop(), wakeup)
+        try:
+            while True:
+                # cleared before checking, so a wakeup sent meanwhile is not lost
+                wakeup.clear()
+                with self._lock:
+                    delay = (
+                        self._admit(ticket, input_tokens)
+                        if self._waiters[0] == ticket
+                        else None
+                    )
+                if delay is not None and delay <= 0:
+                    return
+                with suppress(TimeoutError):
+                    await asyncio.wait_for(wakeup.wait(), delay)
+        finally:
+            with self._lock:
+                del self._wakeups[ticket]
+                if ticket in self._waiters:
+                    was_head = self._waiters[0] == ticket
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    if was_head:
+                        self._wake_head()
+
+    def _admit(self, ticket: tuple[int, int], input_tokens: int) -> float:
+        """Admit the head of the queue, or return how long it has to wait."""
+        now = time.monotonic()
+        requirements = {"requests": 1, "input-tokens": input_tokens, "output-tokens": 1}
+        delay = self._paused_until - now
+        for name, amount in requirements.items():
+            if bucket := self._buckets.get(name):
+                bucket.refill(now)
+                delay = max(delay, bucket.wait_time(amount))
+        if delay > 0:
+            return delay
+        heapq.heappop(self._waiters)
+        for name, amount in requirements.items():
+            # output tokens are debited from the usage once the response arrives
+            if name != "output-tokens" and (bucket := self._buckets.get(name)):
+                bucket.tokens -= amount
+        self._wake_head()
+        return 0.0
+
+    def _wake_head(self):
+        """Wake the call at the head of the queue to re-check its wait. Needs _lock."""
+        if not self._waiters:
+            return
+        loop, wakeup = self._wakeups[self._waiters[0]]
+        # RuntimeError: its event loop has been closed
+        with suppress(RuntimeError):
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def _pause(self, delay: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._wake_head()
+
+    def _retry_delay(self, attempt: int, headers: Mapping[str, str]) -> float:
+        try:
+            retry_after = float(headers.get("retry-after", ""))
+        except ValueError:
+            retry_after = None
+        if retry_after is not None and 0 <= retry_after <= MAX_BACKOFF:
+            # spread retries so sessions do not all come back at the same instant
+            return retry_after + random.uniform(0, min(retry_after, 1.0) + 0.1)
+        return random.uniform(0, min(MAX_BACKOFF, 0.5 * 2**attempt))
+
+
+_shared_scheduler: RequestScheduler | None = None
+_shared_scheduler_lock = threading.Lock()
+
+
+def shared_scheduler() -> RequestScheduler:
+    """The scheduler used by every sampling loop that is not given its own."""
+    global _shared_scheduler
+    with _shared_scheduler_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = RequestScheduler()
+        return _shared_scheduler
@@ -2,7 +2,11 @@ from .base import CLIResult, ToolResult
 from .bash import BashTool, BashTool20250124
 from .collection import ToolCollection
 from .computer import ComputerTool
-from .computer_macos import ComputerTool20241022, ComputerTool20250124
+from .computer_macos import (
+    ComputerTool20241022,
+    ComputerTool20250124,
+    ComputerTool20251124,
+)
 from .edit import EditTool, EditTool20250124, EditTool20250728
 from .groups import TOOL_GROUPS_BY_VERSION, ToolVersion
 
@@ -13,6 +17,7 @@ __ALL__ = [
     ComputerTool,
     ComputerTool20241022,
     ComputerTool20250124,
+    ComputerTool20251124,
     EditTool,
     EditTool20250124,
     EditTool20250728,
@@ -0,0 +1,411 @@
+"""Where the computer tools send input and capture the screen from."""
+
+import os
+import sys
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from collections.abc import Callable
+from dataclasses import dataclass
+from importlib.util import find_spec
+from typing import Any, Literal
+
+from PIL import Image, ImageChops, ImageDraw
+
+from .x11_keymap import SHIFT_KEYSYM, X11Keymap, wait_for_pointer
+
+Button = Literal["left", "middle", "right"]
+
+
+class ComputerBackend(metaclass=ABCMeta):
+    """
+    The input and capture primitives the computer tools are built on. Key names
+    are PyAutoGUI's (e.g. `ctrl`, `command`, `enter`, `pageup`).
+
+    Methods block and are called from one input thread at a time, except for
+    `screenshot()`, which may be called from other threads concurrently.
+    """
+
+    # the X display driven, if any
+    display_num: int | None = None
+    # the combination that pastes the clipboard
+    paste_keys: tuple[str, ...] = ("ctrl", "v")
+    # what screenshot() raises when the screen cannot be captured right now
+    capture_errors: tuple[type[Exception], ...] = (OSError,)
+
+    @abstractmethod
+    def size(self) -> tuple[int, int]: ...
+
+    @abstractmethod
+    def position(self) -> tuple[int, int]: ...
+
+    @abstractmethod
+    def screenshot(self) -> Image.Image: ...
+
+    @abstractmethod
+    def move_to(self, x: int, y: int): ...
+
+    @abstractmethod
+    def mouse_down(self, button: Button = "left"): ...
+
+    @abstractmethod
+    def mouse_up(self, button: Button = "left"): ...
+
+    @abstractmethod
+    def click(self, button: Button = "left", clicks: int = 1): ...
+
+    @abstractmethod
+    def key_down(self, key: str): ...
+
+    @abstractmethod
+    def key_up(self, key: str): ...
+
+    @abstractmethod
+    def write(self, text: str, interval: float = 0.0): ...
+
+    @abstractmethod
+    def scroll(self, clicks: int, horizontal: bool = False):
+        """Scroll up (or left) by `clicks`, or down (or right) if negative."""
+        ...
+
+    def hotkey(self, *keys: str):
+        """Press `keys` in order, then release them in reverse."""
+        for key in keys:
+            self.key_down(key)
+        for key in reversed(keys):
+            self.key_up(key)
+
+    def failsafe_triggered(self) -> bool:
+        """Whether the pointer is in a screen corner, like PyAutoGUI's FAILSAFE."""
+        width, height = self.size()
+        return tuple(self.position()) in {
+            (0, 0),
+            (width - 1, 0),
+            (0, height - 1),
+            (width - 1, height - 1),
+        }
+
+
+class PyAutoGUIBackend(ComputerBackend):
+    """The local screen, through PyAutoGUI."""
+
+    def __init__(self):
+        # imported here, since PyAutoGUI needs a display as soon as it is imported
+        import pyautogui
+
+        # PAUSE and FAILSAFE are left as they are: every call here passes
+        # _pause=False, since the pacing profile sleeps per input step instead
+        self._pyautogui = pyautogui
+        self.capture_errors = (OSError, pyautogui.PyAutoGUIException)
+        if sys.platform == "darwin":
+            self.paste_keys = ("command", "v")
+
+    def size(self) -> tuple[int, int]:
+        width, height = self._pyautogui.size()
+        return int(width), int(height)
+
+    def position(self) -> tuple[int, int]:
+        x, y = self._pyautogui.position()
+        return int(x), int(y)
+
+    def screenshot(self) -> Image.Image:
+        return self._pyautogui.screenshot()
+
+    def move_to(self, x: int, y: int):
+        self._pyautogui.moveTo(x, y, _pause=False)
+
+    def mouse_down(self, button: Button = "left"):
+        self._pyautogui.mouseDown(button=button, _pause=False)
+
+    def mouse_up(self, button: Button = "left"):
+        self._pyautogui.mouseUp(button=button, _pause=False)
+
+    def click(self, button: Button = "left", clicks: int = 1):
+        self._pyautogui.click(button=button, clicks=clicks, _pause=False)
+
+    def key_down(self, key: str):
+        self._pyautogui.keyDown(key, _pause=False)
+
+    def key_up(self, key: str):
+        self._pyautogui.keyUp(key, _pause=False)
+
+    def hotkey(self, *keys: str):
+        self._pyautogui.hotkey(*keys, _pause=False)
+
+    def write(self, text: str, interval: float = 0.0):
+        self._pyautogui.write(text, interval=interval, _pause=False)
+
+    def scroll(self, clicks: int, horizontal: bool = False):
+        if horizontal:
+            self._pyautogui.hscroll(clicks, _pause=False)
+        else:
+            self._pyautogui.scroll(clicks, _pause=False)
+
+
+X11_BUTTONS: dict[Button, int] = {"left": 1, "middle": 2, "right": 3}
+# (horizontal, towards the top or left) -> the X button that scrolls that way
+X11_SCROLL_BUTTONS = {
+    (False, True): 4,
+    (False, False): 5,
+    (True, True): 6,
+    (True, False): 7,
+}
+
+
+class X11Backend(ComputerBackend):
+    """
+    An X display, e.g. Xvfb on a machine without a screen, through the XTEST
+    extension over one persistent python-xlib connection. The connection is
+    shared by the input and capture threads under a lock.
+    """
+
+    def __init__(self, display_num: int | None = None):
+        from Xlib import display, error
+
+        self.display_num = display_num
+        name = f":{display_num}" if display_num is not None else None
+        try:
+            self._display: Any = display.Display(name)
+        except (error.DisplayError, OSError) as e:
+            raise RuntimeError(f"Cannot open X display {name}: {e}") from e
+        if not self._display.query_extension("XTEST"):
+            raise RuntimeError(f"X display {name} has no XTEST extension")
+        self._root = self._display.screen().root
+        self._lock = threading.Lock()
+        self.capture_errors = (OSError, error.XError, error.ConnectionClosedError)
+        self._keymap = X11Keymap(self._display)
+
+    @staticmethod
+    def available() -> bool:
+        """Whether the optional `python-xlib` dependency is installed."""
+        return find_spec("Xlib") is not None
+
+    def size(self) -> tuple[int, int]:
+        screen = self._display.screen()
+        return screen.width_in_pixels, screen.height_in_pixels
+
+    def position(self) -> tuple[int, int]:
+        with self._lock:
+            pointer = self._root.query_pointer()
+        return pointer.root_x, pointer.root_y
+
+    def screenshot(self) -> Image.Image:
+        from Xlib import X
+
+        width, height = self.size()
+        with self._lock:
+            raw = self._root.get_image(0, 0, width, height, X.ZPixmap, 0xFFFFFFFF)
+        return Image.frombytes("RGB", (width, height), raw.data, "raw", "BGRX")
+
+    def move_to(self, x: int, y: int):
+        from Xlib import X
+
+        self._fake(X.MotionNotify, X.NONE, x=x, y=y)
+        with self._lock:
+            wait_for_pointer(self._root, x, y)
+
+    def mouse_down(self, button: Button = "left"):
+        from Xlib import X
+
+        self._fake(X.ButtonPress, X11_BUTTONS[button])
+
+    def mouse_up(self, button: Button = "left"):
+        from Xlib import X
+
+        self._fake(X.ButtonRelease, X11_BUTTONS[button])
+
+    def click(self, button: Button = "left", clicks: int = 1):
+        for _ in range(clicks):
+            self.mouse_down(button)
+            self.mouse_up(button)
+
+    def key_down(self, key: str):
+        from Xlib import X
+
+        keycode, shift = self._keycode(key)
+        if shift:
+            self._fake(X.KeyPress, self._keycode(SHIFT_KEYSYM)[0])
+        self._fake(X.KeyPress, keycode)
+
+    def key_up(self, key: str):
+        from Xlib import X
+
+        keycode, shift = self._keycode(key)
+        self._fake(X.KeyRelease, keycode)
+        if shift:
+            self._fake(X.KeyRelease, self._keycode(SHIFT_KEYSYM)[0])
+        if keycode == self._keymap.spare_keycode:
+            # unbind it again so the keyboard map is left as it was
+            with self._lock:
+                self._keymap.unbind_spare()
+
+    def write(self, text: str, interval: float = 0.0):
+        for character in text:
+            self.key_down(character)
+            self.key_up(character)
+            if interval:
+                time.sleep(interval)
+
+    def scroll(self, clicks: int, horizontal: bool = False):
+        button = X11_SCROLL_BUTTONS[(horizontal, clicks > 0)]
+        for _ in range(abs(clicks)):
+            self._click_button(button)
+
+    def _click_button(self, button: int):
+        from Xlib import X
+
+        self._fake(X.ButtonPress, button)
+        self._fake(X.ButtonRelease, button)
+
+    def _fake(self, event: int, detail: int, **kwargs):
+        from Xlib.ext import xtest
+
+        with self._lock:
+            xtest.fake_input(self._display, event, detail, **kwargs)
+            self._display.sync()
+
+    def _keycode(self, key: str | int) -> tuple[int, bool]:
+        keysym = key if isinstance(key, int) else X11Keymap.keysym(key)
+        with self._lock:
+            return self._keymap.keycode(keysym)
+
+
+@dataclass(frozen=True)
+class InputEvent:
+    # the name of the backend method, e.g. "click"
+    kind: str
+    args: tuple
+    # the pointer position when the event was sent
+    position: tuple[int, int]
+
+
+FAKE_BACKGROUND = (32, 36, 44)
+FAKE_FOREGROUND = (220, 220, 220)
+FAKE_CLICK_COLORS: dict[Button, tuple[int, int, int]] = {
+    "left": (80, 160, 255),
+    "middle": (120, 220, 120),
+    "right": (255, 140, 60),
+}
+FAKE_LINE_HEIGHT = 14
+# pixels scrolled per scroll click
+FAKE_SCROLL_STEP = 20
+
+
+class FakeBackend(ComputerBackend):
+    """
+    An in-memory framebuffer for running the tools without a display, e.g. to
+    benchmark them. It records every input event in `events` and draws the
+    effects of input deterministically, so the same events always produce the
+    same frames: clicks leave a square, drags a line, typed text is drawn line
+    by line and scrolling shifts the framebuffer.
+    """
+
+    def __init__(self, width: int = 1280, height: int = 800):
+        self.events: list[InputEvent] = []
+        self._size = (width, height)
+        self._framebuffer = Image.new("RGB", self._size, FAKE_BACKGROUND)
+        self._draw = ImageDraw.Draw(self._framebuffer)
+        self._position = (width // 2, height // 2)
+        self._pressed_at: tuple[int, int] | None = None
+        self._text_position = (8, 8)
+        self._lock = threading.Lock()
+
+    def size(self) -> tuple[int, int]:
+        return self._size
+
+    def position(self) -> tuple[int, int]:
+        return self._position
+
+    def screenshot(self) -> Image.Image:
+        with self._lock:
+            frame = self._framebuffer.copy()
+        x, y = self._position
+        # the pointer, as a small cross
+        draw = ImageDraw.Draw(frame)
+        draw.line((x - 4, y, x + 4, y), fill=FAKE_FOREGROUND)
+        draw.line((x, y - 4, x, y + 4), fill=FAKE_FOREGROUND)
+        return frame
+
+    def move_to(self, x: int, y: int):
+        self._record("move_to", x, y)
+        width, height = self._size
+        position = (min(max(x, 0), width - 1), min(max(y, 0), height - 1))
+        if self._pressed_at is not None:
+            with self._lock:
+                self._draw.line((self._position, position), fill=FAKE_FOREGROUND)
+        self._position = position
+
+    def mouse_down(self, button: Button = "left"):
+        self._record("mouse_down", button)
+        self._pressed_at = self._position
+
+    def mouse_up(self, button: Button = "left"):
+        self._record("mouse_up", button)
+        self._pressed_at = None
+
+    def click(self, button: Button = "left", clicks: int = 1):
+        self._record("click", button, clicks)
+        x, y = self._position
+        with self._lock:
+            self._draw.rectangle(
+                (x - 3, y - 3, x + 3, y + 3), fill=FAKE_CLICK_COLORS[button]
+            )
+
+    def key_down(self, key: str):
+        self._record("key_down", key)
+
+    def key_up(self, key: str):
+        self._record("key_up", key)
+
+    def hotkey(self, *keys: str):
+        self._record("hotkey", *keys)
+
+    def write(self, text: str, interval: float = 0.0):
+        self._record("write", text)
+        with self._lock:
+            for line_number, line in enumerate(text.split("\n")):
+                x, y = self._text_position
+                if line_number:
+                    x, y = 8, y + FAKE_LINE_HEIGHT
+                self._draw.text((x, y), line, fill=FAKE_FOREGROUND)
+                self._text_position = (x + round(self._draw.textlength(line)), y)
+
+    def scroll(self, clicks: int, horizontal: bool = False):
+        self._record("scroll", clicks, horizontal)
+        offset = clicks * FAKE_SCROLL_STEP
+        with self._lock:
+            self._framebuffer.paste(
+                ImageChops.offset(
+                    self._framebuffer,
+                    offset if horizontal else 0,
+                    0 if horizontal else offset,
+                )
+            )
+
+    def _record(self, kind: str, *args):
+        self.events.append(InputEvent(kind, args, self._position))
+
+
+BACKENDS: dict[str, Callable[[], ComputerBackend]] = {
+    "pyautogui": PyAutoGUIBackend,
+    # the display in DISPLAY_NUM, like the Linux tools, or else $DISPLAY
+    "x11": lambda: X11Backend(
+        int(os.environ["DISPLAY_NUM"]) if os.getenv("DISPLAY_NUM") else None
+    ),
+    # a screen of WIDTH x HEIGHT pixels
+    "fake": lambda: FakeBackend(
+        int(os.getenv("WIDTH") or 1280), int(os.getenv("HEIGHT") or 800)
+    ),
+}
+
+DEFAULT_BACKEND = "pyautogui"
+
+
+def get_backend(name: str | None = None) -> ComputerBackend:
+    """Create a backend by name, defaulting to the COMPUTER_BACKEND env var."""
+    name = name or os.getenv("COMPUTER_BACKEND") or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown computer backend {name!r}, expected one of: {', '.join(BACKENDS)}"
+        )
+    return BACKENDS[name]()
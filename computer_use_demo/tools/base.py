@@ -19,6 +19,16 @@ class BaseAnthropicTool(metaclass=ABCMeta):
     ) -> BetaToolUnionParam:
         raise NotImplementedError
 
+    def close(self):
+        """Release what the tool holds open, such as connections and threads."""
+
+    def is_read_only(self, tool_input: dict[str, Any]) -> bool:
+        """
+        Whether a call only reads state. Read-only calls may run alongside each
+        other; every other call runs strictly in the order it was scheduled.
+        """
+        return False
+
 
 @dataclass(kw_only=True, frozen=True)
 class ToolResult:
@@ -27,6 +37,11 @@ class ToolResult:
     output: str | None = None
     error: str | None = None
     base64_image: str | None = None
+    # MIME type of base64_image; PNG when unset
+    image_media_type: str | None = None
+    # OCR text of base64_image, sent in its place once the image is evicted from the
+    # history
+    text_layer: str | None = None
     system: str | None = None
 
     def __bool__(self):
@@ -46,6 +61,8 @@ class ToolResult:
             output=combine_fields(self.output, other.output),
             error=combine_fields(self.error, other.error),
             base64_image=combine_fields(self.base64_image, other.base64_image, False),
+            image_media_type=self.image_media_type or other.image_media_type,
+            text_layer=combine_fields(self.text_layer, other.text_layer),
             system=combine_fields(self.system, other.system),
         )
 
@@ -1,5 +1,6 @@
 import asyncio
 import os
+import sys
 from typing import ClassVar, Literal
 
 from anthropic.types.beta import BetaToolBash20241022Param
@@ -123,7 +124,7 @@ class BaseBashTool(BaseAnthropicTool):
     async def __call__(
         self, command: str | None = None, restart: bool = False, **kwargs
     ):
-        print("### Running bash command:", command)
+        print("### Running bash command:", command, file=sys.stderr)
         if restart:
             if self._session:
                 self._session.stop()
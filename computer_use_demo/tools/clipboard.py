@@ -0,0 +1,112 @@
+"""Read and replace the system clipboard through the platform's clipboard commands."""
+
+import asyncio
+import os
+import shutil
+import sys
+
+TIMEOUT = 5.0  # seconds
+
+# X clipboard targets that are plain text, or bookkeeping every owner offers
+X11_TEXT_TARGETS = {
+    "UTF8_STRING",
+    "STRING",
+    "TEXT",
+    "COMPOUND_TEXT",
+    "text/plain",
+    "text/plain;charset=utf-8",
+    "TARGETS",
+    "TIMESTAMP",
+    "MULTIPLE",
+    "SAVE_TARGETS",
+}
+# the macOS clipboard types that are plain text, as `clipboard info` names them
+MACOS_TEXT_TYPES = {"«class utf8»", "«class ut16»", "string", "Unicode text"}
+
+
+class Clipboard:
+    """
+    Uses pbcopy/pbpaste on macOS and xclip or xsel on X11. Only text survives a
+    read and write round trip; other clipboard contents (e.g. images) are lost,
+    so check `holds_only_text()` first.
+    """
+
+    def __init__(self, display_num: int | None = None):
+        self._env = None
+        if display_num is not None:
+            self._env = {**os.environ, "DISPLAY": f":{display_num}"}
+        self._copy, self._paste = _commands()
+
+    def available(self) -> bool:
+        return bool(self._copy)
+
+    async def read(self) -> bytes | None:
+        """The clipboard contents, or None if it is empty or cannot be read."""
+        if not self._paste:
+            return None
+        returncode, stdout = await self._run(self._paste)
+        return stdout if returncode == 0 else None
+
+    async def holds_only_text(self) -> bool:
+        """
+        Whether a read and write round trip leaves the clipboard as it was: it is
+        empty or holds plain text only. False if that cannot be told (e.g. xsel).
+        """
+        if sys.platform == "darwin":
+            returncode, stdout = await self._run(["osascript", "-e", "clipboard info"])
+            if returncode != 0:
+                return False
+            # e.g. "«class utf8», 12, «class ut16», 26, string, 12"
+            types = stdout.decode(errors="replace").strip().split(", ")[::2]
+            return all(type_ in MACOS_TEXT_TYPES for type_ in types if type_)
+        if self._paste[:1] != ["xclip"]:
+            return False
+        returncode, stdout = await self._run(
+            ["xclip", "-selection", "clipboard", "-target", "TARGETS", "-out"]
+        )
+        if returncode != 0:
+            # nothing owns the clipboard
+            return True
+        return set(stdout.decode(errors="replace").split()) <= X11_TEXT_TARGETS
+
+    async def write(self, data: bytes):
+        if not self._copy:
+            raise RuntimeError("No clipboard command is available")
+        returncode, _ = await self._run(self._copy, data)
+        if returncode != 0:
+            raise RuntimeError(f"{self._copy[0]} exited with returncode {returncode}")
+
+    async def _run(self, command: list[str], data: bytes | None = None):
+        # xclip stays in the background to own the selection, so when writing its
+        # stdout must not be a pipe that communicate() would wait on
+        stdout = asyncio.subprocess.PIPE if data is None else asyncio.subprocess.DEVNULL
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE if data is not None else None,
+            stdout=stdout,
+            stderr=asyncio.subprocess.DEVNULL,
+            env=self._env,
+        )
+        try:
+            async with asyncio.timeout(TIMEOUT):
+                stdout, _ = await process.communicate(data)
+        except TimeoutError:
+            process.kill()
+            raise RuntimeError(
+                f"{command[0]} timed out after {TIMEOUT} seconds"
+            ) from None
+        return process.returncode, stdout
+
+
+def _commands() -> tuple[list[str], list[str]]:
+    """The (copy, paste) commands for this platform, empty if there are none."""
+    if sys.platform == "darwin":
+        return ["pbcopy"], ["pbpaste"]
+    if shutil.which("xclip"):
+        return (
+            ["xclip", "-selection", "clipboard", "-in"],
+            ["xclip", "-selection", "clipboard", "-out"],
+        )
+    if shutil.which("xsel"):
+        return ["xsel", "--clipboard", "--input"], ["xsel", "--clipboard", "--output"]
+    return [], []
@@ -1,5 +1,6 @@
 """Collection classes for managing multiple tools."""
 
+import asyncio
 from typing import Any
 
 from anthropic.types.beta import BetaToolUnionParam
@@ -18,12 +19,20 @@ class ToolCollection:
     def __init__(self, *tools: BaseAnthropicTool):
         self.tools = tools
         self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
+        # the last call with side effects, and the read-only calls scheduled after it
+        self._last_write: asyncio.Task[ToolResult] | None = None
+        self._reads: list[asyncio.Task[ToolResult]] = []
 
     def to_params(
         self,
     ) -> list[BetaToolUnionParam]:
         return [tool.to_params() for tool in self.tools]
 
+    def close(self):
+        """Close every tool, at the end of the session."""
+        for tool in self.tools:
+            tool.close()
+
     async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
         tool = self.tool_map.get(name)
         if not tool:
@@ -32,3 +41,40 @@ class ToolCollection:
             return await tool(**tool_input)
         except ToolError as e:
             return ToolFailure(error=e.message)
+
+    def schedule(
+        self, *, name: str, tool_input: dict[str, Any]
+    ) -> asyncio.Task[ToolResult]:
+        """
+        Start a tool call in the background and return its task. Calls with side
+        effects (bash, file edits, computer actions) run one at a time in the order
+        they were scheduled, since e.g. a bash command may run a file that an edit
+        just created. Read-only calls (viewing a file) wait for the calls with side
+        effects scheduled before them, but run alongside each other.
+        """
+        tool = self.tool_map.get(name)
+        read_only = tool is not None and tool.is_read_only(tool_input)
+        previous = [] if read_only else [*self._reads]
+        if self._last_write is not None:
+            previous.append(self._last_write)
+        task = asyncio.create_task(
+            self._run_after(previous, name=name, tool_input=tool_input)
+        )
+        if read_only:
+            self._reads.append(task)
+        else:
+            self._last_write = task
+            self._reads = []
+        return task
+
+    async def _run_after(
+        self,
+        previous: list[asyncio.Task[ToolResult]],
+        *,
+        name: str,
+        tool_input: dict[str, Any],
+    ) -> ToolResult:
+        if previous:
+            # only ordering matters here; the earlier callers handle their own errors
+            await asyncio.wait(previous)
+        return await self.run(name=name, tool_input=tool_input)
@@ -1,16 +1,29 @@
 import asyncio
-import base64
-import io
+import sys
+from collections.abc import Callable
+from concurrent.futures import Future
 from enum import StrEnum
-from typing import Literal, TypedDict
-import pyautogui
+from functools import partial
+from typing import Any, Literal, TypedDict
+
 from anthropic.types.beta import BetaToolComputerUse20241022Param
 
+from .backends import ComputerBackend, get_backend
 from .base import BaseAnthropicTool, ToolError, ToolResult
+from .encoding import EncodingProfile, get_encoding_profile
+from .ocr import TextLayer, recognize_text, tesseract_available
+from .pacing import PacingProfile, Primitive, get_pacing_profile
+from .screenshot_pipeline import EncodedFrame, RegionDiffPolicy, capture_and_encode
 
 OUTPUT_DIR = "/tmp/outputs"
 
-TYPING_DELAY_MS = 12
+UNCHANGED_SCREEN_TEXT = "Screen unchanged since previous screenshot."
+CHANGED_REGION_TEXT = (
+    "Only the changed region of the screen is shown, at x={x}, y={y} "
+    "(width {width}, height {height}). The rest of the screen is unchanged since "
+    "the previous screenshot."
+)
+
 TYPING_GROUP_SIZE = 50
 
 Action = Literal[
@@ -53,9 +66,20 @@ class ComputerTool(BaseAnthropicTool):
     width: int
     height: int
     display_num: int | None
+    encoding: EncodingProfile
+    pacing: PacingProfile
+    backend: ComputerBackend
 
     _screenshot_delay = 1.0
     _scaling_enabled = True
+    # treat frames within this mean grey-level difference as unchanged (0 = exact)
+    _unchanged_screen_tolerance = 0.0
+    # send UNCHANGED_SCREEN_TEXT instead of repeating an unchanged screenshot
+    _report_unchanged_screen = False
+    # set to send only the changed part of the screen when little of it changed
+    _region_diff: RegionDiffPolicy | None = None
+    # attach the text on screen, as recognized by tesseract, to screenshots
+    _text_layer = False
 
     @property
     def options(self) -> ComputerToolOptions:
@@ -68,13 +92,17 @@ class ComputerTool(BaseAnthropicTool):
     def to_params(self) -> BetaToolComputerUse20241022Param:
         return {"name": self.name, "type": self.api_type, **self.options}
 
-    def __init__(self):
+    def __init__(self, backend: ComputerBackend | None = None):
         super().__init__()
 
-        self.width = int(pyautogui.size()[0])
-        self.height = int(pyautogui.size()[1])
+        self.backend = backend or get_backend()
+        self.width, self.height = self.backend.size()
 
-        self.display_num = None  # Not used on MacOS
+        self.display_num = self.backend.display_num  # None for the local screen
+        self.encoding = get_encoding_profile()
+        self.pacing = get_pacing_profile()
+        self._last_frame: EncodedFrame | None = None
+        self._last_text_layer: TextLayer | None = None
 
         MAX_WIDTH = 1280  # Max screenshot width
         if self.width > MAX_WIDTH:
@@ -95,7 +123,8 @@ class ComputerTool(BaseAnthropicTool):
         **kwargs,
     ):
         print(
-            f"### Performing action: {action}{f", text: {text}" if text else ''}{f", coordinate: {coordinate}" if coordinate else ''}"
+            f"### Performing action: {action}{f", text: {text}" if text else ''}{f", coordinate: {coordinate}" if coordinate else ''}",
+            file=sys.stderr,
         )
         if action in ("mouse_move", "left_click_drag"):
             if coordinate is None:
@@ -112,12 +141,12 @@ class ComputerTool(BaseAnthropicTool):
             )
 
             if action == "mouse_move":
-                await asyncio.to_thread(pyautogui.moveTo, x, y)
+                await self._input("move", self.backend.move_to, x, y)
                 return ToolResult(output=f"Mouse moved successfully to X={x}, Y={y}")
             elif action == "left_click_drag":
-                await asyncio.to_thread(pyautogui.mouseDown)
-                await asyncio.to_thread(pyautogui.moveTo, x, y)
-                await asyncio.to_thread(pyautogui.mouseUp)
+                await self._input("click", self.backend.mouse_down)
+                await self._input("move", self.backend.move_to, x, y)
+                await self._input("click", self.backend.mouse_up)
                 return ToolResult(output="Mouse drag action completed.")
 
         if action in ("key", "type"):
@@ -159,12 +188,16 @@ class ComputerTool(BaseAnthropicTool):
                     # Add more special keys as needed
                 }
                 key_sequence = [special_keys.get(key, key) for key in key_sequence]
-                await asyncio.to_thread(pyautogui.hotkey, *key_sequence)
+                await self._input("key", self.backend.hotkey, *key_sequence)
                 return ToolResult(output=f"Key combination '{text}' pressed.")
             elif action == "type":
-                await asyncio.to_thread(
-                    pyautogui.write, text, interval=TYPING_DELAY_MS / 1000.0
-                )
+                for chunk in chunks(text, TYPING_GROUP_SIZE):
+                    await self._input(
+                        "key",
+                        self.backend.write,
+                        chunk,
+                        interval=self.pacing.typing_interval,
+                    )
                 return ToolResult(output=f"Typed text: {text}")
 
         if action in (
@@ -182,37 +215,84 @@ class ComputerTool(BaseAnthropicTool):
             if action == "screenshot":
                 return await self.screenshot()
             elif action == "cursor_position":
-                x, y = pyautogui.position()
-                x, y = self.scale_coordinates(ScalingSource.COMPUTER, int(x), int(y))
+                x, y = await asyncio.to_thread(self.backend.position)
+                x, y = self.scale_coordinates(ScalingSource.COMPUTER, x, y)
                 return ToolResult(output=f"X={x},Y={y}")
             else:
                 if action == "left_click":
-                    await asyncio.to_thread(pyautogui.click, button="left")
+                    await self._input("click", self.backend.click, "left")
                     return ToolResult(output="Left click performed.")
                 elif action == "right_click":
-                    await asyncio.to_thread(pyautogui.click, button="right")
+                    await self._input("click", self.backend.click, "right")
                     return ToolResult(output="Right click performed.")
                 elif action == "double_click":
-                    await asyncio.to_thread(pyautogui.doubleClick)
+                    await self._input("click", self.backend.click, clicks=2)
                     return ToolResult(output="Double click performed.")
 
         raise ToolError(f"Invalid action: {action}")
 
+    async def _input(
+        self, primitive: Primitive, function: Callable[..., Any], *args, **kwargs
+    ):
+        """Run a backend input call off the event loop, paced by the pacing profile."""
+        step = self.pacing.step(
+            primitive,
+            partial(function, *args, **kwargs),
+            self.backend.failsafe_triggered,
+        )
+        return await asyncio.to_thread(step)
+
     async def screenshot(self):
         """Take a screenshot of the current screen and return the base64 encoded image."""
-        # Capture screenshot using PyAutoGUI
-        screenshot = await asyncio.to_thread(pyautogui.screenshot)
-
+        size = None
         if self._scaling_enabled and self.scale_factor < 1.0:
-            screenshot = screenshot.resize((self.target_width, self.target_height))
-
-        img_buffer = io.BytesIO()
-        # Save the image to an in-memory buffer
-        screenshot.save(img_buffer, format="PNG", optimize=True)
-        img_buffer.seek(0)
-        base64_image = base64.b64encode(img_buffer.read()).decode()
+            size = (self.target_width, self.target_height)
+
+        ocr: list[Future[TextLayer | None]] = []
+
+        def capture():
+            image = self.backend.screenshot()
+            if self._text_layer and tesseract_available():
+                # at full resolution, while the frame is resized and encoded
+                ocr.append(recognize_text(image, size))
+            return image
+
+        # Capture through the backend, then resize and encode off the event loop
+        frame = await capture_and_encode(
+            capture,
+            size,
+            self.encoding,
+            previous=self._last_frame,
+            tolerance=self._unchanged_screen_tolerance,
+            region_diff=self._region_diff,
+        )
+        self._last_frame = frame
+        if ocr and frame.unchanged:
+            ocr[0].cancel()
+        elif ocr:
+            self._last_text_layer = await asyncio.wrap_future(ocr[0])
+        # a repeated crop would not tell the model anything about the rest of the screen
+        if frame.unchanged and (
+            self._report_unchanged_screen or self._region_diff is not None
+        ):
+            return ToolResult(output=UNCHANGED_SCREEN_TEXT)
 
-        return ToolResult(base64_image=base64_image)
+        output = None
+        if frame.region is not None:
+            left, top, right, bottom = frame.region
+            output = CHANGED_REGION_TEXT.format(
+                x=left, y=top, width=right - left, height=bottom - top
+            )
+        return ToolResult(
+            output=output,
+            base64_image=frame.base64_image,
+            image_media_type=frame.media_type,
+            text_layer=(
+                self._last_text_layer.render(frame.region)
+                if self._text_layer and self._last_text_layer
+                else None
+            ),
+        )
 
     def scale_coordinates(self, source: ScalingSource, x: int, y: int):
         """Scale coordinates between the assistant's coordinate system and the real screen coordinates."""
@@ -1,16 +1,38 @@
 import asyncio
-import base64
-import io
+import sys
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future
+from contextlib import suppress
+from dataclasses import replace
 from enum import StrEnum
-from typing import Literal, TypedDict, cast, get_args
-import pyautogui
+from functools import partial
+from typing import Any, Literal, TypedDict, cast, get_args
 from anthropic.types.beta import BetaToolComputerUse20241022Param, BetaToolUnionParam
 
+from .backends import ComputerBackend, get_backend
 from .base import BaseAnthropicTool, ToolError, ToolResult
+from .clipboard import Clipboard
+from .encoding import EncodingProfile, get_encoding_profile
+from .frame_grabber import Frame, FrameGrabber
+from .input_worker import InputStep, input_worker
+from .ocr import TextLayer, recognize_text, tesseract_available
+from .pacing import PacingProfile, Primitive, get_pacing_profile
+from .screenshot_pipeline import EncodedFrame, RegionDiffPolicy, capture_and_encode
 
 OUTPUT_DIR = "/tmp/outputs"
 
-TYPING_DELAY_MS = 12
+UNCHANGED_SCREEN_TEXT = "Screen unchanged since previous screenshot."
+CHANGED_REGION_TEXT = (
+    "Only the changed region of the screen is shown, at x={x}, y={y} "
+    "(width {width}, height {height}). The rest of the screen is unchanged since "
+    "the previous screenshot."
+)
+ZOOM_TEXT = (
+    "Zoomed in on x={left}, y={top} to x={right}, y={bottom} of the screenshot. "
+    "The pixel at (px, py) in this image is at x={left} + px * {x_scale:.4g}, "
+    "y={top} + py * {y_scale:.4g} in screenshot coordinates."
+)
+
 TYPING_GROUP_SIZE = 50
 
 Action_20241022 = Literal[
@@ -38,6 +60,8 @@ Action_20250124 = (
     ]
 )
 
+Action_20251124 = Action_20250124 | Literal["zoom"]
+
 ScrollDirection = Literal["up", "down", "left", "right"]
 
 
@@ -54,6 +78,14 @@ MAX_SCALING_TARGETS: dict[str, Resolution] = {
     "FWXGA": Resolution(width=1366, height=768),  # ~16:9
 }
 
+# smaller targets, for when screenshots only need to show the layout and the
+# details are read with the zoom action (ComputerTool20251124)
+COARSE_SCALING_TARGETS: dict[str, Resolution] = {
+    "SVGA": Resolution(width=800, height=600),  # 4:3
+    "WVGA": Resolution(width=768, height=480),  # 16:10
+    "FWVGA": Resolution(width=854, height=480),  # ~16:9
+}
+
 
 class ScalingSource(StrEnum):
     COMPUTER = "computer"
@@ -74,16 +106,37 @@ class BaseComputerToolMacOS:
     """
     A tool that allows the agent to interact with the screen, keyboard, and mouse of the current computer.
     The tool parameters are defined by Anthropic and are not editable.
-    MacOS-specific implementation using PyAutoGUI.
+    Input and capture go through a `ComputerBackend`, the local screen through
+    PyAutoGUI by default.
     """
 
     name: Literal["computer"] = "computer"
     width: int
     height: int
     display_num: int | None
+    encoding: EncodingProfile
+    pacing: PacingProfile
+    backend: ComputerBackend
 
     _screenshot_delay = 1.0
     _scaling_enabled = True
+    # e.g. COARSE_SCALING_TARGETS, to send smaller screenshots and zoom for details
+    _scaling_targets = MAX_SCALING_TARGETS
+    # treat frames within this mean grey-level difference as unchanged (0 = exact)
+    _unchanged_screen_tolerance = 0.0
+    # send UNCHANGED_SCREEN_TEXT instead of repeating an unchanged screenshot
+    _report_unchanged_screen = False
+    # set to send only the changed part of the screen when little of it changed
+    _region_diff: RegionDiffPolicy | None = None
+    # set to capture in the background at this rate, so that a screenshot with no
+    # input since the last captured frame does not need a capture of its own
+    _frame_grabber_fps: float | None = None
+    # type text at least this long by pasting it through the clipboard (None = never)
+    _paste_min_length: int | None = 200
+    # how long the application gets to read the clipboard before it is restored
+    _paste_restore_delay = 0.2
+    # attach the text on screen, as recognized by tesseract, to screenshots
+    _text_layer = False
 
     @property
     def options(self) -> ComputerToolOptions:
@@ -96,12 +149,35 @@ class BaseComputerToolMacOS:
             "display_number": self.display_num,
         }
 
-    def __init__(self):
+    def __init__(self, backend: ComputerBackend | None = None):
         super().__init__()
 
-        self.width = int(pyautogui.size()[0])
-        self.height = int(pyautogui.size()[1])
-        self.display_num = None  # Not used on MacOS
+        self.backend = backend or get_backend()
+        self.width, self.height = self.backend.size()
+        self.display_num = self.backend.display_num  # None for the local screen
+        self.encoding = get_encoding_profile()
+        self.pacing = get_pacing_profile()
+        self._last_frame: EncodedFrame | None = None
+        self._grabber = (
+            FrameGrabber(
+                self.backend.screenshot,
+                fps=self._frame_grabber_fps,
+                capture_errors=self.backend.capture_errors,
+            )
+            if self._frame_grabber_fps
+            else None
+        )
+        self._last_grabbed: Frame | None = None
+        self._last_text_layer: TextLayer | None = None
+        self._input_worker = input_worker(self.display_num)
+
+    def close(self):
+        """
+        Stop the frame grabber. The input worker is shared by every tool on the
+        display, so it keeps running.
+        """
+        if self._grabber is not None:
+            self._grabber.close()
 
     async def __call__(
         self,
@@ -112,7 +188,8 @@ class BaseComputerToolMacOS:
         **kwargs,
     ):
         print(
-            f"### Performing action: {action}{f", text: {text}" if text else ''}{f", coordinate: {coordinate}" if coordinate else ''}"
+            f"### Performing action: {action}{f", text: {text}" if text else ''}{f", coordinate: {coordinate}" if coordinate else ''}",
+            file=sys.stderr,
         )
         if action in ("mouse_move", "left_click_drag"):
             if coordinate is None:
@@ -123,12 +200,14 @@ class BaseComputerToolMacOS:
             x, y = self.validate_and_get_coordinates(coordinate)
 
             if action == "mouse_move":
-                await asyncio.to_thread(pyautogui.moveTo, x, y)
+                await self._input(self._step("move", self.backend.move_to, x, y))
                 return ToolResult(output=f"Mouse moved successfully to X={x}, Y={y}")
             elif action == "left_click_drag":
-                await asyncio.to_thread(pyautogui.mouseDown)
-                await asyncio.to_thread(pyautogui.moveTo, x, y)
-                await asyncio.to_thread(pyautogui.mouseUp)
+                await self._input(
+                    self._step("click", self.backend.mouse_down),
+                    self._step("move", self.backend.move_to, x, y),
+                    cleanup=[self.backend.mouse_up],
+                )
                 return ToolResult(output="Mouse drag action completed.")
 
         if action in ("key", "type"):
@@ -169,12 +248,30 @@ class BaseComputerToolMacOS:
                     "right": "right",
                 }
                 key_sequence = [special_keys.get(key, key) for key in key_sequence]
-                await asyncio.to_thread(pyautogui.hotkey, *key_sequence)
+                await self._input(self._step("key", self.backend.hotkey, *key_sequence))
                 return ToolResult(output=f"Key combination '{text}' pressed.")
             elif action == "type":
-                await asyncio.to_thread(
-                    pyautogui.write, text, interval=TYPING_DELAY_MS / 1000.0
-                )
+                if not (
+                    self._paste_min_length is not None
+                    and len(text) >= self._paste_min_length
+                    # control characters are typed as keys, e.g. \n as Return,
+                    # which pasting them would not do
+                    and text.isprintable()
+                    and await self._paste(text)
+                ):
+                    # one step per chunk, so the fail-safe is checked while typing
+                    # long text and not only before it
+                    await self._input(
+                        *(
+                            self._step(
+                                "key",
+                                self.backend.write,
+                                chunk,
+                                interval=self.pacing.typing_interval,
+                            )
+                            for chunk in chunks(text, TYPING_GROUP_SIZE)
+                        )
+                    )
                 return ToolResult(output=f"Typed text: {text}")
 
         if action in (
@@ -193,25 +290,77 @@ class BaseComputerToolMacOS:
             if action == "screenshot":
                 return await self.screenshot()
             elif action == "cursor_position":
-                x, y = pyautogui.position()
-                x, y = self.scale_coordinates(ScalingSource.COMPUTER, int(x), int(y))
+                x, y = await self._input_worker.run(self.backend.position)
+                x, y = self.scale_coordinates(ScalingSource.COMPUTER, x, y)
                 return ToolResult(output=f"X={x},Y={y}")
             else:
                 if action == "left_click":
-                    await asyncio.to_thread(pyautogui.click, button="left")
+                    await self._input(self._step("click", self.backend.click, "left"))
                     return ToolResult(output="Left click performed.")
                 elif action == "right_click":
-                    await asyncio.to_thread(pyautogui.click, button="right")
+                    await self._input(self._step("click", self.backend.click, "right"))
                     return ToolResult(output="Right click performed.")
                 elif action == "middle_click":
-                    await asyncio.to_thread(pyautogui.click, button="middle")
+                    await self._input(self._step("click", self.backend.click, "middle"))
                     return ToolResult(output="Middle click performed.")
                 elif action == "double_click":
-                    await asyncio.to_thread(pyautogui.doubleClick)
+                    await self._input(self._step("click", self.backend.click, clicks=2))
                     return ToolResult(output="Double click performed.")
 
         raise ToolError(f"Invalid action: {action}")
 
+    async def _input(self, *steps: InputStep, cleanup: Sequence[InputStep] = ()):
+        """Run a plan of backend input calls on the display's input worker."""
+        try:
+            return await self._input_worker.run(*steps, cleanup=cleanup)
+        except ValueError as e:
+            # e.g. a key name the backend has no key for
+            raise ToolError(str(e)) from None
+        finally:
+            if self._grabber is not None:
+                self._grabber.mark_stale()
+
+    def _step(
+        self, primitive: Primitive, function: Callable[..., Any], *args, **kwargs
+    ) -> InputStep:
+        """Wrap a backend call as an input step paced by the pacing profile."""
+        return self.pacing.step(
+            primitive,
+            partial(function, *args, **kwargs),
+            self.backend.failsafe_triggered,
+        )
+
+    def _release_keys(self, key: str | None) -> list[InputStep]:
+        return [partial(self.backend.key_up, key)] if key else []
+
+    async def _paste(self, text: str) -> bool:
+        """
+        Type `text` in constant time by pasting it, then restore the previous
+        clipboard. Returns False, having done nothing, if the clipboard is unusable
+        or holds something other than text, which restoring it would lose.
+        """
+        clipboard = Clipboard(self.display_num)
+        if not clipboard.available():
+            return False
+        try:
+            if not await clipboard.holds_only_text():
+                return False
+            previous = await clipboard.read()
+            await clipboard.write(text.encode())
+        except RuntimeError:
+            return False
+        try:
+            await self._input(
+                self._step("key", self.backend.hotkey, *self.backend.paste_keys)
+            )
+            # the application reads the clipboard asynchronously
+            await asyncio.sleep(self._paste_restore_delay)
+        finally:
+            if previous is not None:
+                with suppress(RuntimeError):
+                    await clipboard.write(previous)
+        return True
+
     def validate_and_get_coordinates(self, coordinate: tuple[int, int] | None = None):
         if not isinstance(coordinate, list) or len(coordinate) != 2:
             raise ToolError(f"{coordinate} must be a list of length 2")
@@ -222,23 +371,128 @@ class BaseComputerToolMacOS:
 
     async def screenshot(self):
         """Take a screenshot of the current screen and return the base64 encoded image."""
-        # Capture screenshot using PyAutoGUI
-        screenshot = await asyncio.to_thread(pyautogui.screenshot)
-
         # Scale if needed
         width, height = self.scale_coordinates(
             ScalingSource.COMPUTER, self.width, self.height
         )
+        size = None
         if self._scaling_enabled and (width != self.width or height != self.height):
-            screenshot = screenshot.resize((width, height))
-
-        img_buffer = io.BytesIO()
-        # Save the image to an in-memory buffer
-        screenshot.save(img_buffer, format="PNG", optimize=True)
-        img_buffer.seek(0)
-        base64_image = base64.b64encode(img_buffer.read()).decode()
+            size = (width, height)
+
+        grabbed = await self._grabber.fresh_frame() if self._grabber else None
+        ocr: list[Future[TextLayer | None]] = []
+        if (
+            grabbed is not None
+            and self._last_grabbed is not None
+            and grabbed.digest == self._last_grabbed.digest
+            and self._last_frame is not None
+        ):
+            # the screen has not changed since the frame of the last screenshot
+            frame = replace(self._last_frame, unchanged=True)
+        else:
+            source = (lambda: grabbed.image) if grabbed else self.backend.screenshot
+
+            def capture():
+                image = source()
+                if self._text_layer and tesseract_available():
+                    # at full resolution, while the frame is resized and encoded
+                    ocr.append(recognize_text(image, (width, height)))
+                return image
+
+            # Capture through the backend (or take the grabbed frame), then resize
+            # and encode off the event loop
+            frame = await capture_and_encode(
+                capture,
+                size,
+                self.encoding,
+                previous=self._last_frame,
+                tolerance=self._unchanged_screen_tolerance,
+                region_diff=self._region_diff,
+            )
+            self._last_grabbed = grabbed
+        self._last_frame = frame
+        if ocr and frame.unchanged:
+            ocr[0].cancel()
+        elif ocr:
+            self._last_text_layer = await asyncio.wrap_future(ocr[0])
+        # a repeated crop would not tell the model anything about the rest of the screen
+        if frame.unchanged and (
+            self._report_unchanged_screen or self._region_diff is not None
+        ):
+            return ToolResult(output=UNCHANGED_SCREEN_TEXT)
+
+        output = None
+        if frame.region is not None:
+            left, top, right, bottom = frame.region
+            output = CHANGED_REGION_TEXT.format(
+                x=left, y=top, width=right - left, height=bottom - top
+            )
+        return ToolResult(
+            output=output,
+            base64_image=frame.base64_image,
+            image_media_type=frame.media_type,
+            text_layer=(
+                self._last_text_layer.render(frame.region)
+                if self._text_layer and self._last_text_layer
+                else None
+            ),
+        )
 
-        return ToolResult(base64_image=base64_image)
+    async def zoom(self, region: tuple[int, int, int, int]):
+        """
+        Capture `region` (left, top, right, bottom in screenshot coordinates) at the
+        screen's native resolution, so that small text stays legible. The crop is
+        only scaled down if it would be larger than a regular screenshot.
+        """
+        if (
+            not isinstance(region, (list, tuple))
+            or len(region) != 4
+            or not all(isinstance(i, int) and i >= 0 for i in region)
+        ):
+            raise ToolError(f"{region=} must be a list of 4 non-negative integers")
+        x0, y0, x1, y1 = region
+        if x0 >= x1 or y0 >= y1:
+            raise ToolError(f"{region=} must be [left, top, right, bottom]")
+        width, height = self.scale_coordinates(
+            ScalingSource.COMPUTER, self.width, self.height
+        )
+        if x1 > width or y1 > height:
+            raise ToolError(f"{region=} is out of bounds")
+        left, top = self.scale_coordinates(ScalingSource.API, x0, y0)
+        right, bottom = self.scale_coordinates(ScalingSource.API, x1, y1)
+        crop_size: list[tuple[int, int]] = []
+
+        def capture():
+            image = self.backend.screenshot()
+            # a screenshot can have more pixels than the screen has points, e.g. on
+            # Retina displays
+            x_ratio, y_ratio = image.width / self.width, image.height / self.height
+            image = image.crop(
+                (
+                    round(left * x_ratio),
+                    round(top * y_ratio),
+                    round(right * x_ratio),
+                    round(bottom * y_ratio),
+                )
+            )
+            image.thumbnail((width, height))
+            crop_size.append(image.size)
+            return image
+
+        frame = await capture_and_encode(capture, None, self.encoding)
+        crop_width, crop_height = crop_size[0]
+        return ToolResult(
+            output=ZOOM_TEXT.format(
+                left=x0,
+                top=y0,
+                right=x1,
+                bottom=y1,
+                x_scale=(x1 - x0) / crop_width,
+                y_scale=(y1 - y0) / crop_height,
+            ),
+            base64_image=frame.base64_image,
+            image_media_type=frame.media_type,
+        )
 
     def scale_coordinates(self, source: ScalingSource, x: int, y: int):
         """Scale coordinates to a target maximum resolution."""
@@ -246,7 +500,7 @@ class BaseComputerToolMacOS:
             return x, y
         ratio = self.width / self.height
         target_dimension = None
-        for dimension in MAX_SCALING_TARGETS.values():
+        for dimension in self._scaling_targets.values():
             # allow some error in the aspect ratio - not all ratios are exactly 16:9
             if abs(dimension["width"] / dimension["height"] - ratio) < 0.02:
                 if dimension["width"] < self.width:
@@ -298,10 +552,10 @@ class ComputerTool20250124(BaseComputerToolMacOS, BaseAnthropicTool):
             if coordinate is not None:
                 raise ToolError(f"coordinate is not accepted for {action=}.")
             if action == "left_mouse_down":
-                await asyncio.to_thread(pyautogui.mouseDown)
+                await self._input(self._step("click", self.backend.mouse_down))
                 return ToolResult(output="Left mouse button down.")
             else:
-                await asyncio.to_thread(pyautogui.mouseUp)
+                await self._input(self._step("click", self.backend.mouse_up))
                 return ToolResult(output="Left mouse button up.")
 
         if action == "scroll":
@@ -314,14 +568,15 @@ class ComputerTool20250124(BaseComputerToolMacOS, BaseAnthropicTool):
             if not isinstance(scroll_amount, int) or scroll_amount < 0:
                 raise ToolError(f"{scroll_amount=} must be a non-negative int")
 
+            steps: list[InputStep] = []
             # Move to coordinate if provided
             if coordinate is not None:
                 x, y = self.validate_and_get_coordinates(coordinate)
-                await asyncio.to_thread(pyautogui.moveTo, x, y)
+                steps.append(self._step("move", self.backend.move_to, x, y))
 
-            # Press modifier key if provided
+            # Press modifier key if provided, and release it afterwards
             if key:
-                await asyncio.to_thread(pyautogui.keyDown, key)
+                steps.append(self._step("key", self.backend.key_down, key))
 
             # Perform scroll - PyAutoGUI scroll is in opposite direction convention
             scroll_map = {
@@ -331,13 +586,22 @@ class ComputerTool20250124(BaseComputerToolMacOS, BaseAnthropicTool):
                 "right": -scroll_amount,
             }
             if scroll_direction in ("up", "down"):
-                await asyncio.to_thread(pyautogui.scroll, scroll_map[scroll_direction])
+                steps.append(
+                    self._step(
+                        "scroll", self.backend.scroll, scroll_map[scroll_direction]
+                    )
+                )
             else:
-                await asyncio.to_thread(pyautogui.hscroll, scroll_map[scroll_direction])
+                steps.append(
+                    self._step(
+                        "scroll",
+                        self.backend.scroll,
+                        scroll_map[scroll_direction],
+                        horizontal=True,
+                    )
+                )
 
-            # Release modifier key if provided
-            if key:
-                await asyncio.to_thread(pyautogui.keyUp, key)
+            await self._input(*steps, cleanup=self._release_keys(key))
 
             return ToolResult(output=f"Scrolled {scroll_direction} {scroll_amount} units.")
 
@@ -352,9 +616,11 @@ class ComputerTool20250124(BaseComputerToolMacOS, BaseAnthropicTool):
             if action == "hold_key":
                 if text is None:
                     raise ToolError(f"text is required for {action}")
-                await asyncio.to_thread(pyautogui.keyDown, text)
-                await asyncio.sleep(duration)
-                await asyncio.to_thread(pyautogui.keyUp, text)
+                await self._input(self._step("key", self.backend.key_down, text))
+                try:
+                    await asyncio.sleep(duration)
+                finally:
+                    await self._input(self._step("key", self.backend.key_up, text))
                 return ToolResult(output=f"Held key '{text}' for {duration} seconds.")
 
             if action == "wait":
@@ -364,20 +630,18 @@ class ComputerTool20250124(BaseComputerToolMacOS, BaseAnthropicTool):
         if action == "triple_click":
             if text is not None:
                 raise ToolError(f"text is not accepted for {action}")
+            steps = []
             # Move to coordinate if provided
             if coordinate is not None:
                 x, y = self.validate_and_get_coordinates(coordinate)
-                await asyncio.to_thread(pyautogui.moveTo, x, y)
+                steps.append(self._step("move", self.backend.move_to, x, y))
 
-            # Press modifier key if provided
+            # Press modifier key if provided, and release it afterwards
             if key:
-                await asyncio.to_thread(pyautogui.keyDown, key)
-
-            await asyncio.to_thread(pyautogui.click, clicks=3)
+                steps.append(self._step("key", self.backend.key_down, key))
 
-            # Release modifier key if provided
-            if key:
-                await asyncio.to_thread(pyautogui.keyUp, key)
+            steps.append(self._step("click", self.backend.click, clicks=3))
+            await self._input(*steps, cleanup=self._release_keys(key))
 
             return ToolResult(output="Triple click performed.")
 
@@ -389,31 +653,64 @@ class ComputerTool20250124(BaseComputerToolMacOS, BaseAnthropicTool):
         ):
             if text is not None:
                 raise ToolError(f"text is not accepted for {action}")
+            steps = []
             # Move to coordinate if provided
             if coordinate is not None:
                 x, y = self.validate_and_get_coordinates(coordinate)
-                await asyncio.to_thread(pyautogui.moveTo, x, y)
+                steps.append(self._step("move", self.backend.move_to, x, y))
 
-            # Press modifier key if provided
+            # Press modifier key if provided, and release it afterwards
             if key:
-                await asyncio.to_thread(pyautogui.keyDown, key)
+                steps.append(self._step("key", self.backend.key_down, key))
 
             # Perform click
             if action == "left_click":
-                await asyncio.to_thread(pyautogui.click, button="left")
+                steps.append(self._step("click", self.backend.click, "left"))
             elif action == "right_click":
-                await asyncio.to_thread(pyautogui.click, button="right")
+                steps.append(self._step("click", self.backend.click, "right"))
             elif action == "middle_click":
-                await asyncio.to_thread(pyautogui.click, button="middle")
+                steps.append(self._step("click", self.backend.click, "middle"))
             elif action == "double_click":
-                await asyncio.to_thread(pyautogui.doubleClick)
+                steps.append(self._step("click", self.backend.click, clicks=2))
 
-            # Release modifier key if provided
-            if key:
-                await asyncio.to_thread(pyautogui.keyUp, key)
+            await self._input(*steps, cleanup=self._release_keys(key))
 
             return ToolResult(output=f"{action.replace('_', ' ').title()} performed.")
 
         return await super().__call__(
             action=action, text=text, coordinate=coordinate, key=key, **kwargs
         )
+
+
+class ComputerTool20251124(ComputerTool20250124):
+    """
+    Adds the zoom action. Since the model can read details with it, screenshots
+    are scaled down to the smaller COARSE_SCALING_TARGETS.
+    """
+
+    api_type: Literal["computer_20251124"] = "computer_20251124"  # type: ignore
+    _scaling_targets = COARSE_SCALING_TARGETS
+
+    def to_params(self):
+        return cast(
+            BetaToolUnionParam,
+            {
+                "name": self.name,
+                "type": self.api_type,
+                "enable_zoom": True,
+                **self.options,
+            },
+        )
+
+    async def __call__(
+        self,
+        *,
+        action: Action_20251124,
+        region: tuple[int, int, int, int] | None = None,
+        **kwargs,
+    ):
+        if action == "zoom":
+            if region is None:
+                raise ToolError(f"region is required for {action}")
+            return await self.zoom(region)
+        return await super().__call__(action=action, **kwargs)
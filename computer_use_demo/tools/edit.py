@@ -71,6 +71,9 @@ class BaseEditTool(BaseAnthropicTool):
             f'Unrecognized command {command}. The allowed commands for the {self.name} tool are: {", ".join(get_args(Command))}'
         )
 
+    def is_read_only(self, tool_input: dict[str, Any]) -> bool:
+        return tool_input.get("command") == "view"
+
     def validate_path(self, command: str, path: Path):
         """
         Check that the path/command combination is valid.
@@ -0,0 +1,82 @@
+"""Named profiles for encoding screenshots before they are sent to the API."""
+
+import io
+import os
+from dataclasses import dataclass
+from typing import Literal
+
+from PIL import Image
+
+ImageFormat = Literal["PNG", "JPEG", "WEBP"]
+
+MEDIA_TYPES: dict[ImageFormat, str] = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+
+@dataclass(frozen=True, kw_only=True)
+class EncodingProfile:
+    """How a screenshot is turned into bytes: format, compression and colour reduction."""
+
+    format: ImageFormat
+    # zlib level for PNG, 0 (fastest) to 9 (smallest)
+    compress_level: int | None = None
+    # run PNG's extra optimization pass, which is slow for large screenshots
+    optimize: bool = False
+    # lossy quality for JPEG and WebP, 1 to 100
+    quality: int | None = None
+    # quantize to an adaptive palette with this many colours
+    palette_colors: int | None = None
+    grayscale: bool = False
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+    def encode(self, image: Image.Image) -> bytes:
+        if self.grayscale:
+            image = image.convert("L")
+        elif self.palette_colors:
+            image = image.convert("RGB").quantize(
+                colors=self.palette_colors, method=Image.Quantize.FASTOCTREE
+            )
+        if self.format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        save_kwargs: dict[str, int | bool] = {}
+        if self.compress_level is not None:
+            save_kwargs["compress_level"] = self.compress_level
+        if self.optimize:
+            save_kwargs["optimize"] = True
+        if self.quality is not None:
+            save_kwargs["quality"] = self.quality
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=self.format, **save_kwargs)
+        return buffer.getvalue()
+
+
+ENCODING_PROFILES: dict[str, EncodingProfile] = {
+    # the original behaviour: smallest lossless output, but slow to encode
+    "png-optimized": EncodingProfile(format="PNG", optimize=True),
+    "png": EncodingProfile(format="PNG", compress_level=6),
+    "png-fast": EncodingProfile(format="PNG", compress_level=1),
+    "palette": EncodingProfile(format="PNG", compress_level=6, palette_colors=256),
+    "grayscale": EncodingProfile(format="PNG", compress_level=6, grayscale=True),
+    "jpeg": EncodingProfile(format="JPEG", quality=80),
+    "webp": EncodingProfile(format="WEBP", quality=80),
+}
+
+DEFAULT_ENCODING_PROFILE = "png"
+
+
+def get_encoding_profile(name: str | None = None) -> EncodingProfile:
+    """Look up a profile by name, defaulting to the SCREENSHOT_ENCODING env var."""
+    name = name or os.getenv("SCREENSHOT_ENCODING") or DEFAULT_ENCODING_PROFILE
+    if name not in ENCODING_PROFILES:
+        raise ValueError(
+            f"Unknown screenshot encoding {name!r}, expected one of: {', '.join(ENCODING_PROFILES)}"
+        )
+    return ENCODING_PROFILES[name]
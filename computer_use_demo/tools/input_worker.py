@@ -0,0 +1,54 @@
+"""A dedicated thread per display that runs every input call for it, in order."""
+
+import asyncio
+import threading
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+InputStep = Callable[[], Any]
+
+
+class InputWorker:
+    """
+    Runs input plans, i.e. sequences of input calls such as move + modifiers +
+    click, on one long-lived thread. Plans submitted from any event loop or thread
+    run one at a time in submission order, and a whole plan costs a single thread
+    handoff instead of one per call.
+    """
+
+    def __init__(self, name: str = "input"):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    async def run(self, *steps: InputStep, cleanup: Sequence[InputStep] = ()) -> Any:
+        """
+        Run `steps` in order, stopping at the first that raises, then run `cleanup`
+        (e.g. releasing held modifiers) either way. Returns the last step's result.
+        """
+        return await asyncio.wrap_future(
+            self._executor.submit(_run_plan, steps, cleanup)
+        )
+
+
+def _run_plan(steps: Sequence[InputStep], cleanup: Sequence[InputStep]) -> Any:
+    result = None
+    try:
+        for step in steps:
+            result = step()
+    finally:
+        for step in cleanup:
+            step()
+    return result
+
+
+_workers: dict[int | None, InputWorker] = {}
+_workers_lock = threading.Lock()
+
+
+def input_worker(display_num: int | None = None) -> InputWorker:
+    """The process-wide input worker for a display, shared by all tools using it."""
+    with _workers_lock:
+        if display_num not in _workers:
+            suffix = "" if display_num is None else f":{display_num}"
+            _workers[display_num] = InputWorker(f"input{suffix}")
+        return _workers[display_num]
@@ -0,0 +1,143 @@
+"""
+Local OCR of screenshots with the tesseract binary, for a compact text layer that
+is sent in place of a screenshot once it is evicted from the history.
+
+Recognition runs on a small dedicated thread pool shared by every computer tool in
+the process, so it overlaps with encoding the frame it was captured from.
+"""
+
+import io
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image
+
+MAX_OCR_WORKERS = 2
+TESSERACT_TIMEOUT = 30.0  # seconds
+# words tesseract is less sure of than this (0-100) are dropped as noise
+MIN_CONFIDENCE = 40
+MAX_WORDS = 2000
+
+TEXT_LAYER_HEADER = (
+    "Text on the screen, recognized by OCR. One line per line of text, each word "
+    "as word@x,y,width,height in screenshot coordinates:"
+)
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Word:
+    text: str
+    # (left, top, width, height) in screenshot coordinates
+    box: tuple[int, int, int, int]
+
+
+@dataclass(frozen=True)
+class TextLayer:
+    # the recognized words grouped into lines, in reading order
+    lines: tuple[tuple[Word, ...], ...]
+
+    def render(self, region: tuple[int, int, int, int] | None = None) -> str | None:
+        """
+        The text layer as text, optionally only the words overlapping `region`
+        (left, top, right, bottom). None if there are no words.
+        """
+        rendered = []
+        for line in self.lines:
+            words = [
+                f"{word.text}@{','.join(map(str, word.box))}"
+                for word in line
+                if region is None or _overlaps(word.box, region)
+            ]
+            if words:
+                rendered.append(" ".join(words))
+        if not rendered:
+            return None
+        return TEXT_LAYER_HEADER + "\n" + "\n".join(rendered)
+
+
+def tesseract_available() -> bool:
+    return shutil.which("tesseract") is not None
+
+
+def recognize_text(
+    image: Image.Image, size: tuple[int, int] | None = None
+) -> "Future[TextLayer | None]":
+    """
+    Start recognizing the text in `image` on the OCR pool. Word boxes are scaled to
+    `size`, the size the screenshot is sent at, if given. The future resolves to
+    None if tesseract fails.
+    """
+    return _get_executor().submit(_recognize, image, size)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=MAX_OCR_WORKERS, thread_name_prefix="ocr"
+            )
+        return _executor
+
+
+def _recognize(image: Image.Image, size: tuple[int, int] | None) -> TextLayer | None:
+    # tesseract works on grey levels anyway, and a fast PNG is quicker to hand over
+    buffer = io.BytesIO()
+    image.convert("L").save(buffer, format="PNG", compress_level=1)
+    try:
+        process = subprocess.run(
+            # sparse text: screens are mostly short labels rather than paragraphs
+            ["tesseract", "stdin", "stdout", "--psm", "11", "tsv"],
+            input=buffer.getvalue(),
+            check=False,
+            capture_output=True,
+            timeout=TESSERACT_TIMEOUT,
+            # the pool already runs recognitions in parallel
+            env={**os.environ, "OMP_THREAD_LIMIT": "1"},
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if process.returncode != 0:
+        return None
+
+    x_scale = size[0] / image.width if size else 1.0
+    y_scale = size[1] / image.height if size else 1.0
+    lines: dict[tuple[str, ...], list[Word]] = {}
+    word_count = 0
+    for row in process.stdout.decode(errors="replace").splitlines()[1:]:
+        # level, page, block, paragraph, line, word, left, top, width, height,
+        # confidence, text
+        columns = row.split("\t")
+        if len(columns) != 12 or columns[0] != "5" or not columns[11].strip():
+            continue
+        if float(columns[10]) < MIN_CONFIDENCE:
+            continue
+        left, top, width, height = map(int, columns[6:10])
+        box = (
+            round(left * x_scale),
+            round(top * y_scale),
+            max(1, round(width * x_scale)),
+            max(1, round(height * y_scale)),
+        )
+        lines.setdefault(tuple(columns[1:5]), []).append(Word(columns[11].strip(), box))
+        word_count += 1
+        if word_count >= MAX_WORDS:
+            break
+    return TextLayer(tuple(tuple(words) for words in lines.values()))
+
+
+def _overlaps(box: tuple[int, int, int, int], region: tuple[int, int, int, int]):
+    left, top, width, height = box
+    return (
+        left < region[2]
+        and top < region[3]
+        and left + width > region[0]
+        and top + height > region[1]
+    )
@@ -0,0 +1,90 @@
+"""Named pacing profiles: how long input waits after each kind of primitive."""
+
+import os
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Literal
+
+from .input_worker import InputStep
+
+Primitive = Literal["move", "click", "key", "scroll"]
+
+
+class FailSafeError(Exception):
+    """Raised instead of sending input while the fail-safe is triggered."""
+
+
+FAILSAFE_MESSAGE = (
+    "Fail-safe triggered from the mouse moving to a corner of the screen. "
+    "Use a pacing profile with failsafe=False to disable it."
+)
+
+
+@dataclass(frozen=True, kw_only=True)
+class PacingProfile:
+    """
+    Minimum delays, in seconds, after each kind of input primitive. They replace
+    PyAutoGUI's global PAUSE, which sleeps the same 0.1 s after every call.
+    """
+
+    move: float
+    click: float
+    key: float
+    scroll: float
+    # between the characters of typed text
+    typing_interval: float
+    # refuse to send input while the pointer is in a screen corner, so that a
+    # person can stop the agent by moving the mouse there (PyAutoGUI's FAILSAFE)
+    failsafe: bool = True
+
+    def step(
+        self,
+        primitive: Primitive,
+        function: InputStep,
+        failsafe_triggered: Callable[[], bool] | None = None,
+    ) -> InputStep:
+        """
+        Wrap an input call as a step paced for `primitive`, which first checks
+        `failsafe_triggered` if the profile has the fail-safe enabled.
+        """
+        delay: float = getattr(self, primitive)
+
+        def paced_step():
+            if self.failsafe and failsafe_triggered and failsafe_triggered():
+                raise FailSafeError(FAILSAFE_MESSAGE)
+            result = function()
+            if delay:
+                time.sleep(delay)
+            return result
+
+        return paced_step
+
+
+PACING_PROFILES: dict[str, PacingProfile] = {
+    "fast": PacingProfile(
+        move=0.0, click=0.05, key=0.01, scroll=0.05, typing_interval=0.005
+    ),
+    "standard": PacingProfile(
+        move=0.02, click=0.1, key=0.02, scroll=0.1, typing_interval=0.012
+    ),
+    "human": PacingProfile(
+        move=0.15, click=0.25, key=0.08, scroll=0.2, typing_interval=0.05
+    ),
+    # for applications that drop input sent faster than they can redraw
+    "flaky-app": PacingProfile(
+        move=0.1, click=0.5, key=0.2, scroll=0.4, typing_interval=0.03
+    ),
+}
+
+DEFAULT_PACING_PROFILE = "standard"
+
+
+def get_pacing_profile(name: str | None = None) -> PacingProfile:
+    """Look up a profile by name, defaulting to the INPUT_PACING env var."""
+    name = name or os.getenv("INPUT_PACING") or DEFAULT_PACING_PROFILE
+    if name not in PACING_PROFILES:
+        raise ValueError(
+            f"Unknown input pacing {name!r}, expected one of: {', '.join(PACING_PROFILES)}"
+        )
+    return PACING_PROFILES[name]
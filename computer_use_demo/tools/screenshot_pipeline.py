@@ -0,0 +1,249 @@
+"""
+Screenshot processing that runs off the event loop, shared by every computer tool
+in the process.
+
+A screenshot goes through capture -> resize -> encode -> base64. Capture runs on
+the default executor, like the other pyautogui calls; the CPU-bound stages run on a
+small dedicated thread pool. PIL's resize and image encoders release the GIL, so
+frames from different sessions are processed in parallel, and they are handed
+between stages by reference without copying the pixel buffer. At most
+`MAX_FRAMES_IN_FLIGHT` screenshots are in progress at once; further callers wait
+before capturing, so full-resolution frames cannot pile up in memory.
+
+Each frame is fingerprinted before encoding. When it matches the previous frame of
+the same tool, the previous encoded bytes are reused and encoding is skipped. With
+a `RegionDiffPolicy`, a frame that differs from the previous one only in a small
+area is sent as a crop of that area instead of the whole screen.
+"""
+
+import asyncio
+import base64
+import hashlib
+import threading
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+
+import numpy as np
+from PIL import Image, ImageChops, ImageStat
+
+from .encoding import EncodingProfile
+
+MAX_ENCODE_WORKERS = 2
+MAX_FRAMES_IN_FLIGHT = 4
+# frames are compared at this width when a tolerance is given
+THUMBNAIL_WIDTH = 128
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+class FrameSlots:
+    """
+    A semaphore for coroutines on any event loop: a released slot is handed to the
+    longest waiting coroutine through that coroutine's own loop.
+    """
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._value > 0:
+                self._value -= 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # the slot was handed over as the wait was cancelled
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._value += 1
+                return
+            loop, future = self._waiters.popleft()
+        try:
+            loop.call_soon_threadsafe(self._hand_over, future)
+        except RuntimeError:
+            # the waiter's event loop has been closed
+            self.release()
+
+    def _hand_over(self, future: asyncio.Future):
+        if future.done():
+            # cancelled before the slot arrived
+            self.release()
+        else:
+            future.set_result(None)
+
+
+_frame_slots = FrameSlots(MAX_FRAMES_IN_FLIGHT)
+
+
+@dataclass(frozen=True, kw_only=True)
+class RegionDiffPolicy:
+    """When to send only the changed part of a frame instead of the whole frame."""
+
+    # send a full frame at least once every this many frames
+    full_frame_interval: int = 5
+    # send a full frame when the changed area covers more than this share of it
+    max_area_fraction: float = 0.5
+    # pixels of unchanged context kept around the changed area
+    margin: int = 16
+
+
+@dataclass(frozen=True)
+class EncodedFrame:
+    base64_image: str
+    media_type: str
+    digest: bytes
+    thumbnail: Image.Image | None = None
+    # True when this is `previous` reused because the screen had not changed
+    unchanged: bool = False
+    # (left, top, right, bottom) of the crop in `base64_image`, None for full frames
+    region: tuple[int, int, int, int] | None = None
+    # the resized frame, kept to diff the next frame against
+    pixels: Image.Image | None = None
+    frames_since_full: int = 0
+
+
+async def capture_and_encode(
+    capture: Callable[[], Image.Image],
+    size: tuple[int, int] | None,
+    encoding: EncodingProfile,
+    previous: EncodedFrame | None = None,
+    tolerance: float = 0.0,
+    region_diff: RegionDiffPolicy | None = None,
+) -> EncodedFrame:
+    """
+    Capture a frame, resize it to `size` if given, and encode it. If the frame is
+    identical to `previous` (or, with a `tolerance`, differs from it by at most that
+    mean grey level on a small thumbnail) `previous` is returned marked unchanged.
+    With `region_diff`, only the bounding box of the pixels that changed since
+    `previous` is encoded, as allowed by the policy.
+    """
+    await _frame_slots.acquire()
+    try:
+        image = await asyncio.to_thread(capture)
+        return await asyncio.get_running_loop().run_in_executor(
+            _get_executor(),
+            _resize_and_encode,
+            image,
+            size,
+            encoding,
+            previous,
+            tolerance,
+            region_diff,
+        )
+    finally:
+        _frame_slots.release()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=MAX_ENCODE_WORKERS, thread_name_prefix="screenshot-encode"
+            )
+        return _executor
+
+
+def _resize_and_encode(
+    image: Image.Image,
+    size: tuple[int, int] | None,
+    encoding: EncodingProfile,
+    previous: EncodedFrame | None,
+    tolerance: float,
+    region_diff: RegionDiffPolicy | None,
+) -> EncodedFrame:
+    if size is not None and image.size != size:
+        image = image.resize(size)
+
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16).digest()
+    thumbnail = None
+    if tolerance > 0:
+        thumbnail = image.convert("L").resize(
+            (THUMBNAIL_WIDTH, max(1, THUMBNAIL_WIDTH * image.height // image.width)),
+            Image.Resampling.BOX,
+        )
+    if (
+        previous is not None
+        and previous.media_type == encoding.media_type
+        and (
+            previous.digest == digest
+            or (
+                thumbnail is not None
+                and previous.thumbnail is not None
+                and _mean_difference(previous.thumbnail, thumbnail) <= tolerance
+            )
+        )
+    ):
+        return replace(previous, unchanged=True)
+
+    region = None
+    frames_since_full = 0
+    if (
+        region_diff is not None
+        and previous is not None
+        and previous.pixels is not None
+        and previous.frames_since_full + 1 < region_diff.full_frame_interval
+    ):
+        region = _changed_region(previous.pixels, image, region_diff)
+        if region is not None:
+            frames_since_full = previous.frames_since_full + 1
+
+    return EncodedFrame(
+        base64_image=base64.b64encode(
+            encoding.encode(image.crop(region) if region else image)
+        ).decode(),
+        media_type=encoding.media_type,
+        digest=digest,
+        thumbnail=thumbnail,
+        region=region,
+        pixels=image if region_diff is not None else None,
+        frames_since_full=frames_since_full,
+    )
+
+
+def _changed_region(
+    before: Image.Image, after: Image.Image, policy: RegionDiffPolicy
+) -> tuple[int, int, int, int] | None:
+    """The padded bounding box of the changed pixels, or None to send a full frame."""
+    if before.size != after.size or before.mode != after.mode:
+        return None
+    changed = np.asarray(before) != np.asarray(after)
+    if changed.ndim == 3:
+        changed = changed.any(axis=2)
+    rows = np.flatnonzero(changed.any(axis=1))
+    columns = np.flatnonzero(changed.any(axis=0))
+    if not rows.size:
+        return None
+
+    width, height = after.size
+    left = max(0, int(columns[0]) - policy.margin)
+    top = max(0, int(rows[0]) - policy.margin)
+    right = min(width, int(columns[-1]) + 1 + policy.margin)
+    bottom = min(height, int(rows[-1]) + 1 + policy.margin)
+    if (right - left) * (bottom - top) > policy.max_area_fraction * width * height:
+        return None
+    return left, top, right, bottom
+
+
+def _mean_difference(a: Image.Image, b: Image.Image) -> float:
+    if a.size != b.size:
+        return float("inf")
+    return ImageStat.Stat(ImageChops.difference(a, b)).mean[0]
@@ -0,0 +1,139 @@
+"""The X keyboard map and pointer sync behind the XTEST input of the computer tools."""
+
+import time
+from typing import Any
+
+# key names that differ from the X keysym names: PyAutoGUI's, and xdotool's names
+# for the modifiers, as used in the model's key combinations
+KEY_NAMES = {
+    "ctrl": "Control_L",
+    "control": "Control_L",
+    "ctrlleft": "Control_L",
+    "ctrlright": "Control_R",
+    "alt": "Alt_L",
+    "altleft": "Alt_L",
+    "altright": "Alt_R",
+    "option": "Alt_L",
+    "shift": "Shift_L",
+    "shiftleft": "Shift_L",
+    "shiftright": "Shift_R",
+    "meta": "Meta_L",
+    "command": "Super_L",
+    "cmd": "Super_L",
+    "win": "Super_L",
+    "super": "Super_L",
+    "enter": "Return",
+    "return": "Return",
+    "\n": "Return",
+    "\r": "Return",
+    "esc": "Escape",
+    "escape": "Escape",
+    "tab": "Tab",
+    "\t": "Tab",
+    "space": "space",
+    " ": "space",
+    "backspace": "BackSpace",
+    "\b": "BackSpace",
+    "delete": "Delete",
+    "del": "Delete",
+    "insert": "Insert",
+    "home": "Home",
+    "end": "End",
+    "pageup": "Prior",
+    "pgup": "Prior",
+    "pagedown": "Next",
+    "pgdn": "Next",
+    "up": "Up",
+    "down": "Down",
+    "left": "Left",
+    "right": "Right",
+    "capslock": "Caps_Lock",
+    "printscreen": "Print",
+}
+
+SHIFT_KEYSYM = 0xFFE1  # XK_Shift_L
+
+POINTER_SYNC_TIMEOUT = 0.5  # seconds
+POINTER_SYNC_POLL_INTERVAL = 0.001  # seconds
+
+
+class X11Keymap:
+    """
+    The keysym -> keycode table of an X display, read once. Keysyms the keyboard
+    map cannot produce are bound to a spare keycode for one key press, as xdotool
+    does; `unbind_spare()` leaves the keyboard map as it was again.
+
+    Not thread-safe: callers serialize their use of the display.
+    """
+
+    def __init__(self, display: Any):
+        self._display = display
+        # keysym -> (keycode, needs shift)
+        self._keycodes: dict[int, tuple[int, bool]] = {}
+        self.spare_keycode: int | None = None
+        info = display.display.info
+        first, count = info.min_keycode, info.max_keycode - info.min_keycode + 1
+        for offset, keysyms in enumerate(display.get_keyboard_mapping(first, count)):
+            keycode = first + offset
+            if not any(keysyms):
+                self.spare_keycode = self.spare_keycode or keycode
+                continue
+            # the first two columns are the unshifted and shifted keysyms
+            for index, keysym in enumerate(keysyms[:2]):
+                if keysym and keysym not in self._keycodes:
+                    self._keycodes[keysym] = (keycode, index == 1)
+
+    @staticmethod
+    def keysym(name: str) -> int:
+        """The keysym for a key name (`ctrl`, `Page_Down`, `f5`) or a character."""
+        from Xlib import XK
+
+        name = KEY_NAMES.get(name.lower() if len(name) > 1 else name, name)
+        keysym = XK.string_to_keysym(name)
+        if not keysym and len(name) > 1:
+            # e.g. f5 -> F5
+            keysym = XK.string_to_keysym(name.capitalize())
+        if not keysym and len(name) == 1:
+            keysym = character_keysym(name)
+        if not keysym:
+            raise ValueError(f"Unknown key name {name!r}")
+        return keysym
+
+    def keycode(self, keysym: int) -> tuple[int, bool]:
+        """The keycode producing `keysym` and whether it needs shift."""
+        if keysym in self._keycodes:
+            return self._keycodes[keysym]
+        if self.spare_keycode is None:
+            raise ValueError(f"No keycode available for keysym {keysym:#x}")
+        # bind the keysym to the spare keycode until the key is released
+        self._display.change_keyboard_mapping(self.spare_keycode, [(keysym, keysym)])
+        self._display.sync()
+        return self.spare_keycode, False
+
+    def unbind_spare(self):
+        if self.spare_keycode is not None:
+            self._display.change_keyboard_mapping(self.spare_keycode, [(0, 0)])
+            self._display.sync()
+
+
+def character_keysym(character: str) -> int:
+    """The keysym X defines for a character: Latin-1 directly, else Unicode."""
+    codepoint = ord(character)
+    if 0x20 <= codepoint <= 0x7E or 0xA0 <= codepoint <= 0xFF:
+        return codepoint
+    return 0x01000000 | codepoint
+
+
+def wait_for_pointer(root: Any, x: int, y: int) -> bool:
+    """
+    Wait until the server reports the pointer at (`x`, `y`), the equivalent of
+    `xdotool mousemove --sync`. False if it is not there within the timeout.
+    """
+    deadline = time.monotonic() + POINTER_SYNC_TIMEOUT
+    while True:
+        pointer = root.query_pointer()
+        if (pointer.root_x, pointer.root_y) == (x, y):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(POINTER_SYNC_POLL_INTERVAL)
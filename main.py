@@ -1,26 +1,43 @@
+import argparse
 import asyncio
 import os
 import sys
 import json
 import base64
+import time
+from typing import Any, TextIO
 
 import httpx
-from computer_use_demo.loop import sampling_loop, APIProvider
+from anthropic import AnthropicError
+from anthropic.types.beta import BetaMessage
+from computer_use_demo.loop import sampling_loop, make_client, APIProvider
+from computer_use_demo.ratelimit import Priority
 from computer_use_demo.tools import ToolResult
+from computer_use_demo.tools.backends import DEFAULT_BACKEND
 
+MODEL = "claude-sonnet-4-5-20250929"
 
-async def main():
+# backends that give every session a screen of its own
+PER_SESSION_BACKENDS = {"fake"}
+
+
+def get_api_key():
     # Set up your Anthropic API key and model
     api_key = os.getenv("ANTHROPIC_API_KEY", "YOUR_API_KEY_HERE")
     if not api_key or api_key.startswith("YOUR_API_KEY"):
         raise ValueError(
             "Please first set your API key in the ANTHROPIC_API_KEY environment variable"
         )
+    return api_key
+
+
+async def main(instruction_args: list[str]):
+    api_key = get_api_key()
     provider = APIProvider.ANTHROPIC
 
     # Check if the instruction is provided via command line arguments
-    if len(sys.argv) > 1:
-        instruction = " ".join(sys.argv[1:])
+    if instruction_args:
+        instruction = " ".join(instruction_args)
     else:
         instruction = "Save an image of a cat to the desktop."
 
@@ -52,9 +69,11 @@ async def main():
             # Save the image to a file if needed
             os.makedirs("screenshots", exist_ok=True)
             image_data = result.base64_image
-            with open(f"screenshots/screenshot_{tool_use_id}.png", "wb") as f:
+            extension = (result.image_media_type or "image/png").split("/")[-1]
+            filename = f"screenshot_{tool_use_id}.{extension}"
+            with open(f"screenshots/{filename}", "wb") as f:
                 f.write(base64.b64decode(image_data))
-            print(f"Took screenshot screenshot_{tool_use_id}.png")
+            print(f"Took screenshot {filename}")
 
     def api_response_callback(
         request: httpx.Request,
@@ -77,7 +96,7 @@ async def main():
 
     # Run the sampling loop with Claude 4.5 Sonnet
     messages = await sampling_loop(
-        model="claude-sonnet-4-5-20250929",
+        model=MODEL,
         provider=provider,
         system_prompt_suffix="",
         messages=messages,
@@ -93,8 +112,155 @@ async def main():
     )
 
 
+def without_images(value: Any) -> Any:
+    """A copy of a message history with the base64 data of every image left out."""
+    if isinstance(value, list):
+        return [without_images(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if value.get("type") == "image":
+        return {
+            "type": "image",
+            "media_type": value.get("source", {}).get("media_type"),
+        }
+    return {key: without_images(item) for key, item in value.items()}
+
+
+async def run_batch(instructions: list[str], concurrency: int, output: TextIO):
+    """
+    Run each instruction in its own session, `concurrency` at a time, and write one
+    JSON record per finished task to `output`. Screenshots are left out of the
+    recorded messages.
+    """
+    backend = os.getenv("COMPUTER_BACKEND") or DEFAULT_BACKEND
+    if concurrency > 1 and backend not in PER_SESSION_BACKENDS:
+        raise ValueError(
+            f"The {backend!r} backend drives one screen for every session, run the"
+            " batch with --concurrency 1 or with COMPUTER_BACKEND=fake"
+        )
+    api_key = get_api_key()
+    provider = APIProvider.ANTHROPIC
+    # one client for every session so they share its connection pool
+    client = make_client(provider, api_key)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_task(index: int, instruction: str):
+        usage: dict[str, int] = {}
+        turns = 0
+        # sampling_loop reports API errors through the callback and then returns
+        api_error: str | None = None
+
+        def api_response_callback(
+            request: httpx.Request,
+            response: httpx.Response | object | None,
+            error: Exception | None,
+        ):
+            nonlocal turns, api_error
+            if error:
+                print(f"!!! Task {index} API Error: {error}", file=sys.stderr)
+                api_error = f"{error.__class__.__name__}: {error}"
+                return
+            if isinstance(response, BetaMessage):
+                response_usage = response.usage.model_dump()
+            elif isinstance(response, httpx.Response):
+                response_usage = response.json().get("usage", {})
+            else:
+                return
+            turns += 1
+            for key, value in response_usage.items():
+                if isinstance(value, int):
+                    usage[key] = usage.get(key, 0) + value
+
+        async with semaphore:
+            start = time.monotonic()
+            messages = [{"role": "user", "content": instruction}]
+            error = None
+            try:
+                messages = await sampling_loop(
+                    model=MODEL,
+                    provider=provider,
+                    system_prompt_suffix="",
+                    messages=messages,
+                    output_callback=lambda content_block: None,
+                    tool_output_callback=lambda result, tool_use_id: None,
+                    api_response_callback=api_response_callback,
+                    api_key=api_key,
+                    only_n_most_recent_images=10,
+                    max_tokens=16384,
+                    tool_version="computer_use_20250124",
+                    client=client,
+                    priority=Priority.BATCH,
+                )
+            except (AnthropicError, httpx.HTTPError, OSError, RuntimeError) as e:
+                error = f"{e.__class__.__name__}: {e}"
+            record = {
+                "task": index,
+                "instruction": instruction,
+                "messages": without_images(messages),
+                "turns": turns,
+                "usage": usage,
+                "wall_time": round(time.monotonic() - start, 3),
+                "error": error or api_error,
+            }
+        output.write(json.dumps(record, default=str) + "\n")
+        output.flush()
+
+    try:
+        await asyncio.gather(
+            *(
+                run_task(index, instruction)
+                for index, instruction in enumerate(instructions)
+            )
+        )
+    finally:
+        await client.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Let Claude control this computer to carry out an instruction."
+    )
+    parser.add_argument("instruction", nargs="*", help="instruction for Claude")
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="run one instruction per line of FILE ('-' for stdin) and emit JSONL",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="number of batch tasks to run at once (default: 1)",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="FILE",
+        help="append batch results to FILE (default: stdout)",
+    )
+    return parser.parse_args()
+
+
+def read_instructions(path: str) -> list[str]:
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip()]
+
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        asyncio.run(main())
+        if args.batch:
+            instructions = read_instructions(args.batch)
+            concurrency = max(args.concurrency, 1)
+            if args.output:
+                with open(args.output, "a") as output:
+                    asyncio.run(run_batch(instructions, concurrency, output))
+            else:
+                asyncio.run(run_batch(instructions, concurrency, sys.stdout))
+        else:
+            asyncio.run(main(args.instruction))
     except Exception as e:
         print(f"Encountered Error:\n{e}")
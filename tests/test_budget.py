@@ -0,0 +1,149 @@
+import base64
+import io
+
+from PIL import Image
+
+from computer_use_demo.budget import (
+    RequestBudget,
+    RunningRequestSize,
+    enforce_budget,
+    estimate_request_size,
+    image_dimensions,
+)
+from computer_use_demo.history import ImageIndex
+
+SYSTEM = [{"type": "text", "text": "You are a helpful assistant."}]
+TOOLS = [{"name": "computer", "type": "computer_20250124"}]
+
+
+def encode(width: int, height: int, image_format: str = "PNG") -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format=image_format)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def screenshot_turn(data: str) -> list:
+    return [
+        {"role": "assistant", "content": [{"type": "text", "text": "Looking."}]},
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "tool_result",
+                    "tool_use_id": "toolu_1",
+                    "content": [
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": "image/png",
+                                "data": data,
+                            },
+                        }
+                    ],
+                }
+            ],
+        },
+    ]
+
+
+def session(turns: int, width: int = 1280, height: int = 800) -> list:
+    messages: list = [{"role": "user", "content": "Open the settings."}]
+    for _ in range(turns):
+        messages.extend(screenshot_turn(encode(width, height)))
+    return messages
+
+
+def images(messages: list) -> list[tuple[int, int]]:
+    return [
+        image_dimensions(block["source"]["data"])
+        for message in messages
+        if isinstance(message["content"], list)
+        for result in message["content"]
+        if result["type"] == "tool_result"
+        for block in result["content"]
+    ]
+
+
+def test_image_dimensions_from_the_header():
+    assert image_dimensions(encode(320, 200)) == (320, 200)
+    jpeg = encode(1280, 800, "JPEG")
+    # only the header is needed
+    assert image_dimensions(jpeg[:20_000]) == (1280, 800)
+    assert image_dimensions("not an image") == (0, 0)
+
+
+def test_running_size_tracks_appends_and_evictions():
+    messages = session(3)
+    request_size = RunningRequestSize(messages[:3], system=SYSTEM, tools=TOOLS)
+    index = ImageIndex(messages[:3], on_evict=request_size.remove_block)
+    for message in messages[3:]:
+        request_size.add(message)
+        index.add(message)
+    index.evict_oldest(1)
+
+    full = estimate_request_size(messages, system=SYSTEM, tools=TOOLS)
+    assert request_size.size.input_tokens == full.input_tokens
+    assert abs(request_size.size.request_bytes - full.request_bytes) <= 2
+
+
+def test_budget_downscales_old_images_before_evicting():
+    messages = session(3)
+    request_size = RunningRequestSize(messages, system=SYSTEM, tools=TOOLS)
+    index = ImageIndex(messages, on_evict=request_size.remove_block)
+    budget = RequestBudget(max_input_tokens=request_size.size.input_tokens - 1000)
+
+    size = enforce_budget(request_size, index, budget)
+    assert not size.exceeds(budget)
+    assert len(index) == 3
+    assert images(messages) == [(640, 400), (1280, 800), (1280, 800)]
+
+
+def test_budget_evicts_when_downscaling_is_not_enough():
+    messages = session(3)
+    request_size = RunningRequestSize(messages, system=SYSTEM, tools=TOOLS)
+    index = ImageIndex(messages, on_evict=request_size.remove_block)
+    budget = RequestBudget(max_input_tokens=1500)
+
+    size = enforce_budget(request_size, index, budget)
+    assert not size.exceeds(budget)
+    # the most recent screenshot is always kept at full size
+    assert images(messages) == [(1280, 800)]
+    full = estimate_request_size(messages, system=SYSTEM, tools=TOOLS)
+    assert size.input_tokens == full.input_tokens
+    assert abs(size.request_bytes - full.request_bytes) <= 2
+
+
+def test_budget_without_downscaling_only_evicts():
+    messages = session(3)
+    request_size = RunningRequestSize(messages, system=SYSTEM, tools=TOOLS)
+    index = ImageIndex(messages, on_evict=request_size.remove_block)
+    budget = RequestBudget(
+        max_input_tokens=request_size.size.input_tokens - 1000, downscale_factor=None
+    )
+
+    enforce_budget(request_size, index, budget)
+    assert images(messages) == [(1280, 800), (1280, 800)]
+
+
+def test_evicted_screenshots_leave_their_text_layer_behind():
+    messages = session(3)
+    for turn, message in enumerate(messages[2::2]):
+        message["content"][0]["tool_use_id"] = f"toolu_{turn}"
+    text_layer = {"type": "text", "text": "Settings@10,10,60,12"}
+    text_layers = {"toolu_0": text_layer}
+    request_size = RunningRequestSize(messages, system=SYSTEM, tools=TOOLS)
+    index = ImageIndex(
+        messages,
+        on_evict=request_size.remove_block,
+        on_insert=request_size.add_block,
+        stand_ins=text_layers,
+    )
+
+    index.evict_oldest(2)
+    assert messages[2]["content"][0]["content"] == [text_layer]
+    assert messages[4]["content"][0]["content"] == []
+    assert text_layers == {}
+    full = estimate_request_size(messages, system=SYSTEM, tools=TOOLS)
+    assert request_size.size.input_tokens == full.input_tokens
+    assert abs(request_size.size.request_bytes - full.request_bytes) <= 2
@@ -0,0 +1,98 @@
+import asyncio
+from typing import Any
+
+from computer_use_demo.tools import ToolCollection
+from computer_use_demo.tools.base import BaseAnthropicTool, ToolResult
+
+
+class RecordingTool(BaseAnthropicTool):
+    """Records when each call starts and ends; `view` calls are read-only."""
+
+    def __init__(self, name: str, log: list[str]):
+        self.name = name
+        self.log = log
+
+    async def __call__(self, *, command: str, delay: float = 0.01, **kwargs):
+        self.log.append(f"start {self.name} {command}")
+        await asyncio.sleep(delay)
+        self.log.append(f"end {self.name} {command}")
+        return ToolResult(output=command)
+
+    def to_params(self) -> Any:
+        return {"name": self.name, "type": "custom"}
+
+    def is_read_only(self, tool_input: dict[str, Any]) -> bool:
+        return tool_input.get("command") == "view"
+
+    def close(self):
+        self.log.append(f"close {self.name}")
+
+
+def run_calls(calls: list[tuple[str, str, float]]) -> list[str]:
+    log: list[str] = []
+    collection = ToolCollection(RecordingTool("edit", log), RecordingTool("bash", log))
+
+    async def main():
+        tasks = [
+            collection.schedule(
+                name=name, tool_input={"command": command, "delay": delay}
+            )
+            for name, command, delay in calls
+        ]
+        return [result.output for result in await asyncio.gather(*tasks)]
+
+    assert asyncio.run(main()) == [command for _, command, _ in calls]
+    return log
+
+
+def test_calls_with_side_effects_run_in_order_across_tools():
+    log = run_calls(
+        [("edit", "create", 0.05), ("bash", "run", 0.01), ("edit", "str_replace", 0)]
+    )
+    assert log == [
+        "start edit create",
+        "end edit create",
+        "start bash run",
+        "end bash run",
+        "start edit str_replace",
+        "end edit str_replace",
+    ]
+
+
+def test_reads_run_together_after_earlier_writes():
+    log = run_calls(
+        [("edit", "create", 0.02), ("edit", "view", 0.05), ("edit", "view", 0.01)]
+    )
+    assert log[:2] == ["start edit create", "end edit create"]
+    # both views start before either ends
+    assert log[2:4] == ["start edit view", "start edit view"]
+
+
+def test_writes_wait_for_earlier_reads():
+    log = run_calls([("edit", "view", 0.05), ("bash", "run", 0)])
+    assert log == [
+        "start edit view",
+        "end edit view",
+        "start bash run",
+        "end bash run",
+    ]
+
+
+def test_unknown_tools_fail_without_blocking_later_calls():
+    log: list[str] = []
+    collection = ToolCollection(RecordingTool("bash", log))
+
+    async def main():
+        missing = collection.schedule(name="missing", tool_input={})
+        ran = collection.schedule(name="bash", tool_input={"command": "run"})
+        return await missing, await ran
+
+    missing, ran = asyncio.run(main())
+    assert missing.error == "Tool missing is invalid"
+    assert ran.output == "run"
+
+
+def test_close_closes_every_tool():
+    log: list[str] = []
+    ToolCollection(RecordingTool("edit", log), RecordingTool("bash", log)).close()
+    assert log == ["close edit", "close bash"]
@@ -0,0 +1,205 @@
+import asyncio
+import base64
+import io
+import sys
+from concurrent.futures import Future
+
+import pytest
+from PIL import Image
+
+from computer_use_demo.tools import (
+    TOOL_GROUPS_BY_VERSION,
+    ComputerTool,
+    ComputerTool20250124,
+    ComputerTool20251124,
+    computer_macos,
+)
+from computer_use_demo.tools.backends import FakeBackend, get_backend
+from computer_use_demo.tools.base import ToolError
+from computer_use_demo.tools.computer_macos import TYPING_GROUP_SIZE
+from computer_use_demo.tools.ocr import TextLayer, Word
+from computer_use_demo.tools.pacing import FailSafeError, get_pacing_profile
+
+
+class CornerAfterFirstWrite(FakeBackend):
+    """A person moves the mouse into a corner while the first chunk is typed."""
+
+    def write(self, text: str, interval: float = 0.0):
+        super().write(text, interval)
+        self.move_to(0, 0)
+
+
+def make_tool(backend: FakeBackend, tool_class=ComputerTool20250124):
+    tool = tool_class(backend)
+    tool.pacing = get_pacing_profile("fast")
+    if hasattr(tool, "_paste_min_length"):
+        tool._paste_min_length = None
+    return tool
+
+
+def test_failsafe_stops_long_typing_between_chunks():
+    backend = CornerAfterFirstWrite()
+    tool = make_tool(backend)
+    with pytest.raises(FailSafeError):
+        asyncio.run(tool(action="type", text="x" * (3 * TYPING_GROUP_SIZE)))
+    writes = [event.args[0] for event in backend.events if event.kind == "write"]
+    assert writes == ["x" * TYPING_GROUP_SIZE]
+
+
+ACTIONS = [
+    {"action": "mouse_move", "coordinate": [100, 100]},
+    {"action": "left_click"},
+    {"action": "type", "text": "hello\nworld"},
+    {"action": "key", "text": "ctrl+a"},
+    {"action": "left_click_drag", "coordinate": [400, 300]},
+]
+
+
+def run_actions(tool_class) -> tuple[FakeBackend, Image.Image]:
+    backend = FakeBackend(1280, 800)
+    tool = make_tool(backend, tool_class)
+
+    async def main():
+        for action in ACTIONS:
+            await tool(**action)
+        return await tool(action="screenshot")
+
+    result = asyncio.run(main())
+    assert result.base64_image is not None
+    image = Image.open(io.BytesIO(base64.b64decode(result.base64_image)))
+    return backend, image
+
+
+def test_get_backend_by_name(monkeypatch):
+    monkeypatch.setenv("WIDTH", "640")
+    monkeypatch.setenv("HEIGHT", "480")
+    assert get_backend("fake").size() == (640, 480)
+    monkeypatch.setenv("COMPUTER_BACKEND", "fake")
+    assert isinstance(get_backend(), FakeBackend)
+    with pytest.raises(ValueError):
+        get_backend("bogus")
+
+
+@pytest.mark.parametrize("tool_class", [ComputerTool, ComputerTool20250124])
+def test_actions_reach_the_backend(tool_class):
+    backend, image = run_actions(tool_class)
+    kinds = [event.kind for event in backend.events]
+    assert kinds[:2] == ["move_to", "click"]
+    assert "write" in kinds
+    assert kinds[-3:] == ["mouse_down", "move_to", "mouse_up"]
+    assert backend.position() == (400, 300)
+    assert image.size == (1280, 800)
+
+
+@pytest.mark.parametrize("tool_class", [ComputerTool, ComputerTool20250124])
+def test_screenshots_are_deterministic(tool_class):
+    _, first = run_actions(tool_class)
+    _, second = run_actions(tool_class)
+    assert first.tobytes() == second.tobytes()
+    # the input was drawn onto the otherwise uniform screen
+    assert len(first.getcolors(maxcolors=1 << 16) or ()) > 1
+
+
+@pytest.mark.parametrize("tool_class", [ComputerTool, ComputerTool20250124])
+def test_failsafe_refuses_input_with_the_pointer_in_a_corner(tool_class):
+    backend = FakeBackend()
+    tool = make_tool(backend, tool_class)
+    backend.move_to(0, 0)
+    with pytest.raises(FailSafeError):
+        asyncio.run(tool(action="left_click"))
+    assert [event.kind for event in backend.events] == ["move_to"]
+
+
+class GrabbingTool(ComputerTool20250124):
+    _frame_grabber_fps = 5
+
+
+def test_typing_marks_grabbed_frames_stale():
+    tool = make_tool(FakeBackend(), GrabbingTool)
+    try:
+        generation = tool._grabber._generation
+        asyncio.run(tool(action="type", text="hello"))
+        assert tool._grabber._generation > generation
+    finally:
+        tool.close()
+
+
+class FakeClipboard:
+    contents: bytes | None = b"previous"
+    text_only = True
+
+    def __init__(self, display_num=None):
+        pass
+
+    def available(self):
+        return True
+
+    async def holds_only_text(self):
+        return self.text_only
+
+    async def read(self):
+        return FakeClipboard.contents
+
+    async def write(self, data: bytes):
+        FakeClipboard.contents = data
+
+
+@pytest.mark.parametrize(
+    ("text", "text_only", "pasted"),
+    [
+        ("x" * 10, True, True),
+        # typing presses Return for the newline, pasting would not
+        ("x" * 10 + "\n", True, False),
+        # restoring the clipboard would lose e.g. a copied image
+        ("x" * 10, False, False),
+    ],
+)
+def test_paste_only_plain_text_over_a_text_clipboard(
+    monkeypatch, text, text_only, pasted
+):
+    monkeypatch.setattr(computer_macos, "Clipboard", FakeClipboard)
+    monkeypatch.setattr(FakeClipboard, "contents", b"previous")
+    monkeypatch.setattr(FakeClipboard, "text_only", text_only)
+    backend = FakeBackend()
+    tool = make_tool(backend)
+    tool._paste_min_length = 5
+    tool._paste_restore_delay = 0
+    asyncio.run(tool(action="type", text=text))
+    kinds = [event.kind for event in backend.events]
+    assert (kinds == ["hotkey"]) == pasted
+    assert FakeClipboard.contents == b"previous"
+
+
+@pytest.mark.parametrize("tool_class", [ComputerTool, ComputerTool20250124])
+def test_screenshots_carry_the_text_layer(monkeypatch, tool_class):
+    layer = TextLayer(((Word("Settings", (10, 10, 60, 12)),),))
+
+    def recognize_text(image, size=None):
+        future = Future()
+        future.set_result(layer)
+        return future
+
+    module = sys.modules[tool_class.__module__]
+    monkeypatch.setattr(module, "tesseract_available", lambda: True)
+    monkeypatch.setattr(module, "recognize_text", recognize_text)
+    tool = make_tool(FakeBackend(), tool_class)
+    tool._text_layer = True
+    result = asyncio.run(tool(action="screenshot"))
+    assert result.base64_image
+    assert result.text_layer == layer.render()
+
+
+def test_zoom_is_exposed_only_by_the_zoom_tool_version():
+    group = TOOL_GROUPS_BY_VERSION["computer_use_20251124"]
+    assert group.beta_flag == "computer-use-2025-11-24"
+    tool = make_tool(FakeBackend(1280, 800), ComputerTool20251124)
+    assert tool.to_params()["enable_zoom"] is True
+    # coarse screenshots, with details read through zoom
+    assert tool.options["display_width_px"] == 768
+
+    result = asyncio.run(tool(action="zoom", region=[0, 0, 384, 240]))
+    image = Image.open(io.BytesIO(base64.b64decode(result.base64_image)))
+    assert image.size == (640, 400)
+
+    with pytest.raises(ToolError):
+        asyncio.run(make_tool(FakeBackend())(action="zoom", region=[0, 0, 10, 10]))
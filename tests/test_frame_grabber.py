@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+from PIL import Image
+
+from computer_use_demo.tools.frame_grabber import FrameGrabber
+
+
+def test_grabbed_frames_go_stale_after_input():
+    grabber = FrameGrabber(lambda: Image.new("RGB", (8, 8)), fps=50)
+
+    async def main():
+        first = await grabber.fresh_frame()
+        grabber.mark_stale()
+        assert grabber.latest() is None
+        second = await grabber.fresh_frame(newer_than=first)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first is not None and second is not None
+    assert second.generation == first.generation + 1
+    grabber.close()
+
+
+def test_close_stops_capturing():
+    captures = 0
+
+    def capture():
+        nonlocal captures
+        captures += 1
+        return Image.new("RGB", (8, 8))
+
+    grabber = FrameGrabber(capture, fps=100)
+    assert asyncio.run(grabber.fresh_frame()) is not None
+    grabber.close()
+    time.sleep(0.05)
+    count = captures
+    time.sleep(0.05)
+    assert captures == count
+    assert grabber.latest() is None
+
+
+def test_waiters_wake_on_the_next_capture():
+    grabber = FrameGrabber(lambda: Image.new("RGB", (8, 8)), fps=5)
+
+    async def main():
+        first = await grabber.fresh_frame()
+        start = time.monotonic()
+        second = await grabber.fresh_frame(newer_than=first)
+        return first, second, time.monotonic() - start
+
+    first, second, waited = asyncio.run(main())
+    assert second is not None and second.captured_at > first.captured_at
+    # one capture period, not the timeout
+    assert waited < 0.5
+    grabber.close()
+
+
+def test_capture_errors_are_skipped():
+    captures = 0
+
+    def capture():
+        nonlocal captures
+        captures += 1
+        if captures == 1:
+            raise OSError("display is going away")
+        return Image.new("RGB", (8, 8))
+
+    grabber = FrameGrabber(capture, fps=50)
+    assert asyncio.run(grabber.fresh_frame()) is not None
+    assert captures >= 2
+    grabber.close()
+
+
+def test_close_wakes_waiters():
+    grabber = FrameGrabber(lambda: Image.new("RGB", (8, 8)), fps=0.5)
+
+    async def main():
+        first = await grabber.fresh_frame()
+        waiting = asyncio.create_task(grabber.fresh_frame(newer_than=first))
+        await asyncio.sleep(0.05)
+        grabber.close()
+        return await asyncio.wait_for(waiting, 1)
+
+    assert asyncio.run(main()) is None
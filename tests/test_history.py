@@ -0,0 +1,187 @@
+import base64
+import io
+
+from anthropic.types.beta import BetaUsage
+from PIL import Image
+
+from computer_use_demo.history import CacheAwareEviction, ImageIndex, compact_history
+
+
+def screenshot(width: int = 1280, height: int = 800) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+SCREENSHOT = screenshot()
+
+
+def tool_results(*images_per_result: int) -> dict:
+    """A user message holding one tool_result per entry, with that many images."""
+    return {
+        "role": "user",
+        "content": [
+            {
+                "type": "tool_result",
+                "tool_use_id": f"toolu_{i}",
+                "content": [
+                    {"type": "text", "text": "done"},
+                    *(
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": "image/png",
+                                "data": SCREENSHOT,
+                            },
+                        }
+                        for _ in range(count)
+                    ),
+                ],
+            }
+            for i, count in enumerate(images_per_result)
+        ],
+    }
+
+
+def history(*messages_images: tuple[int, ...]) -> list:
+    messages: list = [{"role": "user", "content": "task"}]
+    for images in messages_images:
+        messages.append(
+            {"role": "assistant", "content": [{"type": "text", "text": "ok"}]}
+        )
+        messages.append(tool_results(*images))
+    return messages
+
+
+def image_counts(messages: list) -> list[int]:
+    return [
+        sum(
+            block["type"] == "image"
+            for result in message["content"]
+            for block in result["content"]
+        )
+        for message in messages[2::2]
+    ]
+
+
+def usage(cache_read: int, cache_write: int, uncached: int = 100) -> BetaUsage:
+    return BetaUsage(
+        input_tokens=uncached,
+        output_tokens=10,
+        cache_read_input_tokens=cache_read,
+        cache_creation_input_tokens=cache_write,
+    )
+
+
+def test_image_index_evicts_oldest_in_place():
+    messages = history((1,), (1, 1), (1,))
+    index = ImageIndex(messages)
+    assert len(index) == 4
+    assert index.evict_oldest(2) == 2
+    assert image_counts(messages) == [0, 1, 1]
+    # text blocks of the tool results stay
+    assert messages[2]["content"][0]["content"] == [{"type": "text", "text": "done"}]
+    index.add(tool_results(1))
+    assert len(index) == 3
+
+
+def test_message_boundary_keeps_messages_whole():
+    index = ImageIndex(history((1,), (1, 1), (1,)))
+    assert index.message_boundary(2) == 1
+    assert index.message_boundary(2, round_up=True) == 3
+    assert index.message_boundary(3) == 3
+    assert index.message_boundary(10) == 4
+
+
+def test_evicts_everything_over_max_images():
+    index = ImageIndex(history(*[(1,)] * 7))
+    eviction = CacheAwareEviction(min_images=2, max_images=6)
+    eviction.observe(usage(cache_read=1_000_000, cache_write=0))
+    assert eviction.images_to_evict(index) == 5
+
+
+def test_keeps_images_while_breaking_a_well_used_cache_costs_more():
+    index = ImageIndex(history(*[(1,)] * 4))
+    eviction = CacheAwareEviction(min_images=2, max_images=6)
+    eviction.observe(usage(cache_read=100_000, cache_write=1_000))
+    assert eviction.images_to_evict(index) == 0
+
+
+def test_evicts_early_when_the_cache_is_rarely_hit():
+    index = ImageIndex(history(*[(1,)] * 4))
+    eviction = CacheAwareEviction(min_images=2, max_images=6)
+    for _ in range(4):
+        eviction.observe(usage(cache_read=0, cache_write=100_000))
+    assert eviction.hit_rate < 0.1
+    assert eviction.images_to_evict(index) == 2
+
+
+def test_does_not_split_a_message_below_max_images():
+    index = ImageIndex(history((1,), (1, 1), (1,)))
+    eviction = CacheAwareEviction(min_images=2, max_images=6)
+    # evicting 2 would split the second message, so only the first one goes
+    assert eviction.images_to_evict(index) == 1
+
+
+def tool_turn(i: int) -> list:
+    return [
+        {
+            "role": "assistant",
+            "content": [
+                {"type": "text", "text": f"Step {i}"},
+                {"type": "tool_use", "id": f"toolu_{i}", "name": "bash", "input": {}},
+            ],
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "tool_result",
+                    "tool_use_id": f"toolu_{i}",
+                    "content": [{"type": "text", "text": f"output {i}"}],
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+        },
+    ]
+
+
+def test_compaction_keeps_recent_turns_and_summarizes_the_rest():
+    messages: list = [{"role": "user", "content": "task"}]
+    for i in range(5):
+        messages.extend(tool_turn(i))
+
+    assert compact_history(messages, keep_turns=2) == 6
+    assert len(messages) == 5
+    first, *tail = messages
+    assert first["content"][0] == {"type": "text", "text": "task"}
+    summary = first["content"][1]["text"]
+    assert "6 earlier messages" in summary
+    assert "Assistant: Step 2" in summary and "Tool result: output 2" in summary
+    assert "Step 3" not in summary
+    # every tool_use in the retained tail is still answered by its tool_result
+    assert tail[0]["role"] == "assistant"
+    for call, result in zip(tail[::2], tail[1::2]):
+        assert call["content"][1]["id"] == result["content"][0]["tool_use_id"]
+
+
+def test_compaction_strips_cache_breakpoints_from_the_summary_message():
+    messages: list = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "task", "cache_control": {"type": "ephemeral"}}
+            ],
+        }
+    ]
+    for i in range(3):
+        messages.extend(tool_turn(i))
+    compact_history(messages, keep_turns=1)
+    assert all("cache_control" not in block for block in messages[0]["content"])
+
+
+def test_compaction_does_nothing_with_few_turns():
+    messages: list = [{"role": "user", "content": "task"}, *tool_turn(0)]
+    assert compact_history(messages, keep_turns=2) == 0
+    assert len(messages) == 3
@@ -0,0 +1,212 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from anthropic import APIError
+from anthropic.types.beta import BetaMessage, BetaTextBlock, BetaToolUseBlock
+
+from computer_use_demo import loop
+from computer_use_demo.ratelimit import RequestScheduler
+from computer_use_demo.tools import ToolCollection
+from computer_use_demo.tools.base import BaseAnthropicTool, ToolResult
+
+REQUEST = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+
+
+class FailingClient:
+    """A client whose every request fails, recording whether it was closed."""
+
+    def __init__(self):
+        self.closed = False
+
+        async def create(**kwargs):
+            raise APIError("failed", REQUEST, body=None)
+
+        self.beta = SimpleNamespace(
+            messages=SimpleNamespace(with_raw_response=SimpleNamespace(create=create))
+        )
+
+    def with_options(self, **options):
+        self.options = options
+        return self
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_backend(monkeypatch):
+    monkeypatch.setenv("COMPUTER_BACKEND", "fake")
+
+
+def run_loop(**kwargs) -> list[Exception | None]:
+    errors: list[Exception | None] = []
+    asyncio.run(
+        loop.sampling_loop(
+            model="model",
+            provider=loop.APIProvider.ANTHROPIC,
+            system_prompt_suffix="",
+            messages=[{"role": "user", "content": "hi"}],
+            output_callback=lambda block: None,
+            tool_output_callback=lambda result, tool_use_id: None,
+            api_response_callback=lambda request, response, error: errors.append(error),
+            api_key="key",
+            scheduler=RequestScheduler(),
+            **kwargs,
+        )
+    )
+    return errors
+
+
+def test_closes_the_client_it_created(monkeypatch):
+    client = FailingClient()
+    monkeypatch.setattr(loop, "make_client", lambda provider, api_key: client)
+    errors = run_loop()
+    assert isinstance(errors[0], APIError)
+    assert client.closed
+
+
+def test_leaves_a_client_passed_in_open():
+    client = FailingClient()
+    run_loop(client=client)
+    assert not client.closed
+
+
+def test_leaves_retries_of_a_client_passed_in_to_the_scheduler():
+    client = FailingClient()
+    run_loop(client=client)
+    assert client.options == {"max_retries": 0}
+
+
+class SlowTool(BaseAnthropicTool):
+    name = "slow"
+
+    def __init__(self):
+        self.finished = False
+
+    async def __call__(self, **kwargs):
+        await asyncio.sleep(0.05)
+        self.finished = True
+        return ToolResult(output="done")
+
+    def to_params(self):
+        return {"name": self.name, "type": "custom"}
+
+
+class FakeMessageStream:
+    """Replays events, then fails with `error` or ends with `message`."""
+
+    def __init__(self, events, message=None, error=None):
+        self.events = events
+        self.message = message
+        self.error = error
+        self.response = httpx.Response(200, request=REQUEST)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    async def __aiter__(self):
+        for event in self.events:
+            await asyncio.sleep(0)
+            yield event
+        if self.error:
+            raise self.error
+
+    async def get_final_message(self):
+        return self.message
+
+
+def stream_client(message_stream: FakeMessageStream):
+    return SimpleNamespace(
+        beta=SimpleNamespace(
+            messages=SimpleNamespace(stream=lambda **kwargs: message_stream)
+        )
+    )
+
+
+def stream_response(message_stream, tool, **callbacks):
+    return asyncio.run(
+        loop._stream_response(
+            stream_client(message_stream),
+            {},
+            ToolCollection(tool),
+            scheduler=RequestScheduler(),
+            priority=loop.Priority.INTERACTIVE,
+            input_tokens=0,
+            output_callback=callbacks.get("output_callback", lambda block: None),
+            text_delta_callback=callbacks.get("text_delta_callback"),
+            tool_output_callback=lambda result, tool_use_id: None,
+            api_response_callback=lambda request, response, error: None,
+            text_layers={},
+        )
+    )
+
+
+TOOL_USE = BetaToolUseBlock(id="toolu_1", name="slow", input={}, type="tool_use")
+
+
+def test_streamed_text_is_output_once_per_block():
+    text = BetaTextBlock(text="Hello world", type="text")
+    message = BetaMessage.model_validate(
+        {
+            "id": "msg_1",
+            "type": "message",
+            "role": "assistant",
+            "model": "model",
+            "content": [text.model_dump(), TOOL_USE.model_dump()],
+            "stop_reason": "tool_use",
+            "usage": {"input_tokens": 1, "output_tokens": 1},
+        }
+    )
+    events = [
+        SimpleNamespace(type="text", text="Hello"),
+        SimpleNamespace(type="text", text=" world"),
+        SimpleNamespace(type="content_block_stop", content_block=text),
+        SimpleNamespace(type="content_block_stop", content_block=TOOL_USE),
+    ]
+    blocks, deltas = [], []
+    response, tool_results = stream_response(
+        FakeMessageStream(events, message=message),
+        SlowTool(),
+        output_callback=blocks.append,
+        text_delta_callback=deltas.append,
+    )
+    assert deltas == ["Hello", " world"]
+    assert [block["type"] for block in blocks] == ["text", "tool_use"]
+    assert blocks[0]["text"] == "Hello world"
+    assert response is message
+    assert tool_results[0]["tool_use_id"] == "toolu_1"
+
+
+def test_started_tool_calls_finish_when_the_stream_fails():
+    tool = SlowTool()
+    events = [SimpleNamespace(type="content_block_stop", content_block=TOOL_USE)]
+    message_stream = FakeMessageStream(
+        events, error=APIError("stream broke", REQUEST, body=None)
+    )
+    with pytest.raises(APIError):
+        stream_response(message_stream, tool)
+    assert tool.finished
+
+
+def test_compaction_must_keep_fewer_turns_than_it_allows():
+    with pytest.raises(ValueError):
+        run_loop(client=FailingClient(), compact_after_turns=10, compact_keep_turns=10)
+
+
+def test_text_layers_are_kept_aside_for_when_the_screenshot_is_evicted():
+    async def collect(text_layers: dict):
+        result = ToolResult(base64_image="aW1hZ2U=", text_layer="OK@1,2,3,4")
+        task = asyncio.ensure_future(asyncio.sleep(0, result))
+        return await loop._collect_tool_results(
+            [({"id": "toolu_1"}, task)], lambda result, tool_use_id: None, text_layers
+        )
+
+    text_layers: dict = {}
+    tool_results = asyncio.run(collect(text_layers))
+    assert [block["type"] for block in tool_results[0]["content"]] == ["image"]
+    assert text_layers == {"toolu_1": {"type": "text", "text": "OK@1,2,3,4"}}
@@ -0,0 +1,91 @@
+import asyncio
+import io
+import json
+import sys
+
+import httpx
+import pytest
+
+import main
+from computer_use_demo.tools import BashTool20250124, ComputerTool20250124
+from computer_use_demo.tools.backends import FakeBackend
+
+REQUEST = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+SCREENSHOT = {
+    "type": "image",
+    "source": {"type": "base64", "media_type": "image/png", "data": "iVBORw0KGgo="},
+}
+
+
+class Client:
+    closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client(monkeypatch) -> Client:
+    client = Client()
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "key")
+    monkeypatch.setattr(main, "make_client", lambda provider, api_key: client)
+    return client
+
+
+async def failing_sampling_loop(*, messages, api_response_callback, **kwargs):
+    messages.append(
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "tool_result",
+                    "tool_use_id": "toolu_1",
+                    "content": [SCREENSHOT],
+                }
+            ],
+        }
+    )
+    api_response_callback(REQUEST, None, RuntimeError("overloaded"))
+    return messages
+
+
+def test_batch_records_api_errors_without_images(monkeypatch, client):
+    monkeypatch.setattr(main, "sampling_loop", failing_sampling_loop)
+    output = io.StringIO()
+    asyncio.run(main.run_batch(["open the settings"], 1, output))
+
+    record = json.loads(output.getvalue())
+    assert record["error"] == "RuntimeError: overloaded"
+    assert "iVBORw0KGgo=" not in output.getvalue()
+    image = record["messages"][1]["content"][0]["content"][0]
+    assert image == {"type": "image", "media_type": "image/png"}
+    assert client.closed
+
+
+async def tool_using_sampling_loop(*, messages, **kwargs):
+    computer = ComputerTool20250124(FakeBackend(640, 480))
+    await computer(action="mouse_move", coordinate=[10, 20])
+    await BashTool20250124()(command="echo hello")
+    return messages
+
+
+def test_batch_stdout_holds_only_json_records(monkeypatch, client, capsys):
+    monkeypatch.setattr(main, "sampling_loop", tool_using_sampling_loop)
+    asyncio.run(main.run_batch(["move the mouse", "say hello"], 1, sys.stdout))
+
+    captured = capsys.readouterr()
+    lines = captured.out.splitlines()
+    assert [json.loads(line)["task"] for line in lines] == [0, 1]
+    assert "### Performing action" in captured.err
+
+
+def test_batch_concurrency_needs_a_screen_per_session(monkeypatch, client):
+    monkeypatch.setattr(main, "sampling_loop", failing_sampling_loop)
+    monkeypatch.delenv("COMPUTER_BACKEND", raising=False)
+    with pytest.raises(ValueError, match="--concurrency 1"):
+        asyncio.run(main.run_batch(["open the settings"], 2, io.StringIO()))
+
+    monkeypatch.setenv("COMPUTER_BACKEND", "fake")
+    output = io.StringIO()
+    asyncio.run(main.run_batch(["open the settings", "close it"], 2, output))
+    assert len(output.getvalue().splitlines()) == 2
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from anthropic import APIStatusError
+
+from computer_use_demo.ratelimit import Priority, RequestScheduler
+
+REQUEST = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+
+
+def status_error(status: int, headers: dict[str, str] | None = None):
+    response = httpx.Response(status, headers=headers, request=REQUEST)
+    return APIStatusError("error", response=response, body=None)
+
+
+async def no_op():
+    pass
+
+
+def test_higher_priority_calls_are_admitted_first():
+    scheduler = RequestScheduler()
+    order: list[str] = []
+
+    async def call(name: str):
+        order.append(name)
+
+    async def main():
+        scheduler._pause(0.05)
+        await asyncio.gather(
+            scheduler.submit(lambda: call("batch"), priority=Priority.BATCH),
+            scheduler.submit(lambda: call("interactive")),
+        )
+
+    asyncio.run(main())
+    assert order == ["interactive", "batch"]
+
+
+def test_queued_calls_are_woken_when_the_pause_ends():
+    scheduler = RequestScheduler()
+
+    async def main():
+        scheduler._pause(0.1)
+        start = time.monotonic()
+        await asyncio.gather(*(scheduler.submit(no_op) for _ in range(5)))
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(main())
+    assert 0.1 <= elapsed < 0.3
+
+
+def test_waits_for_the_request_bucket_to_refill():
+    scheduler = RequestScheduler()
+    scheduler.observe(
+        {
+            "anthropic-ratelimit-requests-limit": "600",
+            "anthropic-ratelimit-requests-remaining": "1",
+        }
+    )
+
+    async def main():
+        start = time.monotonic()
+        await scheduler.submit(no_op)
+        await scheduler.submit(no_op)
+        return time.monotonic() - start
+
+    # 600 requests a minute refill one every 0.1 s
+    assert 0.05 <= asyncio.run(main()) < 0.3
+
+
+def test_retries_rate_limited_calls_after_retry_after():
+    scheduler = RequestScheduler()
+    attempts = 0
+
+    async def call():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise status_error(429, {"retry-after": "0"})
+        return "ok"
+
+    assert asyncio.run(scheduler.submit(call)) == "ok"
+    assert attempts == 2
+
+
+def test_does_not_retry_client_errors():
+    scheduler = RequestScheduler()
+    attempts = 0
+
+    async def call():
+        nonlocal attempts
+        attempts += 1
+        raise status_error(400)
+
+    with pytest.raises(APIStatusError):
+        asyncio.run(scheduler.submit(call))
+    assert attempts == 1
+
+
+def test_cancelled_waiters_leave_the_queue():
+    scheduler = RequestScheduler()
+
+    async def main():
+        scheduler._pause(0.05)
+        first = asyncio.create_task(scheduler.submit(no_op))
+        second = asyncio.create_task(scheduler.submit(no_op))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.wait_for(second, 1)
+
+    asyncio.run(main())
+    assert scheduler._waiters == []
+
+
+def test_shared_by_event_loops_in_different_threads():
+    scheduler = RequestScheduler()
+    scheduler._pause(0.05)
+    done: list[int] = []
+
+    def session(index: int):
+        async def call():
+            done.append(index)
+
+        asyncio.run(scheduler.submit(call))
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=2)
+    assert sorted(done) == [0, 1, 2, 3]
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+from computer_use_demo.tools.screenshot_pipeline import FrameSlots
+
+
+def test_frame_slots_bound_concurrency_across_event_loops():
+    slots = FrameSlots(2)
+    lock = threading.Lock()
+    running = peak = 0
+
+    async def hold():
+        nonlocal running, peak
+        await slots.acquire()
+        try:
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            with lock:
+                running -= 1
+        finally:
+            slots.release()
+
+    def session():
+        async def main():
+            await asyncio.gather(*(hold() for _ in range(3)))
+
+        asyncio.run(main())
+
+    threads = [threading.Thread(target=session) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert peak == 2
+    assert slots._value == 2
+
+
+def test_cancelled_waiters_do_not_keep_a_slot():
+    slots = FrameSlots(1)
+
+    async def main():
+        await slots.acquire()
+        waiter = asyncio.create_task(slots.acquire())
+        await asyncio.sleep(0)
+        # the slot is handed over and the wait cancelled in the same iteration
+        slots.release()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await asyncio.wait_for(slots.acquire(), 1)
+
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("Xlib")
+
+from Xlib import XK
+
+from computer_use_demo.tools import backends
+from computer_use_demo.tools.x11_keymap import X11Keymap, wait_for_pointer
+
+
+class FakeRoot:
+    """A pointer that reaches where it was sent after a few queries."""
+
+    def __init__(self, lag: int = 0):
+        self.lag = lag
+        self.target = (0, 0)
+        self.position = (0, 0)
+
+    def query_pointer(self):
+        if self.lag:
+            self.lag -= 1
+        else:
+            self.position = self.target
+        return SimpleNamespace(root_x=self.position[0], root_y=self.position[1])
+
+
+class FakeDisplay:
+    # keycodes 8-12: a/A, Shift_L, Control_L, Return and one spare
+    display = SimpleNamespace(info=SimpleNamespace(min_keycode=8, max_keycode=12))
+
+    def __init__(self, root: FakeRoot | None = None):
+        self.root = root or FakeRoot()
+        self.mappings: list[tuple[int, list]] = []
+
+    def query_extension(self, name: str):
+        return True
+
+    def get_keyboard_mapping(self, first: int, count: int):
+        names = [("a", "A"), ("Shift_L",), ("Control_L",), ("Return",), ()]
+        return [[XK.string_to_keysym(name) for name in row] or [0, 0] for row in names]
+
+    def change_keyboard_mapping(self, keycode: int, keysyms: list):
+        self.mappings.append((keycode, keysyms))
+
+    def sync(self):
+        pass
+
+    def screen(self):
+        return SimpleNamespace(root=self.root, width_in_pixels=100, height_in_pixels=80)
+
+
+def test_keysym_understands_both_tools_key_names():
+    assert X11Keymap.keysym("ctrl") == XK.string_to_keysym("Control_L")
+    assert X11Keymap.keysym("cmd") == X11Keymap.keysym("command")
+    assert X11Keymap.keysym("pagedown") == XK.string_to_keysym("Next")
+    assert X11Keymap.keysym("f5") == XK.string_to_keysym("F5")
+    assert X11Keymap.keysym("\n") == XK.string_to_keysym("Return")
+    assert X11Keymap.keysym("é") == 0xE9
+    assert X11Keymap.keysym("€") == 0x01000000 | ord("€")
+    with pytest.raises(ValueError, match="Unknown key name"):
+        X11Keymap.keysym("nosuchkey")
+
+
+def test_missing_keysyms_borrow_the_spare_keycode():
+    display = FakeDisplay()
+    keymap = X11Keymap(display)
+    assert keymap.keycode(X11Keymap.keysym("A")) == (8, True)
+    euro = X11Keymap.keysym("€")
+    assert keymap.keycode(euro) == (12, False)
+    keymap.unbind_spare()
+    assert display.mappings == [(12, [(euro, euro)]), (12, [(0, 0)])]
+
+
+def test_wait_for_pointer_waits_until_the_pointer_arrives():
+    root = FakeRoot(lag=3)
+    root.target = (10, 20)
+    assert wait_for_pointer(root, 10, 20)
+    assert root.lag == 0
+    assert not wait_for_pointer(FakeRoot(), 10, 20)
+
+
+def test_x11_backend_moves_synchronously(monkeypatch):
+    root = FakeRoot(lag=3)
+    display = FakeDisplay(root)
+    monkeypatch.setattr("Xlib.display.Display", lambda name: display)
+
+    def fake_input(display, event, detail, x=0, y=0):
+        root.target = (x, y)
+
+    monkeypatch.setattr("Xlib.ext.xtest.fake_input", fake_input)
+    backend = backends.X11Backend(1)
+    backend.move_to(30, 40)
+    assert root.position == (30, 40)